@@ -0,0 +1,531 @@
+"""A columnar sample log (Arrow IPC streams) as an alternative to data.json.
+
+Every reader of data.json parses each line and then flattens the nested values with json_normalize, which gets slow
+and memory hungry for long runs with many processes. The columnar log keeps samples as typed Arrow record batches
+instead, nested values as struct and list columns, so loading maps the file and hands the projected columns to
+pandas without parsing anything. Pick it with OVERRIDE_DATA_FORMAT=arrow (or data_format="arrow" when creating the
+ImpactTracker), it needs pyarrow.
+
+Values keyed by process id or device index (e.g. cpu_time_seconds) would get a struct field per process, so dicts
+whose keys are all numbers are stored as a struct of two lists instead, KEYS_FIELD and VALUES_FIELD, and turned back
+into dicts when loading. Values declared in the sample schema (see data_schema) get the arrow type of their
+declaration rather than an inferred one, with declared mappings always stored that way, so their columns keep one
+type however the samples vary, and are loaded into columns of their declared dtype.
+
+The log is a directory (ARROWPATH) of Arrow IPC stream files. Streams don't need a footer, so the log can be read
+while the monitor is still writing it and a killed monitor only loses what it hadn't written out yet. The schema of
+a stream is fixed, a new stream is started when samples stop fitting it (e.g. a metric that was always missing
+starts being reported as text). Existing data.json logs can be converted with:
+
+    python -m experiment_impact_tracker.columnar_log my_log_dir other_log_dir
+"""
+import argparse
+import glob
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+
+from experiment_impact_tracker.data_schema import (FLOAT64, INT64, STR,
+                                                   VECTOR, fill_field_columns,
+                                                   get_schema)
+from experiment_impact_tracker.data_utils import (ARROWPATH, DATAPATH,
+                                                  BufferedRecordWriter,
+                                                  _read_json_file)
+
+KEYS_FIELD = "__keys__"
+VALUES_FIELD = "__values__"
+PART_PATTERN = "part-{:05d}.arrows"
+
+
+def _is_keyed(value):
+    return all(
+        isinstance(key, int) or (isinstance(key, str) and key.isdigit())
+        for key in value
+    )
+
+
+def encode_value(value):
+    """Turns a logged value into what is stored, see the module documentation."""
+    if isinstance(value, dict):
+        if _is_keyed(value):
+            return {
+                KEYS_FIELD: [str(key) for key in value],
+                VALUES_FIELD: [encode_value(item) for item in value.values()],
+            }
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def encode_declared_value(value, shape):
+    """Turns a logged value declared with this shape into what is stored, mappings as keyed values whatever their
+    keys."""
+    if value is None or not shape:
+        return value
+    if shape[0] == VECTOR:
+        return [encode_declared_value(item, shape[1:]) for item in value]
+    return {
+        KEYS_FIELD: [str(key) for key in value],
+        VALUES_FIELD: [
+            encode_declared_value(item, shape[1:]) for item in value.values()
+        ],
+    }
+
+
+def declared_type(field):
+    """
+    Returns:
+        pyarrow.DataType: how the values of a declared field are stored
+    """
+    import pyarrow as pa
+
+    data_type = {FLOAT64: pa.float64(), INT64: pa.int64(), STR: pa.string()}[
+        field.dtype
+    ]
+    for level in reversed(field.shape):
+        if level == VECTOR:
+            data_type = pa.list_(data_type)
+        else:
+            data_type = pa.struct(
+                [
+                    (KEYS_FIELD, pa.list_(pa.string())),
+                    (VALUES_FIELD, pa.list_(data_type)),
+                ]
+            )
+    return data_type
+
+
+def _array_to_python(array):
+    """Turns an arrow array back into the logged values, like to_pylist but converting a column at a time rather
+    than a value at a time, which is many times faster for nested values. Keyed values become dicts again and fields
+    missing from a sample are left out."""
+    import pyarrow as pa
+
+    data_type = array.type
+    if pa.types.is_struct(data_type):
+        names = [data_type.field(i).name for i in range(data_type.num_fields)]
+        # flatten leaves the fields of missing structs missing too
+        children = [_array_to_python(child) for child in array.flatten()]
+        if set(names) == {KEYS_FIELD, VALUES_FIELD}:
+            keys = children[names.index(KEYS_FIELD)]
+            values = children[names.index(VALUES_FIELD)]
+            rows = [dict(zip(k or [], v or [])) for k, v in zip(keys, values)]
+        else:
+            rows = [
+                {name: value for name, value in zip(names, row) if value is not None}
+                for row in zip(*children)
+            ]
+    elif pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        offsets = array.offsets.to_numpy()
+        # not flatten, which leaves out the values behind missing lists but not their offsets
+        values = _array_to_python(
+            array.values.slice(offsets[0], offsets[-1] - offsets[0])
+        )
+        offsets = (offsets - offsets[0]).tolist()
+        rows = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    elif pa.types.is_null(data_type):
+        return [None] * len(array)
+    elif array.null_count > 0 and not pa.types.is_floating(data_type):
+        # numpy would turn missing integers into nan
+        return array.to_pylist()
+    else:
+        rows = array.to_numpy(zero_copy_only=False).tolist()
+    if array.null_count > 0:
+        for i in np.flatnonzero(array.is_null().to_numpy(zero_copy_only=False)):
+            rows[i] = None
+    return rows
+
+
+def _column_to_python(column):
+    values = []
+    for chunk in column.chunks:
+        values.extend(_array_to_python(chunk))
+    return values
+
+
+def _is_keyed_type(data_type):
+    import pyarrow as pa
+
+    return pa.types.is_struct(data_type) and {
+        data_type.field(i).name for i in range(data_type.num_fields)
+    } == {KEYS_FIELD, VALUES_FIELD}
+
+
+class ArrowLogWriter(BufferedRecordWriter):
+    """Writes samples to a columnar log, a batch of buffered samples at a time, see BufferedRecordWriter.
+
+    Args:
+        log_path (str): the log directory (ARROWPATH of a log directory), created if needed
+    """
+
+    def __init__(self, log_path, **kwargs):
+        import pyarrow as pa
+
+        super(ArrowLogWriter, self).__init__(**kwargs)
+        self._pa = pa
+        self.log_path = log_path
+        os.makedirs(log_path, exist_ok=True)
+        # appending to an existing log starts a new stream after the ones there
+        self.parts = len(_list_parts(log_path))
+        self.schema = None
+        self._declared_types = {}
+        if self.sample_schema is not None:
+            self._declared_types = {
+                name: declared_type(field)
+                for name, field in self.sample_schema.fields.items()
+            }
+        self._file = None
+        self._stream = None
+
+    def _encode(self, data):
+        import ujson as json
+
+        size = len(json.dumps(data)) + 1
+        if self.sample_schema is None:
+            # the size it would take in data.json, for the max_bytes limit
+            return encode_value(data), size
+        encoded = {}
+        for name, value in data.items():
+            field = self.sample_schema.get(name)
+            encoded[name] = (
+                encode_value(value)
+                if field is None
+                else encode_declared_value(value, field.shape)
+            )
+        return encoded, size
+
+    def _batch_to_table(self, batch):
+        pa = self._pa
+        if not self._declared_types:
+            return pa.Table.from_pylist(batch)
+        names = list(OrderedDict((name, None) for sample in batch for name in sample))
+        undeclared = [name for name in names if name not in self._declared_types]
+        inferred = None
+        if undeclared:
+            # only the undeclared values need their types inferred
+            inferred = pa.Table.from_pylist(
+                [
+                    {name: sample[name] for name in undeclared if name in sample}
+                    for sample in batch
+                ]
+            ).schema
+        schema = pa.schema(
+            [
+                pa.field(name, self._declared_types[name])
+                if name in self._declared_types
+                else inferred.field(name)
+                for name in names
+            ]
+        )
+        return pa.Table.from_pylist(batch, schema=schema)
+
+    def _start_part(self, schema):
+        self._close()
+        path = os.path.join(self.log_path, PART_PATTERN.format(self.parts))
+        self.parts += 1
+        self._file = open(path, "wb")
+        self._stream = self._pa.ipc.new_stream(self._file, schema)
+        self.schema = schema
+
+    def _write_batch(self, batch):
+        pa = self._pa
+        try:
+            table = self._batch_to_table(batch)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            if len(batch) == 1:
+                raise
+            # a value changed type within the batch, the halves go to different streams
+            self._write_batch(batch[: len(batch) // 2])
+            self._write_batch(batch[len(batch) // 2 :])
+            return
+        if self.schema is None:
+            self._start_part(table.schema)
+        elif not table.schema.equals(self.schema):
+            try:
+                schema = pa.unify_schemas(
+                    [self.schema, table.schema], promote_options="permissive"
+                )
+            except (pa.ArrowInvalid, pa.ArrowTypeError, NotImplementedError):
+                schema = table.schema
+            if not schema.equals(self.schema):
+                self._start_part(schema)
+            # only columns the batch didn't have or had as nulls or narrower types, converting adds nothing new
+            table = pa.Table.from_pylist(batch, schema=self.schema)
+        self._stream.write_table(table)
+
+    def _sync(self, fsync):
+        if self._file is None:
+            return
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    def _close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._file.close()
+            self._stream = None
+            self._file = None
+
+
+def _list_parts(log_path):
+    return sorted(
+        glob.glob(os.path.join(log_path, PART_PATTERN.replace("{:05d}", "*")))
+    )
+
+
+def get_part_paths(log_dir):
+    """
+    Returns:
+        [str]: the streams of the columnar log of a log directory in the order they were written, empty if there is
+            no columnar log
+    """
+    return _list_parts(os.path.join(log_dir, ARROWPATH))
+
+
+def has_log(log_dir):
+    return len(get_part_paths(log_dir)) > 0
+
+
+def remove_log(log_dir):
+    shutil.rmtree(os.path.join(log_dir, ARROWPATH), ignore_errors=True)
+
+
+def _read_part(path, columns=None):
+    """
+    Yields:
+        pyarrow.Schema, then pyarrow.RecordBatch: the (projected) schema of the stream, then its batches
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_stream(source)
+        except pa.ArrowInvalid:
+            # nothing was written out yet
+            return
+        names = reader.schema.names
+        if columns is not None:
+            names = [name for name in columns if name in names]
+        yield pa.schema([reader.schema.field(name) for name in names])
+        try:
+            for batch in reader:
+                # the columns point into the mapped file, nothing is copied
+                yield batch.select(names)
+        except pa.ArrowInvalid:
+            # the monitor was killed while writing, keep what was written out completely
+            pass
+
+
+def _read_table(path, columns=None):
+    import pyarrow as pa
+
+    part = _read_part(path, columns)
+    schema = next(part, None)
+    if schema is None:
+        return None
+    return pa.Table.from_batches(list(part), schema=schema)
+
+
+def read_tables(log_dir, columns=None):
+    """Reads the columnar log of a log directory.
+
+    Args:
+        log_dir (str): the log directory
+        columns ([str], optional): only read these (top level) columns. Defaults to all of them.
+
+    Returns:
+        [pyarrow.Table]: the samples of each stream, in order
+    """
+    tables = []
+    for path in get_part_paths(log_dir):
+        table = _read_table(path, columns)
+        if table is not None and table.num_rows > 0:
+            tables.append(table)
+    return tables
+
+
+def _flatten_column(name, column, max_level, level, frame_columns, values=None):
+    import pyarrow as pa
+
+    field = get_schema().get(name) if level == 0 else None
+    if field is not None:
+        if not field.shape and column.type == declared_type(field):
+            frame_columns[name] = column.to_pandas()
+        else:
+            # also values logged before they were declared or without coercing them
+            fill_field_columns(
+                frame_columns,
+                field,
+                _column_to_python(column) if values is None else values,
+                max_level,
+            )
+    elif (
+        pa.types.is_struct(column.type)
+        and not _is_keyed_type(column.type)
+        and (max_level is None or level < max_level)
+    ):
+        # the children of missing structs are missing too
+        for i, child in enumerate(column.flatten()):
+            _flatten_column(
+                "{}.{}".format(name, column.type.field(i).name),
+                child,
+                max_level,
+                level + 1,
+                frame_columns,
+            )
+    elif pa.types.is_nested(column.type):
+        frame_columns[name] = _column_to_python(column) if values is None else values
+    else:
+        frame_columns[name] = column.to_pandas()
+
+
+def table_to_frame(table, max_level=None, values=None):
+    """Flattens struct columns into "parent.child" columns, like json_normalize. Declared values are flattened like
+    data_schema.build_frame does, undeclared keyed values and lists are kept as one column of dicts and lists.
+
+    Args:
+        table (pyarrow.Table): samples read from the log
+        max_level (int, optional): how many levels of structs to flatten. Defaults to all of them.
+        values (dict, optional): the columns already turned into python values, to reuse for nested columns
+
+    Returns:
+        pandas.DataFrame: the samples
+    """
+    import pandas as pd
+
+    values = values or {}
+    frame_columns = OrderedDict()
+    for name, column in zip(table.column_names, table.columns):
+        _flatten_column(name, column, max_level, 0, frame_columns, values.get(name))
+    return pd.DataFrame(frame_columns, index=pd.RangeIndex(table.num_rows))
+
+
+def table_to_samples(table, values=None):
+    """
+    Args:
+        table (pyarrow.Table): samples read from the log
+        values (dict, optional): the columns already turned into python values
+
+    Returns:
+        [dict]: the samples as they were logged, values that were None left out
+    """
+    values = values or {}
+    names = table.column_names
+    columns = [
+        values[name] if name in values else _column_to_python(table.column(name))
+        for name in names
+    ]
+    return [
+        {name: value for name, value in zip(names, row) if value is not None}
+        for row in zip(*columns)
+    ]
+
+
+def load_data_into_frame(log_dir, max_level=None, columns=None):
+    """Loads the samples of the columnar log of a log directory, see data_utils.load_data_into_frame."""
+    import pandas as pd
+
+    tables = read_tables(log_dir, columns)
+    if not tables:
+        return pd.DataFrame(), []
+    frames = []
+    samples = []
+    for table in tables:
+        values = {
+            name: _column_to_python(column)
+            for name, column in zip(table.column_names, table.columns)
+        }
+        frames.append(table_to_frame(table, max_level, values))
+        samples.extend(table_to_samples(table, values))
+    return pd.concat(frames, ignore_index=True), samples
+
+
+def iter_samples(log_dir, columns=None):
+    """Yields the samples of the columnar log of a log directory one at a time, see data_utils.iter_samples."""
+    import pyarrow as pa
+
+    for path in get_part_paths(log_dir):
+        part = _read_part(path, columns)
+        schema = next(part, None)
+        for batch in part:
+            yield from table_to_samples(pa.Table.from_batches([batch], schema=schema))
+
+
+def iter_data_frames(log_dir, chunk_size, columns=None, max_level=None):
+    """Loads the samples of the columnar log of a log directory a chunk at a time, see data_utils.iter_data_frames."""
+    import pandas as pd
+    import pyarrow as pa
+
+    frames = []
+    rows = 0
+    for path in get_part_paths(log_dir):
+        part = _read_part(path, columns)
+        schema = next(part, None)
+        if schema is None:
+            continue
+        batches = []
+        for batch in part:
+            batches.append(batch)
+            rows += batch.num_rows
+            while rows >= chunk_size:
+                table = pa.Table.from_batches(batches, schema=schema)
+                rest = rows - chunk_size
+                frames.append(
+                    table_to_frame(table.slice(0, table.num_rows - rest), max_level)
+                )
+                yield pd.concat(frames, ignore_index=True)
+                frames = []
+                rows = rest
+                batches = table.slice(table.num_rows - rest).to_batches()
+        if any(batch.num_rows for batch in batches):
+            # the next stream's samples can have other columns, finish the chunk with their own frame
+            frames.append(
+                table_to_frame(pa.Table.from_batches(batches, schema=schema), max_level)
+            )
+    if frames:
+        yield pd.concat(frames, ignore_index=True)
+
+
+def convert_log(log_dir, **kwargs):
+    """Converts the data.json of a log directory into a columnar log next to it, replacing any columnar log there.
+
+    Args:
+        log_dir (str): the log directory
+        kwargs: passed on to ArrowLogWriter, samples are coerced to data_schema.get_schema() unless another
+            sample_schema is given
+
+    Returns:
+        int: how many samples were converted
+    """
+    samples = _read_json_file(os.path.join(log_dir, DATAPATH))
+    remove_log(log_dir)
+    kwargs.setdefault("max_records", 10000)
+    kwargs.setdefault("max_bytes", 64 * 1024 * 1024)
+    kwargs.setdefault("max_interval", float("inf"))
+    kwargs.setdefault("sample_schema", get_schema())
+    with ArrowLogWriter(os.path.join(log_dir, ARROWPATH), **kwargs) as writer:
+        for sample in samples:
+            writer.write(sample)
+    return len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Converts the data.json of log directories into columnar logs."
+    )
+    parser.add_argument("log_dirs", nargs="+", help="log directories to convert")
+    args = parser.parse_args()
+
+    for log_dir in args.log_dirs:
+        count = convert_log(log_dir)
+        print(
+            "Converted {} samples to {}".format(count, os.path.join(log_dir, ARROWPATH))
+        )
+
+
+if __name__ == "__main__":
+    main()
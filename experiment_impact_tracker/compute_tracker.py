@@ -1,12 +1,17 @@
 import atexit
+import hashlib
 import logging
 import multiprocessing
 import os
 import pickle
-import subprocess
+import re
+import signal
 import sys
 import time
 import traceback
+import types
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from queue import Empty as EmptyQueueException
@@ -14,34 +19,77 @@ from subprocess import PIPE, Popen
 from sys import platform
 
 import numpy as np
-import pandas as pd
 import psutil
 import ujson as json
-from pandas.io.json import json_normalize
 
-from experiment_impact_tracker.cpu import rapl
+from experiment_impact_tracker import columnar_log
+from experiment_impact_tracker.cpu import powercap, rapl
 from experiment_impact_tracker.cpu.common import get_my_cpu_info
 from experiment_impact_tracker.cpu.intel import get_intel_power, get_rapl_power
 from experiment_impact_tracker.data_info_and_router import (DATA_HEADERS,
-                                                            INITIAL_INFO)
+                                                            INITIAL_INFO,
+                                                            SAMPLE_FIELDS)
+from experiment_impact_tracker.data_schema import SampleSchema
 from experiment_impact_tracker.data_utils import *
 from experiment_impact_tracker.emissions.common import \
     is_capable_realtime_carbon_intensity
 from experiment_impact_tracker.emissions.get_region_metrics import \
     get_current_region_info_cached
-from experiment_impact_tracker.gpu.nvidia import (get_gpu_info,
-                                                  get_nvidia_gpu_power)
+from experiment_impact_tracker.emissions.region_resolver import resolve_region
+from experiment_impact_tracker.gpu.nvidia import (PmonMonitor, get_gpu_info,
+                                                  get_nvidia_gpu_power,
+                                                  is_nvidia_compatible)
+from experiment_impact_tracker.gpu.nvml import is_nvml_compatible
+from experiment_impact_tracker.latest_sample import LatestSampleChannel
+from experiment_impact_tracker.operating_system import host_cache
+from experiment_impact_tracker.operating_system.cgroup import (
+    is_cgroup_v2_compatible, read_cgroup_pids)
+from experiment_impact_tracker.operating_system.process_tree import \
+    ProcessTree
 from experiment_impact_tracker.utils import (get_timestamp, processify,
                                              safe_file_path,
                                              write_json_data_to_file)
 
 SLEEP_TIME = 1
 STOP_MESSAGE = "Stop"
+MAX_COLLECTOR_THREADS = 8
+MAX_STARTUP_THREADS = 8
+# How long (in seconds) to wait for the monitor to write out buffered samples once it was told to terminate
+TERMINATE_TIMEOUT = 10
+# How long (in seconds) later trackers on the same host can reuse which metrics were compatible before checking again
+CAPABILITY_CACHE_TTL = float(os.getenv("OVERRIDE_CAPABILITY_CACHE_TTL", 24 * 60 * 60))
+# Compatibility checks whose result depends on the region, they are cached per region
+REGION_DEPENDENT_CHECKS = [is_capable_realtime_carbon_intensity]
+
+_timer = getattr(time, "monotonic", time.time)
 
 
 logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
 
 
+def _read_last_line(path, block_size=4096):
+    """Reads the last line of a file by reading backwards from its end.
+
+    :param path: file to read
+    :param block_size: how many bytes to read at once
+    :return: the last line (without the newline) or an empty bytes object if the file is empty
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            tail = f.read(read_size) + tail
+            # the final newline ends the last line, look for the one before it
+            newline = tail.rfind(b"\n", 0, len(tail.rstrip(b"\n")))
+            if newline >= 0:
+                return tail[newline + 1 :].rstrip(b"\n")
+        return tail.rstrip(b"\n")
+
+
 def read_latest_stats(log_dir):
     """
     Reads the latest last line of the jsonl file
@@ -57,8 +105,8 @@ def read_latest_stats(log_dir):
     while retry < 3:
         try:
             try:
-                last_line = subprocess.check_output(["tail", "-1", log_path])
-            except:
+                last_line = _read_last_line(log_path)
+            except OSError:
                 return None
 
             if last_line:
@@ -73,69 +121,343 @@ def read_latest_stats(log_dir):
     return None
 
 
-def _sample_and_log_power(log_dir, initial_info, logger=None):
+def _group_headers_by_routing(headers):
+    """Groups headers by their routing function.
+
+    Some functions return multiple values in one call (for example one RAPL reading could get multiple things), so
+    each function only needs to be called once per sample no matter how many headers route to it.
+
+    :param headers: the headers to group
+    :return: an ordered mapping of routing function to the names of the headers it fills in
+    """
+    collectors = OrderedDict()
+    for header in headers:
+        collectors.setdefault(header["routing"]["function"], []).append(header["name"])
+    return collectors
+
+
+def _get_compatibility_functions(*header_lists):
+    """
+    :param header_lists: lists of headers (e.g., INITIAL_INFO, DATA_HEADERS)
+    :return: every distinct compatibility function the headers use, in order
+    """
+    functions = OrderedDict()
+    for headers in header_lists:
+        for header in headers:
+            for compatability_fn in header["compatability"]:
+                functions[compatability_fn] = True
+    return list(functions.keys())
+
+
+def _code_fingerprint(code):
+    """Hashes what a code object does, which unlike its line number doesn't change when the lines around it move."""
+    digest = hashlib.sha1(code.co_code)
+    digest.update(repr((code.co_names, code.co_varnames)).encode("utf-8"))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            # e.g., comprehensions
+            digest.update(_code_fingerprint(const).encode("utf-8"))
+        else:
+            digest.update(repr(const).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def _get_capability_cache_name(compatability_fn, region=None):
+    name = "capability-{}.{}".format(
+        compatability_fn.__module__,
+        getattr(compatability_fn, "__qualname__", compatability_fn.__name__),
+    )
+    if compatability_fn.__name__ == "<lambda>":
+        # lambdas all have the same name
+        name += "-{}".format(_code_fingerprint(compatability_fn.__code__))
+    if region is not None and compatability_fn in REGION_DEPENDENT_CHECKS:
+        region_key = json.dumps(region, sort_keys=True, default=str)
+        name += "-" + hashlib.sha1(region_key.encode("utf-8")).hexdigest()[:12]
+    # e.g., nested functions are called outer.<locals>.inner
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def _check_capability(compatability_fn, region=None, refresh=False):
+    start = _timer()
+    compatible = host_cache.get_cached(
+        _get_capability_cache_name(compatability_fn, region),
+        lambda: bool(compatability_fn(region=region)),
+        max_age=CAPABILITY_CACHE_TTL,
+        refresh=refresh,
+    )
+    return compatible, _timer() - start
+
+
+def get_capabilities(
+    compatability_functions, region=None, refresh=False, executor=None, timings=None
+):
+    """
+    Runs compatibility checks, all at once since some of them spawn processes (e.g., nvidia-smi).
+
+    The results are cached per host for CAPABILITY_CACHE_TTL seconds (see host_cache), so later trackers on the same
+    host don't have to check again.
+
+    :param compatability_functions: the checks to run
+    :param region: The region we're in, required for some checks
+    :param refresh: If True, ignore cached results and check again
+    :param executor: An optional thread pool to run the checks in, by default one is created for this call
+    :param timings: An optional dict to record how long each check took (in seconds) in
+    :return: a dict of compatibility function to whether this system is compatible
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=MAX_STARTUP_THREADS)
+    try:
+        futures = OrderedDict(
+            (
+                compatability_fn,
+                executor.submit(
+                    _check_capability, compatability_fn, region, refresh=refresh
+                ),
+            )
+            for compatability_fn in compatability_functions
+        )
+        capabilities = OrderedDict()
+        for compatability_fn, future in futures.items():
+            capabilities[compatability_fn], duration = future.result()
+            if timings is not None:
+                timings[_get_capability_cache_name(compatability_fn)] = duration
+        return capabilities
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+class SamplingPlan(object):
+    """The set of collectors to call on every sample.
+
+    Checking which headers are compatible with this machine spawns processes (e.g., nvidia-smi) and probes
+    hardware interfaces, and the answer doesn't change during an experiment. So the plan is compiled once when the
+    monitor launches and every sample just calls the collectors. If reprobe_interval is set, the compatibility
+    checks are re-run once that many seconds have passed since the last probe.
+    """
+
+    def __init__(self, region=None, headers=None, reprobe_interval=None, refresh=False):
+        self.region = region
+        self.headers = headers
+        self.reprobe_interval = reprobe_interval
+        self.collectors = OrderedDict()
+        self.capabilities = OrderedDict()
+        self.compatible_headers = []
+        self.last_probe = None
+        self.probe(refresh=refresh)
+
+    def is_capable(self, compatability_fn):
+        """
+        :param compatability_fn: a compatibility check
+        :return: the result of the check from the last probe, or from the host cache if the headers don't use it
+        """
+        if compatability_fn in self.capabilities:
+            return self.capabilities[compatability_fn]
+        return _check_capability(compatability_fn, self.region)[0]
+
+    def probe(self, refresh=False):
+        """
+        Runs the compatibility checks and rebuilds the collectors from the compatible headers.
+
+        :param refresh: If True, ignore cached compatibility results and check again
+        :return: the compatible headers
+        """
+        headers = DATA_HEADERS if self.headers is None else self.headers
+        self.capabilities = get_capabilities(
+            _get_compatibility_functions(headers), region=self.region, refresh=refresh
+        )
+        self.compatible_headers = [
+            header
+            for header in headers
+            if all(self.capabilities[fn] for fn in header["compatability"])
+        ]
+        self.collectors = _group_headers_by_routing(self.compatible_headers)
+        self.last_probe = _timer()
+        return self.compatible_headers
+
+    def maybe_reprobe(self):
+        """
+        Re-runs the compatibility checks if the reprobe interval has passed.
+
+        :return: True if the plan was re-probed
+        """
+        if self.reprobe_interval is None:
+            return False
+        if _timer() - self.last_probe < self.reprobe_interval:
+            return False
+        self.probe(refresh=True)
+        return True
+
+
+def _run_collector(function, process_ids, **kwargs):
+    """
+    Calls a single routing function and times it.
+
+    :param function: the routing function to call
+    :param process_ids: the process ids to pass to the routing function
+    :param kwargs: any keyword arguments to pass to the routing function
+    :return: the results of the routing function and how long it took in seconds
+    """
+    start = _timer()
+    results = function(process_ids, **kwargs)
+    return results, _timer() - start
+
+
+def _sample_and_log_power(
+    log_dir,
+    initial_info,
+    logger=None,
+    executor=None,
+    sampling_plan=None,
+    process_tree=None,
+    cgroup_path=None,
+    latest_sample=None,
+    writer=None,
+):
     """
     Iterates over compatible metrics and logs the relevant information.
 
     :param log_dir: The log directory to use
     :param initial_info: Any initial information that was gathered
     :param logger: A logger to use
+    :param executor: An optional thread pool used to run the collectors concurrently, so that they all cover the
+        same wall-clock window and a sample takes as long as the slowest collector rather than the sum of all of them.
+        If None, the collectors are run one after another.
+    :param sampling_plan: The precompiled SamplingPlan of collectors to call. If None, one is compiled for this
+        sample only.
+    :param process_tree: The ProcessTree of the experiment, kept across samples. If None, the tree is built from
+        scratch for this sample only.
+    :param cgroup_path: If set, the experiment is this whole cgroup (v2) and usage is attributed to the cgroup rather
+        than to the process tree of the parent process.
+    :param latest_sample: An optional LatestSampleChannel to also publish the sample to
+    :param writer: The BufferedRecordWriter of the sample log, kept open across samples. If None, data.json is opened
+        for this sample only.
     :return: collected data
     """
-    current_process = psutil.Process(os.getppid())
-    process_ids = [current_process.pid] + [
-        child.pid for child in current_process.children(recursive=True)
-    ]
-    process_ids = list(
-        set(process_ids)
-    )  # dedupe so that we don't double count by accident
-
-    required_headers = _get_compatible_data_headers(get_current_region_info_cached()[0])
+    if cgroup_path is not None:
+        # the kernel keeps track of the members for us, no need to walk the process tree
+        processes = None
+        process_ids = read_cgroup_pids(cgroup_path)
+    else:
+        if process_tree is None:
+            process_tree = ProcessTree(os.getppid())
+        # the tree is keyed by pid so we don't double count by accident
+        processes = process_tree.refresh()
+        process_ids = process_tree.pids
+
+    if sampling_plan is None:
+        sampling_plan = SamplingPlan(region=get_current_region_info_cached()[0])
+    else:
+        sampling_plan.maybe_reprobe()
+    collectors = sampling_plan.collectors
+    collector_kwargs = dict(
+        logger=logger,
+        region=initial_info["region"]["id"],
+        log_dir=log_dir,
+        processes=processes,
+        cgroup_path=cgroup_path,
+    )
+
+    if executor is not None:
+        futures = OrderedDict(
+            (
+                function,
+                executor.submit(
+                    _run_collector, function, process_ids, **collector_kwargs
+                ),
+            )
+            for function in collectors
+        )
+        collected = [(function, futures[function].result()) for function in futures]
+    else:
+        collected = [
+            (function, _run_collector(function, process_ids, **collector_kwargs))
+            for function in collectors
+        ]
 
     header_information = {}
+    sampling_durations = {}
 
     # for all required headers make sure that we hit the corresponding function which gets that info
     # some functions return multiple values in one call (for example one RAPL reading could get multiple things)
     # so in that case we fill in information on multiple headers at once even though they have the same routing
     # information.
-    for header in required_headers:
-        if header["name"] in header_information.keys():
-            # we already got that info from a multi-return function call
-            continue
-
-        start = time.time()
-
-        results = header["routing"]["function"](
-            process_ids,
-            logger=logger,
-            region=initial_info["region"]["id"],
-            log_dir=log_dir,
-        )
-
-        end = time.time()
+    for function, (results, duration) in collected:
+        header_names = collectors[function]
         logger.info(
-            "Datapoint {} took {} seconds".format(header["name"], (end - start))
+            "Datapoint(s) {} took {} seconds".format(", ".join(header_names), duration)
         )
+        sampling_durations[header_names[0]] = duration
 
         if isinstance(results, dict):
             # if we return a dict of results, could account for multiple headers
             for header_name, item in results.items():
                 header_information[header_name] = item
         else:
-            header_information[header["name"]] = results
+            header_information[header_names[0]] = results
     header_information["process_ids"] = process_ids
+    header_information["sampling_durations"] = sampling_durations
     # once we have gotten all the required info through routing calls for all headers, we log it
-    log_path = safe_file_path(os.path.join(log_dir, DATAPATH))
     try:
-        write_json_data_to_file(log_path, header_information)
+        if writer is not None:
+            writer.write(header_information)
+        else:
+            write_json_data_to_file(
+                safe_file_path(os.path.join(log_dir, DATAPATH)), header_information
+            )
     except:
         logger.error(header_information)
         raise
+    if latest_sample is not None:
+        latest_sample.publish(header_information)
     return header_information
 
 
+# checks _start_background_readers needs besides the ones of DATA_HEADERS
+BACKGROUND_READER_CHECKS = [is_nvml_compatible]
+
+
+def _start_background_readers(sampling_plan):
+    """Starts the readers that run alongside the monitor for the whole experiment rather than once per sample.
+
+    :param sampling_plan: the SamplingPlan of the monitor, whose (cached) capabilities decide which readers to start
+    """
+    if rapl._is_rapl_compatible():
+        # read the energy counters at a high rate so no wraparound is missed and samples get exact energy deltas
+        rapl.RAPLMonitor.start_integrator()
+    elif powercap.is_powercap_compatible():
+        # run one power gadget for the whole experiment instead of one per sample
+        powercap.PowerGadgetMonitor.start_stream()
+
+    has_nvml = sampling_plan.is_capable(is_nvml_compatible)
+    if not has_nvml and sampling_plan.is_capable(is_nvidia_compatible):
+        # same for nvidia-smi pmon, unless we can ask NVML directly
+        PmonMonitor.start_stream()
+
+
+def _exit_on_sigterm(signum, frame):
+    # unwind the monitor loop so buffered samples are written out
+    sys.exit(0)
+
+
+def _stop_background_readers():
+    rapl.RAPLMonitor.stop_integrator()
+    powercap.PowerGadgetMonitor.stop_stream()
+    PmonMonitor.stop_stream()
+
+
 @processify
-def launch_power_monitor(queue, log_dir, initial_info, logger=None):
+def launch_power_monitor(
+    queue,
+    log_dir,
+    initial_info,
+    logger=None,
+    reprobe_interval=None,
+    cgroup_path=None,
+    latest_sample=None,
+    data_format=None,
+):
     """
     Launches a separate process which monitors metrics
 
@@ -143,49 +465,83 @@ def launch_power_monitor(queue, log_dir, initial_info, logger=None):
     :param log_dir: The log directory to use
     :param initial_info: Any initial information that was gathered before the thread was launched.
     :param logger: A logger to use
+    :param reprobe_interval: If set, how often (in seconds) to re-check which metrics are compatible with the system
+    :param cgroup_path: If set, attribute usage to this whole cgroup (v2) rather than the parent's process tree
+    :param latest_sample: An optional LatestSampleChannel to publish every sample to
+    :param data_format: How to log samples, FORMAT_JSON (data.json) or FORMAT_ARROW (see columnar_log). Defaults to
+        DATA_FORMAT.
     :return:
     """
     logger.info("Starting process to monitor power")
-    while True:
-        try:
-            message = queue.get(block=False)
-            if isinstance(message, str):
-                if message == STOP_MESSAGE:
-                    return
-            else:
-                queue.put(message)
-        except EmptyQueueException:
-            pass
+    # being terminated (e.g. by the tracker exiting) shouldn't lose the samples that are still buffered
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    # figure out what we can measure on this system once rather than on every sample
+    sampling_plan = SamplingPlan(
+        region=initial_info["region"], reprobe_interval=reprobe_interval
+    )
+    _start_background_readers(sampling_plan)
+    # keep the process objects around between samples rather than rediscovering the whole tree every time
+    process_tree = ProcessTree(os.getppid()) if cgroup_path is None else None
+    # collectors are independent of each other so run them side by side over the same window
+    executor = ThreadPoolExecutor(max_workers=MAX_COLLECTOR_THREADS)
+    # keep the log open and write samples out in batches rather than reopening it for every sample
+    # coerced to their declared dtypes (e.g. "n/a" becomes a missing value) so loading needn't infer anything
+    writer = get_data_writer(
+        log_dir,
+        data_format,
+        sample_schema=SampleSchema.from_headers(DATA_HEADERS, SAMPLE_FIELDS),
+    )
+    try:
+        while True:
+            try:
+                message = queue.get(block=False)
+                if isinstance(message, str):
+                    if message == STOP_MESSAGE:
+                        return
+                else:
+                    queue.put(message)
+            except EmptyQueueException:
+                pass
 
-        try:
-            _sample_and_log_power(log_dir, initial_info, logger=logger)
-        except:
-            ex_type, ex_value, tb = sys.exc_info()
-            logger.error("Encountered exception within power monitor thread!")
-            logger.error("".join(traceback.format_tb(tb)))
-            raise
-        time.sleep(SLEEP_TIME)
+            try:
+                _sample_and_log_power(
+                    log_dir,
+                    initial_info,
+                    logger=logger,
+                    executor=executor,
+                    sampling_plan=sampling_plan,
+                    process_tree=process_tree,
+                    cgroup_path=cgroup_path,
+                    latest_sample=latest_sample,
+                    writer=writer,
+                )
+            except Exception:
+                ex_type, ex_value, tb = sys.exc_info()
+                logger.error("Encountered exception within power monitor thread!")
+                logger.error("".join(traceback.format_tb(tb)))
+                raise
+            time.sleep(SLEEP_TIME)
+    finally:
+        writer.close()
+        executor.shutdown(wait=False)
+        _stop_background_readers()
 
 
-def _get_compatible_data_headers(region=None):
+def _get_compatible_data_headers(region=None, headers=None, refresh=False):
     """
     Given all the data headers check for each one if it is compatible with the current system.
 
+    Many headers share the same compatibility functions (and some of those spawn subprocesses), so each function is
+    only evaluated once per call, all of them concurrently, and results are cached per host (see SamplingPlan.probe).
+
     :param region: The region we're in, required for some checks
+    :param headers: The headers to check, defaults to all DATA_HEADERS
+    :param refresh: If True, ignore cached compatibility results and check again
     :return: which headers are compatible
     """
-    compatible_headers = []
-
-    for header in DATA_HEADERS:
-        compat = True
-        for compatability_fn in header["compatability"]:
-            if not compatability_fn(region=region):
-                compat = False
-                break
-        if compat:
-            compatible_headers.append(header)
-
-    return compatible_headers
+    return SamplingPlan(
+        region=region, headers=headers, refresh=refresh
+    ).compatible_headers
 
 
 def _validate_compatabilities(compatabilities, *args, **kwargs):
@@ -203,26 +559,70 @@ def _validate_compatabilities(compatabilities, *args, **kwargs):
     return True
 
 
-def gather_initial_info(log_dir: str):
+def _run_timed(function):
+    start = _timer()
+    results = function()
+    return results, _timer() - start
+
+
+def gather_initial_info(log_dir: str, timings=None, region=None):
     """Log one time info
 
     For example, CPU/GPU info, version of this package, region, datetime for start of experiment,
     CO2 estimate data.
 
+    Compatibility checks and then the info itself are gathered concurrently, since most of it is waiting on
+    subprocesses, the network or the disk.
+
     :param log_dir: the log directory to write to
+    :param timings: An optional dict to record how long each compatibility check and piece of info took (in seconds)
+    :param region: An optional zone id or (latitude, longitude) to use as the region rather than looking it up
     :return: gathered information
     """
 
     info_path = safe_file_path(os.path.join(log_dir, INFOPATH))
 
     data = {}
+    if region is not None:
+        resolution = resolve_region(region)
+        data["region"] = resolution["region"]
+        data["region_carbon_intensity_estimate"] = resolution["zone_info"]
+        data["region_resolution_source"] = resolution["source"]
+
+    with ThreadPoolExecutor(max_workers=MAX_STARTUP_THREADS) as executor:
+        # check what the monitor will need too, so that's cached by the time it launches
+        capabilities = get_capabilities(
+            [
+                compatability_fn
+                for compatability_fn in _get_compatibility_functions(
+                    INITIAL_INFO, DATA_HEADERS
+                )
+                + BACKGROUND_READER_CHECKS
+                if compatability_fn not in REGION_DEPENDENT_CHECKS
+            ],
+            executor=executor,
+            timings=timings,
+        )
 
-    # Gather all the one-time info specified by the appropriate router
-    for info_ in INITIAL_INFO:
-        key = info_["name"]
-        compatabilities = info_["compatability"]
-        if _validate_compatabilities(compatabilities):
-            data[key] = info_["routing"]["function"]()
+        # Gather all the one-time info specified by the appropriate router
+        futures = OrderedDict(
+            (info_["name"], executor.submit(_run_timed, info_["routing"]["function"]))
+            for info_ in INITIAL_INFO
+            if info_["name"] not in data
+            and all(capabilities[fn] for fn in info_["compatability"])
+        )
+        for key, future in futures.items():
+            data[key], duration = future.result()
+            if timings is not None:
+                timings[key] = duration
+
+        # the monitor checks these with the region we found
+        get_capabilities(
+            REGION_DEPENDENT_CHECKS,
+            region=data.get("region"),
+            executor=executor,
+            timings=timings,
+        )
 
     with open(info_path, "wb") as info_file:
         pickle.dump(data, info_file)
@@ -232,6 +632,7 @@ def gather_initial_info(log_dir: str):
     data_path = safe_file_path(os.path.join(log_dir, DATAPATH))
     if os.path.exists(data_path):
         os.remove(data_path)
+    columnar_log.remove_log(log_dir)
 
     Path(data_path).touch()
 
@@ -239,13 +640,49 @@ def gather_initial_info(log_dir: str):
 
 
 class ImpactTracker(object):
-    def __init__(self, logdir):
+    def __init__(self, logdir, cgroup_path=None, region=None, data_format=None):
+        """
+        :param logdir: the log directory to write to
+        :param cgroup_path: If the experiment runs in its own cgroup (v2), e.g. in a container or a batch job, the path
+            to that cgroup (see get_current_cgroup_path). Usage is then attributed to everything in the cgroup, read
+            from the cgroup's counters, rather than to the process tree of this process.
+        :param region: The zone id (e.g. "US-CA") or (latitude, longitude) the experiment runs in. By default it is
+            taken from OVERRIDE_REGION or looked up from the IP of this host, see region_resolver.
+        :param data_format: How to log samples, "json" (data.json) or "arrow" (a columnar log that loads faster, needs
+            pyarrow, see columnar_log). Defaults to OVERRIDE_DATA_FORMAT or "json".
+        """
+        if cgroup_path is not None and not is_cgroup_v2_compatible(
+            cgroup_path=cgroup_path
+        ):
+            raise ValueError(
+                "{} isn't a cgroup v2 directory with cpu.stat and memory.current, see "
+                "get_current_cgroup_path for the cgroup of this process.".format(
+                    cgroup_path
+                )
+            )
         self.logdir = logdir
+        self.cgroup_path = cgroup_path
+        self.data_format = check_data_format(data_format)
         self._setup_logging()
         self.logger.info("Gathering system info for reproducibility...")
-        self.initial_info = gather_initial_info(logdir)
-        self.logger.info("Done initial setup and information gathering...")
+        # how long each compatibility check and piece of initial info took, in seconds
+        self.startup_timings = OrderedDict()
+        start = _timer()
+        self.initial_info = gather_initial_info(
+            logdir, timings=self.startup_timings, region=region
+        )
+        self.startup_timings["total"] = _timer() - start
+        self.logger.info(
+            "Done initial setup and information gathering in {:.3f} seconds ({})".format(
+                self.startup_timings["total"],
+                ", ".join(
+                    "{}: {:.3f}".format(name, duration)
+                    for name, duration in self.startup_timings.items()
+                ),
+            )
+        )
         self.launched = False
+        self.latest_sample = None
 
     def _setup_logging(self):
         """
@@ -291,12 +728,21 @@ class ImpactTracker(object):
             # the defaults for multiprocessing changed in python 3.8.
             # OS X multiprocessing starts processes with spawn instead of fork
             multiprocessing.set_start_method("fork")
+            # the monitor publishes every sample here so reading the latest one doesn't need data.json
+            self.latest_sample = LatestSampleChannel()
             self.p, self.queue = launch_power_monitor(
-                self.logdir, self.initial_info, self.logger
+                self.logdir,
+                self.initial_info,
+                self.logger,
+                cgroup_path=self.cgroup_path,
+                latest_sample=self.latest_sample,
+                data_format=self.data_format,
             )
 
             def _terminate_monitor_and_log_final_info(p):
                 p.terminate()
+                # the monitor writes out the samples it buffered before exiting
+                p.join(TERMINATE_TIMEOUT)
                 log_final_info(self.logdir)
 
             atexit.register(_terminate_monitor_and_log_final_info, self.p)
@@ -330,6 +776,11 @@ class ImpactTracker(object):
             # Nothing in the message queue
             pass
 
+        if self.latest_sample is not None:
+            latest = self.latest_sample.read()
+            if latest is not None:
+                return latest
+        # nothing published yet or the sample was too large for the channel
         return read_latest_stats(self.logdir)
 
     def __enter__(self):
@@ -388,6 +839,8 @@ class ImpactTracker(object):
         self.queue.put(STOP_MESSAGE)
         time.sleep(1)
         self.p.terminate()
+        # the monitor writes out the samples it buffered before exiting
+        self.p.join(TERMINATE_TIMEOUT)
         self.logger.info("Starting - Logging final info.")
         log_final_info(self.logdir)
         self.logger.info("Done - Logging final info.")
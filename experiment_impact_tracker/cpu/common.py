@@ -3,16 +3,20 @@ from sys import platform
 import cpuinfo
 import psutil
 
+from experiment_impact_tracker.operating_system import host_cache
+
 from .exceptions import CPUAttributeAssertionError
 
 
 def get_my_cpu_info():
     """Gather current cpu hardware info for this machine.
 
+    The cpuinfo part is static so it's cached per host, see host_cache.
+
     Returns:
         dict : info about cpu
     """
-    most_info = cpuinfo.get_cpu_info()
+    most_info = dict(host_cache.get_cached("cpu_info", cpuinfo.get_cpu_info))
     if platform != "darwin":
         most_info["usable_cpus"] = len(psutil.Process().cpu_affinity())
     return most_info
@@ -4,12 +4,11 @@ import time
 
 import cpuinfo
 import numpy as np
-import pandas as pd
 import psutil
-import requests
-from bs4 import BeautifulSoup
 
 from experiment_impact_tracker.cpu.common import get_my_cpu_info
+from experiment_impact_tracker.memory.common import ProcessMemoryTracker
+from experiment_impact_tracker.operating_system import cgroup, procfs
 from experiment_impact_tracker.utils import *
 
 from . import powercap, rapl
@@ -17,7 +16,7 @@ from . import powercap, rapl
 
 def get_and_cache_cpu_max_tdp_from_intel():
     """Goes to Intel's website and pulls information about TDP."""
-    cpu_brand = cpuinfo.get_cpu_info()["brand"].split(" ")[2]
+    cpu_brand = get_my_cpu_info()["brand"].split(" ")[2]
     if os.path.exists(
         os.path.join(
             os.path.dirname(os.path.abspath(__file__)),
@@ -32,6 +31,11 @@ def get_and_cache_cpu_max_tdp_from_intel():
             "r",
         ) as f:
             return int(f.readline())
+
+    # only needed when the TDP isn't cached yet, and slow to import
+    import requests
+    from bs4 import BeautifulSoup
+
     s = requests.Session()
     user_agent = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/34.0.1847.131 Safari/537.36"
     s.headers["User-Agent"] = user_agent
@@ -64,6 +68,138 @@ def get_and_cache_cpu_max_tdp_from_intel():
 
 _timer = getattr(time, "monotonic", time.time)
 
+# Only the very first sample of a monitor needs an artificial wait, afterwards the previous tick is the baseline
+FIRST_SAMPLE_WAIT_SECONDS = 2.0
+
+
+class ProcessCPUTracker(object):
+    """Keeps the cpu times seen on the previous call around so that every call measures the cpu used since the
+    last one. This lets the monitor attribute power without sleeping between two snapshots on every tick and
+    without leaving gaps between ticks that are never measured.
+
+    On Linux all processes are read from procfs in one pass into arrays, elsewhere psutil is used.
+    """
+
+    def __init__(self, use_procfs=None):
+        if use_procfs is None:
+            use_procfs = procfs.is_procfs_compatible()
+        self.use_procfs = use_procfs
+        self.last_timestamp = None
+        self.last_wall_time = None
+        self.last_system_cpu_time = None
+        # sorted so that baselines can be looked up with a binary search
+        self.last_pids = np.zeros(0, dtype=np.int64)
+        self.last_process_cpu_times = np.zeros(0)
+
+    @property
+    def primed(self):
+        return self.last_timestamp is not None
+
+    def _read_psutil(self, process_list):
+        system_wide = psutil.cpu_times()
+        pids = []
+        cpu_times = []
+        rss = []
+        for p in process_list:
+            try:
+                with p.oneshot():
+                    pt = p.cpu_times()
+                    memory = p.memory_info()
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+            pids.append(p.pid)
+            cpu_times.append(
+                [getattr(pt, field, 0.0) for field in procfs.CPU_TIME_FIELDS]
+            )
+            rss.append(memory.rss)
+        return (
+            system_wide.user + system_wide.system,
+            np.array(pids, dtype=np.int64),
+            np.array(cpu_times, dtype=np.float64).reshape(
+                len(pids), len(procfs.CPU_TIME_FIELDS)
+            ),
+            np.array(rss, dtype=np.float64),
+        )
+
+    def _read_procfs(self, process_list):
+        system_cpu_time = procfs.read_system_cpu_time()
+        pids, cpu_times, rss = procfs.read_process_stats([p.pid for p in process_list])
+        return system_cpu_time, pids, cpu_times, rss
+
+    def sample(self, process_list, logger=None):
+        """Reads the current cpu times for the system and every process and diffs them against the last call.
+
+        Args:
+            process_list ([psutil.Process]): processes to attribute cpu usage to.
+            logger (optional): Logger to use when logging information. Defaults to None.
+
+        Returns:
+            dict: delta_time (seconds since the last call), delta_system (system wide cpu-seconds in that window),
+                pids (the processes that have a baseline), deltas (their cpu-seconds in that window), cpu_times
+                (their latest cpu times, one column per procfs.CPU_TIME_FIELDS entry) and rss (their resident
+                memory in bytes). Returns None on the first call since there is nothing to diff against yet.
+        """
+        timestamp = _timer()
+        wall_time = time.time()
+        if self.use_procfs:
+            system_cpu_time, pids, cpu_times, rss = self._read_procfs(process_list)
+        else:
+            system_cpu_time, pids, cpu_times, rss = self._read_psutil(process_list)
+        process_cpu_times = cpu_times[:, 0] + cpu_times[:, 1]
+
+        previous = np.full(len(pids), np.nan)
+        if len(self.last_pids) > 0:
+            index = np.minimum(
+                np.searchsorted(self.last_pids, pids), len(self.last_pids) - 1
+            )
+            known = self.last_pids[index] == pids
+            previous[known] = self.last_process_cpu_times[index[known]]
+
+        if self.last_wall_time is not None:
+            processes_by_pid = {p.pid: p for p in process_list}
+            for i in np.flatnonzero(np.isnan(previous)):
+                try:
+                    created = processes_by_pid[pids[i]].create_time()
+                except psutil.NoSuchProcess:
+                    continue
+                if created >= self.last_wall_time:
+                    # the process was spawned after the last tick so all of its cpu time falls in this window
+                    previous[i] = 0.0
+                elif logger is not None:
+                    # we have no baseline for this process, it will be accounted for starting next tick
+                    logger.info(
+                        "No cpu baseline for process with pid {}, skipping it for this sample.".format(
+                            pids[i]
+                        )
+                    )
+
+        result = None
+        if self.primed:
+            has_baseline = ~np.isnan(previous)
+            result = {
+                "delta_time": timestamp - self.last_timestamp,
+                "delta_system": system_cpu_time - self.last_system_cpu_time,
+                "pids": pids[has_baseline],
+                "deltas": process_cpu_times[has_baseline] - previous[has_baseline],
+                "cpu_times": cpu_times[has_baseline],
+                "rss": rss[has_baseline],
+            }
+
+        order = np.argsort(pids)
+        self.last_timestamp = timestamp
+        self.last_wall_time = wall_time
+        self.last_system_cpu_time = system_cpu_time
+        # exited processes drop out of the baseline here
+        self.last_pids = pids[order]
+        self.last_process_cpu_times = process_cpu_times[order]
+        return result
+
+
+_cpu_tracker = ProcessCPUTracker()
+_memory_tracker = ProcessMemoryTracker()
+_cgroup_cpu_trackers = {}
+_last_rapl_sample = None
+
 
 def is_intel_compatible(*args, **kwargs):
     return powercap.is_powercap_compatible() or rapl._is_rapl_compatible()
@@ -75,6 +211,8 @@ def get_intel_power(pid_list, logger=None, **kwargs):
     Args:
         pid_list ([int]): List of process IDs to attribute power to.
         logger (optional): Logger to use when logging information. Defaults to None.
+        processes ([psutil.Process], optional): Process objects for pid_list to reuse across calls.
+        cgroup_path (str, optional): If set, attribute power to this whole cgroup rather than to pid_list.
 
     Raises:
         NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
@@ -84,7 +222,9 @@ def get_intel_power(pid_list, logger=None, **kwargs):
     Returns:
         dict: Information about CPU
     """
-    if rapl._is_rapl_compatible():
+    if kwargs.get("cgroup_path") is not None:
+        return get_cgroup_intel_power(pid_list, logger, **kwargs)
+    elif rapl._is_rapl_compatible():
         return get_rapl_power(pid_list, logger, **kwargs)
     elif powercap.is_powercap_compatible():
         return get_powercap_power(pid_list, logger, **kwargs)
@@ -92,37 +232,13 @@ def get_intel_power(pid_list, logger=None, **kwargs):
         raise ValueError("Not compatible with any power interface")
 
 
-def get_powercap_power(pid_list, logger=None, **kwargs):
-    """Gathers CPU information from RAPL.
-
-    Args:
-        pid_list ([int]): List of process IDs to attribute power to.
-        logger (optional): Logger to use when logging information. Defaults to None.
-
-    Raises:
-        NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
-        ValueError: If no memory is used by the processes. This seems highly unlikely if not impossible and is probably a bug.
-        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
-
-    Returns:
-        dict: Information about CPU
-    """
-    # start an initial sample to maximize time between samples without artificial waits
-    powercap_interface = powercap.PowerGadget()
-    powercap_interface.start()
-
-    cpu_percent = 0
-    absolute_cpu_percent = 0
-    cpu_times = 0
-
-    infos1 = []
-    infos2 = []
-
-    process_list = []
-    mem_info_per_process = {}
-    cpu_times_per_process = {}
+def _get_process_list(pid_list, logger=None, processes=None):
+    if processes is not None:
+        # reuse the long-lived process objects from the monitor's process tree
+        return list(processes)
 
     # gather processes as process objects
+    process_list = []
     for process in pid_list:
         try:
             p = psutil.Process(process)
@@ -130,125 +246,126 @@ def get_powercap_power(pid_list, logger=None, **kwargs):
         except psutil.NoSuchProcess:
             if logger is not None:
                 logger.warn(
-                    "Process with pid {} used to be part of this process chain, but was shut down. Skipping."
+                    "Process with pid {} used to be part of this process chain, but was shut down. Skipping.".format(
+                        process
+                    )
                 )
             continue
+    return process_list
 
-    # Get initial times and cpu info
-    zombies = []
-    for i, p in enumerate(process_list):
-        # Modifying code https://github.com/giampaolo/psutil/blob/c10df5aa04e1ced58d19501fa42f08c1b909b83d/psutil/__init__.py#L1102-L1107
-        # We want relative percentage of CPU used so we ignore the multiplier by number of CPUs, we want a number from 0-1.0 to give
-        # power credits accordingly
-        st11 = _timer()
-        # units in terms of cpu-time, so we need the cpu in the last time period that are for the process only
-        system_wide_pt1 = psutil.cpu_times()
-        st12 = _timer()
-        try:
-            pt1 = p.cpu_times()
-            infos1.append((st11, st12, system_wide_pt1, pt1))
-        except (psutil.NoSuchProcess, psutil.ZombieProcess):
-            infos1.append(None) # Maintain the length equal to process_list to avoid index mismatch during power sampling.
-            zombies.append(i)
-
-    time.sleep(2.0)
 
-    # for p in process_list:
-    for i, p in enumerate(process_list):
-        st21 = _timer()
-        try:
-            pt2 = p.cpu_times()
-            st22 = _timer()
-            system_wide_pt2 = psutil.cpu_times()
-            infos2.append((st21, st22, system_wide_pt2, pt2))
-        except (psutil.NoSuchProcess, psutil.ZombieProcess):
-            infos2.append(None) # Maintain the length equal to process_list to avoid index mismatch during power sampling.
-            zombies.append(i)
-
-    # now is a good time to get the power samples that we got the process times for
-    powercap_results = powercap_interface.join()
-    total_intel_power = powercap_results.get("Processor Power_0(Watt)", 0)
-    total_dram_power = powercap_results.get("DRAM Power_0(Watt)", 0)
-    total_cpu_power = powercap_results.get("IA Power_0(Watt)", 0)
-    total_gpu_power = powercap_results.get("GT Power_0(Watt)", 0)
+def _get_cpu_attribution(cpu_sample):
+    """Turns the deltas from a ProcessCPUTracker sample into cpu utilization numbers.
 
-    if total_gpu_power != 0:
-        raise ValueError("Don't support credit assignment to Intel RAPL GPU yet.")
+    Args:
+        cpu_sample (dict): the result of ProcessCPUTracker.sample
 
-    for i, p in enumerate(process_list):
-        # Ignore calculations for the zombie processes. They are denoted as None in the infos lists.
-        if i in zombies:
-            continue
-        st1, st12, system_wide_pt1, pt1 = infos1[i]
-        st2, st22, system_wide_pt2, pt2 = infos2[i]
-
-        # change in cpu-hours process
-        delta_proc = (pt2.user - pt1.user) + (pt2.system - pt1.system)
-        cpu_util_process = delta_proc / float(st2 - st1)
-        # change in cpu-hours system
-        delta_proc2 = (system_wide_pt2.user - system_wide_pt1.user) + (
-            system_wide_pt2.system - system_wide_pt1.system
-        )
-        cpu_util_system = delta_proc2 / float(st22 - st12)
+    Returns:
+        (float, float, dict): relative cpu percent, absolute cpu percent and the latest cpu times per process
+    """
+    deltas = cpu_sample["deltas"]
+    delta_time = cpu_sample["delta_time"]
+    delta_system = cpu_sample["delta_system"]
+
+    # Modifying code https://github.com/giampaolo/psutil/blob/c10df5aa04e1ced58d19501fa42f08c1b909b83d/psutil/__init__.py#L1102-L1107
+    # We want relative percentage of CPU used so we ignore the multiplier by number of CPUs, we want a number from 0-1.0 to give
+    # power credits accordingly
+    # percent of cpu-hours in time frame attributable to this process (e.g., attributable compute)
+    # both deltas cover the same window so the durations cancel out
+    cpu_percent = float(deltas.sum() / delta_system) if delta_system > 0 else 0.0
+
+    # cpu-seconds / seconds = cpu util
+    # NOTE: WE DO NOT MULTIPLY BY THE NUMBER OF CORES LIKE HTOP, WE WANT 100% to be the max
+    # since we want a percentage of the total packages.
+    # TODO: I'm not sure if this will get that in all configurations of hardware.
+    absolute_cpu_percent = float(deltas.sum() / delta_time)
+
+    # only care about cpu_times for latest number
+    cpu_times_per_process = {
+        int(pid): dict(zip(procfs.CPU_TIME_FIELDS, times.tolist()))
+        for pid, times in zip(cpu_sample["pids"], cpu_sample["cpu_times"])
+    }
 
-        # percent of cpu-hours in time frame attributable to this process (e.g., attributable compute)
-        attributable_compute = cpu_util_process / cpu_util_system
+    return cpu_percent, absolute_cpu_percent, cpu_times_per_process
 
-        delta_time = st2 - st1
 
-        # cpu-seconds / seconds = cpu util
-        # NOTE: WE DO NOT MULTIPLY BY THE NUMBER OF CORES LIKE HTOP, WE WANT 100% to be the max
-        # since we want a percentage of the total packages.
-        # TODO: I'm not sure if this will get that in all configurations of hardware.
-        absolute_cpu_percent += delta_proc / float(delta_time)
+def _get_memory_attribution(process_list, cpu_sample):
+    """Gathers the memory used by the processes and what share of the used system memory that is.
 
-        cpu_percent += attributable_compute
+    Args:
+        process_list ([psutil.Process]): processes to attribute memory to.
+        cpu_sample (dict): the result of ProcessCPUTracker.sample, only processes in it are considered and the rss
+            read along with the cpu times is reused.
 
-        # only care about cpu_times for latest number
-        cpu_times += (pt2.user) + (pt2.system)
-        cpu_times_per_process[pid_list[i]] = pt2._asdict()
-        try:
-            try:
-                mem_info = p.memory_full_info()
-            except psutil.AccessDenied:
-                mem_info = p.memory_info()
-            mem_info_per_process[pid_list[i]] = mem_info._asdict()
-        except (psutil.ZombieProcess, psutil.NoSuchProcess):
-            pass
+    Returns:
+        dict: relative_mem_usage, absolute_mem_usage, absolute_mem_percent_usage and mem_info_per_process
+    """
+    rss = dict(zip(cpu_sample["pids"].tolist(), cpu_sample["rss"].tolist()))
+    mem_info_per_process = _memory_tracker.sample(
+        [p for p in process_list if p.pid in rss], rss=rss
+    )
 
     total_physical_memory = psutil.virtual_memory()
     # what percentage of used memory can be attributed to this process
-    # pss (Linux): aka “Proportional Set Size”, is the amount of memory shared with other processes, accounted in a
-    # way  that the amount is divided evenly between the processes that share it. I.e. if a process has 10 MBs all to
-    # itself and 10 MBs shared with another process its PSS will be 15 MBs.
-    # summing these two gets us a nice fair metric for the actual memory used in the RAM hardware. The unique bits
-    # are directly attributable to the process
+    # pss (Linux): aka “Proportional Set Size”, is the amount of memory shared with other processes, accounted in a way
+    # that the amount is divided evenly between the processes that share it. I.e. if a process has 10 MBs all to itself
+    # and 10 MBs shared with another process its PSS will be 15 MBs.
+    # summing these two gets us a nice fair metric for the actual memory used in the RAM hardware.
+    # The unique bits are directly attributable to the process
     # and the shared bits we give credit based on how many processes share those bits
-    pss_avail = all(["pss" in x.keys() for x in mem_info_per_process.values()])
-
-    if pss_avail:
-        system_wide_mem_percent = np.sum(
-            [
-                float(x["pss"])
-                / float(total_physical_memory.total - total_physical_memory.available)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    else:
-        # Sometimes we don't have access to PSS so just need to make due with Rss
-        system_wide_mem_percent = np.sum(
-            [
-                float(x["rss"])
-                / float(total_physical_memory.total - total_physical_memory.available)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    power_credit_cpu = cpu_percent
-    power_credit_mem = system_wide_mem_percent
-    if power_credit_cpu == 0:
+    pss_avail = all(["pss" in x for x in mem_info_per_process.values()])
+    # Sometimes we don't have access to PSS so just need to make due with rss
+    mem_key = "pss" if pss_avail else "rss"
+    memory = np.array(
+        [x[mem_key] for x in mem_info_per_process.values()], dtype=np.float64
+    )
+
+    used_memory = float(total_physical_memory.total - total_physical_memory.available)
+    abs_mem_usage = memory.sum()
+    system_wide_mem_percent = abs_mem_usage / used_memory
+    abs_mem_percent_usage = abs_mem_usage / float(total_physical_memory.total)
+
+    return {
+        "relative_mem_usage": system_wide_mem_percent,
+        "absolute_mem_usage": abs_mem_usage,
+        "absolute_mem_percent_usage": abs_mem_percent_usage,
+        "mem_info_per_process": mem_info_per_process,
+    }
+
+
+def _split_intel_power(
+    total_intel_power,
+    total_dram_power,
+    total_cpu_power,
+    total_gpu_power,
+    power_credit_cpu,
+    power_credit_mem,
+    logger=None,
+):
+    """Splits the package power readings between our processes and the rest of the system.
+
+    Args:
+        total_intel_power (float): power of all packages in Watts.
+        total_dram_power (float): power of the DRAM domains in Watts.
+        total_cpu_power (float): power of the core domains in Watts.
+        total_gpu_power (float): power of the integrated GPU domains in Watts.
+        power_credit_cpu (float): the share of the system's cpu usage that is ours.
+        power_credit_mem (float): the share of the system's used memory that is ours.
+        logger (optional): Logger to use when logging information. Defaults to None.
+
+    Raises:
+        ValueError: If no memory is used by the processes. This seems highly unlikely if not impossible and is probably a bug.
+        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
+
+    Returns:
+        float: the power attributable to us in Watts
+    """
+    if total_gpu_power != 0:
+        raise ValueError("Don't support credit assignment to Intel RAPL GPU yet.")
+
+    if power_credit_cpu == 0 and logger is not None:
         logger.warn(
-            "Problem retrieving CPU usage percentage to assign power credit, not using any CPU. This is possibly "
-            "true, but seems unlikely! See if there's a problem! "
+            "Problem retrieving CPU usage percentage to assign power credit, not using any CPU. This is possibly true, but seems unlikely! See if there's a problem!"
         )
     if power_credit_mem == 0:
         raise ValueError(
@@ -271,25 +388,6 @@ def get_powercap_power(pid_list, logger=None, **kwargs):
             "It seems that power estimates from Intel RAPL are coming back 0, this indicates a problem."
         )
 
-    if pss_avail:
-        abs_mem_usage = np.sum([float(x["pss"]) for x in mem_info_per_process.values()])
-
-        abs_mem_percent_usage = np.sum(
-            [
-                float(x["pss"]) / float(total_physical_memory.total)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    else:
-        abs_mem_usage = np.sum([float(x["rss"]) for x in mem_info_per_process.values()])
-
-        abs_mem_percent_usage = np.sum(
-            [
-                float(x["rss"]) / float(total_physical_memory.total)
-                for x in mem_info_per_process.values()
-            ]
-        )
-
     if total_intel_power < total_attributable_power:
         raise ValueError(
             "For some reason the total intel estimated power is less than the attributable power. This "
@@ -298,97 +396,82 @@ def get_powercap_power(pid_list, logger=None, **kwargs):
             "warning."
         )
 
+    return total_attributable_power
+
+
+def _attribute_intel_power(
+    total_intel_power,
+    total_dram_power,
+    total_cpu_power,
+    total_gpu_power,
+    cpu_sample,
+    process_list,
+    logger=None,
+):
+    """Attributes the package power readings to our processes based on their cpu and memory usage.
+
+    Args:
+        total_intel_power (float): power of all packages in Watts.
+        total_dram_power (float): power of the DRAM domains in Watts.
+        total_cpu_power (float): power of the core domains in Watts.
+        total_gpu_power (float): power of the integrated GPU domains in Watts.
+        cpu_sample (dict): the result of ProcessCPUTracker.sample over the same window as the power readings.
+        process_list ([psutil.Process]): processes to attribute power to.
+        logger (optional): Logger to use when logging information. Defaults to None.
+
+    Returns:
+        dict: Information about CPU
+    """
+    cpu_percent, absolute_cpu_percent, cpu_times_per_process = _get_cpu_attribution(
+        cpu_sample
+    )
+    # Ignore memory of the zombie processes, they didn't get a cpu reading either
+    memory_info = _get_memory_attribution(process_list, cpu_sample)
+
+    total_attributable_power = _split_intel_power(
+        total_intel_power,
+        total_dram_power,
+        total_cpu_power,
+        total_gpu_power,
+        cpu_percent,
+        memory_info["relative_mem_usage"],
+        logger=logger,
+    )
+
     data_return_values_with_headers = {
         "rapl_power_draw_absolute": total_intel_power,
         "rapl_estimated_attributable_power_draw": total_attributable_power,
         "cpu_time_seconds": cpu_times_per_process,
         "average_relative_cpu_utilization": cpu_percent,
         "absolute_cpu_utilization": absolute_cpu_percent,
-        "relative_mem_usage": system_wide_mem_percent,
-        "absolute_mem_usage": abs_mem_usage,
-        "absolute_mem_percent_usage": abs_mem_percent_usage,
-        "mem_info_per_process": mem_info_per_process,
     }
+    data_return_values_with_headers.update(memory_info)
 
     return data_return_values_with_headers
 
 
-def get_rapl_power(pid_list, logger=None, **kwargs):
-    """Gathers CPU information from RAPL.
+def _get_powercap_power_totals(powercap_results):
+    """Pulls the package, DRAM, core and integrated GPU power out of power gadget results."""
+    return (
+        powercap_results.get("Processor Power_0(Watt)", 0),
+        powercap_results.get("DRAM Power_0(Watt)", 0),
+        powercap_results.get("IA Power_0(Watt)", 0),
+        powercap_results.get("GT Power_0(Watt)", 0),
+    )
+
+
+def _get_rapl_power_totals(diff):
+    """Sums up the average power of the RAPL domains over the window of a RAPLDifference.
 
     Args:
-        pid_list ([int]): List of process IDs to attribute power to.
-        logger (optional): Logger to use when logging information. Defaults to None.
+        diff (rapl.RAPLDifference): the difference between two RAPL samples
 
     Raises:
         NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
-        ValueError: If no memory is used by the processes. This seems highly unlikely if not impossible and is probably a bug.
-        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
 
     Returns:
-        dict: Information about CPU
+        (float, float, float, float): package, DRAM, core and integrated GPU power in Watts
     """
-    # start an initial sample to maximize time between samples without artificial waits
-    s1 = rapl.RAPLMonitor.sample()
-
-    cpu_percent = 0
-    absolute_cpu_percent = 0
-    cpu_times = 0
-
-    infos1 = []
-    infos2 = []
-
-    process_list = []
-    mem_info_per_process = {}
-    cpu_times_per_process = {}
-
-    # gather processes as process objects
-    for process in pid_list:
-        try:
-            p = psutil.Process(process)
-            process_list.append(p)
-        except psutil.NoSuchProcess:
-            if logger is not None:
-                logger.warn(
-                    "Process with pid {} used to be part of this process chain, but was shut down. Skipping."
-                )
-            continue
-
-    # Get initial times and cpu info
-    zombies = []
-    for i, p in enumerate(process_list):
-        # Modifying code https://github.com/giampaolo/psutil/blob/c10df5aa04e1ced58d19501fa42f08c1b909b83d/psutil/__init__.py#L1102-L1107
-        # We want relative percentage of CPU used so we ignore the multiplier by number of CPUs, we want a number from 0-1.0 to give
-        # power credits accordingly
-
-        st11 = _timer()
-        # units in terms of cpu-time, so we need the cpu in the last time period that are for the process only
-        system_wide_pt1 = psutil.cpu_times()
-        st12 = _timer()
-        try:
-            pt1 = p.cpu_times()
-            infos1.append((st11, st12, system_wide_pt1, pt1))
-        except (psutil.NoSuchProcess, psutil.ZombieProcess):
-            infos1.append(None) # Maintain the length equal to process_list to avoid index mismatch during power sampling.
-            zombies.append(i)
-
-    time.sleep(2.0)
-
-    # Added enumerater "i" to keep track of zombie processes.
-    for i, p in enumerate(process_list):
-        st21 = _timer()
-        try:
-            pt2 = p.cpu_times()
-            st22 = _timer()
-            system_wide_pt2 = psutil.cpu_times()
-            infos2.append((st21, st22, system_wide_pt2, pt2))
-        except (psutil.NoSuchProcess, psutil.ZombieProcess):
-            infos2.append(None) # Maintain the length equal to process_list to avoid index mismatch during power sampling.
-            zombies.append(i)
-    
-    # now is a good time to get the power samples that we got the process times for
-    s2 = rapl.RAPLMonitor.sample()
-    diff = s2 - s1
     total_intel_power = 0
     total_dram_power = 0
     total_cpu_power = 0
@@ -433,141 +516,181 @@ def get_rapl_power(pid_list, logger=None, **kwargs):
             # other domains get don't have relevant readouts to give power attribution, therefore
             # will get assigned the same amount of credit as the CPU
 
-    if total_gpu_power != 0:
-        raise ValueError("Don't support credit assignment to Intel RAPL GPU yet.")
+    return total_intel_power, total_dram_power, total_cpu_power, total_gpu_power
 
-    for i, p in enumerate(process_list): 
-        # Ignore calculations for the zombie processes. They are denoted as None in the infos lists.
-        if i in zombies:
-            continue
 
-        st1, st12, system_wide_pt1, pt1 = infos1[i]
-        st2, st22, system_wide_pt2, pt2 = infos2[i]
+def get_powercap_power(pid_list, logger=None, **kwargs):
+    """Gathers CPU information from RAPL.
 
-        # change in cpu-hours process
-        delta_proc = (pt2.user - pt1.user) + (pt2.system - pt1.system)
-        cpu_util_process = delta_proc / float(st2 - st1)
-        # change in cpu-hours system
-        delta_proc2 = (system_wide_pt2.user - system_wide_pt1.user) + (
-            system_wide_pt2.system - system_wide_pt1.system
-        )
-        cpu_util_system = delta_proc2 / float(st22 - st12)
+    Args:
+        pid_list ([int]): List of process IDs to attribute power to.
+        logger (optional): Logger to use when logging information. Defaults to None.
+        processes ([psutil.Process], optional): Process objects for pid_list to reuse across calls.
 
-        # percent of cpu-hours in time frame attributable to this process (e.g., attributable compute)
-        attributable_compute = cpu_util_process / cpu_util_system
+    Raises:
+        NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
+        ValueError: If no memory is used by the processes. This seems highly unlikely if not impossible and is probably a bug.
+        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
 
-        delta_time = st2 - st1
+    Returns:
+        dict: Information about CPU
+    """
+    process_list = _get_process_list(
+        pid_list, logger, processes=kwargs.get("processes")
+    )
 
-        # cpu-seconds / seconds = cpu util
-        # NOTE: WE DO NOT MULTIPLY BY THE NUMBER OF CORES LIKE HTOP, WE WANT 100% to be the max
-        # since we want a percentage of the total packages.
-        # TODO: I'm not sure if this will get that in all configurations of hardware.
-        absolute_cpu_percent += delta_proc / float(delta_time)
+    if not _cpu_tracker.primed:
+        _cpu_tracker.sample(process_list, logger)
 
-        cpu_percent += attributable_compute
+    # when streaming, power gadget readings cover the time since the last tick just like the cpu times. Otherwise
+    # power gadget samples over its own window.
+    powercap_results = powercap.PowerGadgetMonitor.sample()
 
-        # only care about cpu_times for latest number
-        cpu_times += (pt2.user) + (pt2.system)
-        cpu_times_per_process[pid_list[i]] = pt2._asdict()
-        try:
-            try:
-                mem_info = p.memory_full_info()
-            except psutil.AccessDenied:
-                mem_info = p.memory_info()
-            mem_info_per_process[pid_list[i]] = mem_info._asdict()
-        except (psutil.ZombieProcess, psutil.NoSuchProcess):
-            pass
+    cpu_sample = _cpu_tracker.sample(process_list, logger)
 
-    total_physical_memory = psutil.virtual_memory()
-    # what percentage of used memory can be attributed to this process
-    # pss (Linux): aka “Proportional Set Size”, is the amount of memory shared with other processes, accounted in a way
-    # that the amount is divided evenly between the processes that share it. I.e. if a process has 10 MBs all to itself
-    # and 10 MBs shared with another process its PSS will be 15 MBs.
-    # summing these two gets us a nice fair metric for the actual memory used in the RAM hardware.
-    # The unique bits are directly attributable to the process
-    # and the shared bits we give credit based on how many processes share those bits
-    pss_avail = all(["pss" in x for x in mem_info_per_process.values()])
-    if pss_avail:
-        system_wide_mem_percent = np.sum(
-            [
-                float(x["pss"])
-                / float(total_physical_memory.total - total_physical_memory.available)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    else:
-        # Sometimes we don't have access to PSS so just need to make due with rss
-        system_wide_mem_percent = np.sum(
-            [
-                float(x["rss"])
-                / float(total_physical_memory.total - total_physical_memory.available)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    power_credit_cpu = cpu_percent
-    power_credit_mem = system_wide_mem_percent
-    if power_credit_cpu == 0:
-        logger.warn(
-            "Problem retrieving CPU usage percentage to assign power credit, not using any CPU. This is possibly true, but seems unlikely! See if there's a problem!"
-        )
-    if power_credit_mem == 0:
-        raise ValueError(
-            "Problem retrieving Mem usage percentage to assign power credit"
-        )
+    return _attribute_intel_power(
+        *_get_powercap_power_totals(powercap_results),
+        cpu_sample,
+        process_list,
+        logger=logger,
+    )
 
-    total_attributable_power = 0
-    if total_cpu_power != 0:
-        total_attributable_power += total_cpu_power * power_credit_cpu
-    if total_dram_power != 0:
-        total_attributable_power += total_dram_power * power_credit_mem
 
-    # assign the rest of the power to the CPU percentage even if this is a bit innacurate
-    total_attributable_power += (
-        total_intel_power - total_dram_power - total_cpu_power
-    ) * power_credit_cpu
+def get_rapl_power(pid_list, logger=None, **kwargs):
+    """Gathers CPU information from RAPL.
 
-    if total_intel_power == 0:
-        raise ValueError(
-            "It seems that power estimates from Intel RAPL are coming back 0, this indicates a problem."
-        )
+    The RAPL counters and cpu times from the previous call are used as the baseline for this one, so only the
+    first call in a process waits to get a measurement window.
 
-    if pss_avail:
-        abs_mem_usage = np.sum([float(x["pss"]) for x in mem_info_per_process.values()])
+    Args:
+        pid_list ([int]): List of process IDs to attribute power to.
+        logger (optional): Logger to use when logging information. Defaults to None.
+        processes ([psutil.Process], optional): Process objects for pid_list to reuse across calls.
 
-        abs_mem_percent_usage = np.sum(
-            [
-                float(x["pss"]) / float(total_physical_memory.total)
-                for x in mem_info_per_process.values()
-            ]
-        )
-    else:
-        abs_mem_usage = np.sum([float(x["rss"]) for x in mem_info_per_process.values()])
+    Raises:
+        NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
+        ValueError: If no memory is used by the processes. This seems highly unlikely if not impossible and is probably a bug.
+        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
 
-        abs_mem_percent_usage = np.sum(
-            [
-                float(x["rss"]) / float(total_physical_memory.total)
-                for x in mem_info_per_process.values()
-            ]
-        )
+    Returns:
+        dict: Information about CPU
+    """
+    global _last_rapl_sample
 
-    if total_intel_power < total_attributable_power:
-        raise ValueError(
-            "For some reason the total intel estimated power is less than the attributable power. This "
-            "means there is an error in computing the attribution. Please re-open "
-            "https://github.com/Breakend/experiment-impact-tracker/issues/38 and add the trace for this "
-            "warning."
+    process_list = _get_process_list(
+        pid_list, logger, processes=kwargs.get("processes")
+    )
+
+    if (
+        _last_rapl_sample is None
+        or not _cpu_tracker.primed
+        # raw counter readings and integrated totals can't be diffed against each other
+        or _last_rapl_sample.integrated != rapl.RAPLMonitor.integrating()
+    ):
+        _last_rapl_sample = rapl.RAPLMonitor.sample()
+        _cpu_tracker.sample(process_list, logger)
+        time.sleep(FIRST_SAMPLE_WAIT_SECONDS)
+
+    # take both readings back to back so they cover the same window
+    cpu_sample = _cpu_tracker.sample(process_list, logger)
+    s2 = rapl.RAPLMonitor.sample()
+    diff = s2 - _last_rapl_sample
+    _last_rapl_sample = s2
+
+    data_return_values_with_headers = _attribute_intel_power(
+        *_get_rapl_power_totals(diff), cpu_sample, process_list, logger=logger
+    )
+    if s2.integrated:
+        data_return_values_with_headers["rapl_energy_joules"] = s2.energies(
+            unit=rapl.JOULES
         )
+    return data_return_values_with_headers
+
+
+def get_cgroup_intel_power(pid_list, logger=None, cgroup_path=None, **kwargs):
+    """Gathers CPU information from RAPL (or power gadget), attributing power to a whole cgroup (v2).
+
+    Rather than walking every process, the cpu time of the cgroup (cpu.stat usage_usec) is compared against the
+    system wide cpu time from /proc/stat and the cgroup's memory counters against the used system memory. So the
+    cost per sample doesn't depend on how many processes the experiment forks.
+
+    Args:
+        pid_list ([int]): List of process IDs in the cgroup, unused since the cgroup is read as a whole.
+        logger (optional): Logger to use when logging information. Defaults to None.
+        cgroup_path (str): Path to the cgroup directory, e.g. /sys/fs/cgroup/system.slice/my-job.scope
+
+    Raises:
+        NotImplementedError: If an unexpected top-level domain is encountered in RAPL information.
+        ValueError: If no memory is used by the cgroup. This seems highly unlikely if not impossible and is probably a bug.
+        ValueError: If RAPL power estimates are coming back 0. This is unlikely if not impossible so is probably an error.
 
+    Returns:
+        dict: Information about CPU
+    """
+    global _last_rapl_sample
+
+    energy_joules = None
+    if cgroup_path not in _cgroup_cpu_trackers:
+        _cgroup_cpu_trackers[cgroup_path] = cgroup.CgroupCPUTracker(cgroup_path)
+    tracker = _cgroup_cpu_trackers[cgroup_path]
+
+    if rapl._is_rapl_compatible():
+        if (
+            _last_rapl_sample is None
+            or not tracker.primed
+            or _last_rapl_sample.integrated != rapl.RAPLMonitor.integrating()
+        ):
+            _last_rapl_sample = rapl.RAPLMonitor.sample()
+            tracker.sample()
+            time.sleep(FIRST_SAMPLE_WAIT_SECONDS)
+
+        # take both readings back to back so they cover the same window
+        cpu_sample = tracker.sample()
+        s2 = rapl.RAPLMonitor.sample()
+        power_totals = _get_rapl_power_totals(s2 - _last_rapl_sample)
+        _last_rapl_sample = s2
+        if s2.integrated:
+            energy_joules = s2.energies(unit=rapl.JOULES)
+    else:
+        if not tracker.primed:
+            tracker.sample()
+        power_totals = _get_powercap_power_totals(powercap.PowerGadgetMonitor.sample())
+        cpu_sample = tracker.sample()
+
+    delta_cgroup = cpu_sample["delta_cgroup"]
+    delta_system = cpu_sample["delta_system"]
+    # both deltas cover the same window so the durations cancel out. The cgroup counter has a finer resolution than
+    # /proc/stat so cap the share at the whole system.
+    cpu_percent = min(delta_cgroup / delta_system, 1.0) if delta_system > 0 else 0.0
+    absolute_cpu_percent = delta_cgroup / cpu_sample["delta_time"]
+
+    memory = cgroup.read_cgroup_memory(cgroup_path)
+    total_physical_memory = psutil.virtual_memory()
+    abs_mem_usage = float(memory["working_set"])
+    system_wide_mem_percent = abs_mem_usage / float(
+        total_physical_memory.total - total_physical_memory.available
+    )
+    abs_mem_percent_usage = abs_mem_usage / float(total_physical_memory.total)
+
+    total_attributable_power = _split_intel_power(
+        *power_totals, cpu_percent, system_wide_mem_percent, logger=logger
+    )
+
+    usage = cpu_sample["usage"]
     data_return_values_with_headers = {
-        "rapl_power_draw_absolute": total_intel_power,
+        "rapl_power_draw_absolute": power_totals[0],
         "rapl_estimated_attributable_power_draw": total_attributable_power,
-        "cpu_time_seconds": cpu_times_per_process,
+        "cpu_time_seconds": {
+            cgroup_path: {"user": usage["user"], "system": usage["system"]}
+        },
         "average_relative_cpu_utilization": cpu_percent,
         "absolute_cpu_utilization": absolute_cpu_percent,
         "relative_mem_usage": system_wide_mem_percent,
         "absolute_mem_usage": abs_mem_usage,
         "absolute_mem_percent_usage": abs_mem_percent_usage,
-        "mem_info_per_process": mem_info_per_process,
+        "mem_info_per_process": {cgroup_path: memory},
     }
+    if energy_joules is not None:
+        data_return_values_with_headers["rapl_energy_joules"] = energy_joules
 
     return data_return_values_with_headers
@@ -10,12 +10,19 @@ import shutil
 import subprocess
 import sys
 import tempfile
-
-import pandas as pd
-from pandas import DataFrame
+import threading
+import time
 
 sys.path.append("..")
 
+# How long a streaming power gadget runs for, in seconds. Effectively for the rest of the experiment.
+STREAM_DURATION = 365 * 24 * 60 * 60
+# How long to wait for the first readings of a streaming power gadget, in seconds
+STREAM_FIRST_READING_TIMEOUT = 10
+
+# columns in the power gadget log that aren't power readings
+_NON_READING_COLUMNS = ["System Time", "Elapsed Time (sec)", "RDTSC"]
+
 
 get_long_path = lambda x: x
 try:
@@ -111,6 +118,8 @@ class PowerGadget(object):
         Note: IA is the power draw of the cores, DRAM is the power draw of the DRAM, GT is the GPU
         :return:
         """
+        import pandas as pd
+
         summary = {}
 
         try:
@@ -130,3 +139,209 @@ class PowerGadget(object):
 
         shutil.rmtree(os.path.split(self._logfile)[0])
         return summary
+
+
+def _parse_power_log_line(columns, line):
+    """Parses one row of a power gadget log.
+
+    :param columns: the column names from the header row
+    :param line: the row
+    :return: the readings in the row by column, without timestamps and cumulative columns, or None if it isn't a
+        complete row of readings (e.g., the summary power gadget prints when it exits)
+    """
+    values = line.strip().split(",")
+    if len(values) != len(columns):
+        return None
+    readings = {}
+    for column, value in zip(columns, values):
+        if column in _NON_READING_COLUMNS or "Cumulative" in column:
+            continue
+        try:
+            readings[column] = float(value)
+        except ValueError:
+            return None
+    return readings
+
+
+class PowerGadgetStream(PowerGadget):
+    """Runs a single power gadget for the whole experiment and parses its log as it is written.
+
+    A reader thread keeps running sums of the readings, so every call to averages() returns the average of the
+    readings since the previous call without starting a new power gadget, temporary directory and pandas parse
+    every sample.
+    """
+
+    def __init__(self, resolution=100, duration=STREAM_DURATION):
+        super(PowerGadgetStream, self).__init__(
+            duration=duration, resolution=resolution
+        )
+        self._lock = threading.Lock()
+        self._has_readings = threading.Condition(self._lock)
+        self._sums = {}
+        self._count = 0
+        self._last_averages = None
+        self._stopped = threading.Event()
+        self._process = None
+        self._thread = None
+        self._directory = None
+
+    def start(self):
+        resolution = str(self.resolution)
+        duration = str(self.duration)
+
+        if self._system == "Linux":
+            # the linux power gadget writes its log to stdout
+            command = [self._tool, "-e", resolution, "-d", duration]
+            stdbuf = shutil.which("stdbuf")
+            if stdbuf is not None:
+                # C stdio fully buffers a pipe, so readings would arrive in 4KB bursts seconds late
+                command = [stdbuf, "-oL"] + command
+            self._process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            )
+            lines = self._process.stdout
+        else:
+            self._directory = get_long_path(tempfile.mkdtemp())
+            self._logfile = os.path.join(self._directory, "PowerLog.csv")
+            self._process = subprocess.Popen(
+                [
+                    self._tool,
+                    "-resolution",
+                    resolution,
+                    "-duration",
+                    duration,
+                    "-file",
+                    self._logfile,
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            lines = self._follow_logfile()
+
+        self._thread = threading.Thread(
+            target=self._read, args=(lines,), name="power-gadget-reader", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _follow_logfile(self):
+        """Yields the lines of the log file as they are written until power gadget exits."""
+        while not os.path.exists(self._logfile):
+            if self._stopped.is_set() or self._process.poll() is not None:
+                return
+            time.sleep(self.resolution / 1000.0)
+        with open(self._logfile, "r") as f:
+            partial = ""
+            while True:
+                line = f.readline()
+                if not line:
+                    if self._stopped.is_set() or self._process.poll() is not None:
+                        return
+                    time.sleep(self.resolution / 1000.0)
+                    continue
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+
+    def _read(self, lines):
+        columns = None
+        for line in lines:
+            if columns is None:
+                if "Processor Power_0(Watt)" in line:
+                    columns = [column.strip() for column in line.strip().split(",")]
+                continue
+            readings = _parse_power_log_line(columns, line)
+            if readings is None:
+                continue
+            with self._lock:
+                for column, value in readings.items():
+                    self._sums[column] = self._sums.get(column, 0.0) + value
+                self._count += 1
+                self._has_readings.notify_all()
+
+    @property
+    def running(self):
+        return (
+            self._process is not None
+            and self._process.poll() is None
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def averages(self, timeout=STREAM_FIRST_READING_TIMEOUT):
+        """
+        Note: IA is the power draw of the cores, DRAM is the power draw of the DRAM, GT is the GPU
+        :param timeout: how long to wait for readings if there haven't been any yet
+        :return: the average of every reading since the last call. If there were no new readings, the previous
+            averages.
+        """
+        with self._lock:
+            if self._last_averages is None and self._count == 0:
+                self._has_readings.wait_for(lambda: self._count > 0, timeout=timeout)
+            if self._count == 0:
+                if self._last_averages is None:
+                    raise Exception("PowerLog failed to generate any readings")
+                return dict(self._last_averages)
+            summary = {
+                column: total / self._count for column, total in self._sums.items()
+            }
+            self._sums = {}
+            self._count = 0
+            self._last_averages = summary
+        return dict(summary)
+
+    def stop(self):
+        self._stopped.set()
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._process is not None and self._process.stdout is not None:
+            self._process.stdout.close()
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+class PowerGadgetMonitor(object):
+    # set while a PowerGadgetStream is running in this process, samples then come from its readings
+    stream = None
+
+    @classmethod
+    def streaming(cls):
+        return cls.stream is not None and cls.stream.running
+
+    @classmethod
+    def sample(cls):
+        """
+        :return: the average power gadget readings since the last sample if streaming, otherwise the averages of
+            a new power gadget run
+        """
+        if cls.streaming():
+            return cls.stream.averages()
+        power_gadget = PowerGadget()
+        power_gadget.start()
+        return power_gadget.join()
+
+    @classmethod
+    def start_stream(cls, resolution=100):
+        """Starts a single power gadget that runs until stop_stream, see PowerGadgetStream."""
+        if not cls.streaming():
+            cls.stream = PowerGadgetStream(resolution=resolution).start()
+        return cls.stream
+
+    @classmethod
+    def stop_stream(cls):
+        if cls.stream is not None:
+            cls.stream.stop()
+            cls.stream = None
@@ -1,12 +1,25 @@
 import os
 import os.path
 import re
+import threading
+import time
 from datetime import datetime
 
+import numpy as np
+
 UJOULES = 1
 JOULES = 2
 WATT_HOURS = 3
 
+RAPL_PATH = "/sys/class/powercap/intel-rapl"
+# How often the energy integrator reads the RAPL counters, in Hz
+RAPL_INTEGRATOR_RATE = float(os.getenv("OVERRIDE_RAPL_SAMPLE_RATE", 20))
+
+_timer = getattr(time, "monotonic", time.time)
+
+# energy_uj is at most a 20 digit number plus a newline
+_ENERGY_UJ_READ_SIZE = 32
+
 
 def _read_sysfs_file(path):
     with open(path, "r") as f:
@@ -42,6 +55,8 @@ def _walk_rapl_dir(path):
 
 
 class RAPLDomain(object):
+    __slots__ = ("name", "id", "values", "max_values", "subdomains", "parent")
+
     @classmethod
     def construct(cls, id, path):
         name, energy_uj, max_energy_range_uj = _get_domain_info(path)
@@ -100,6 +115,9 @@ class RAPLDomain(object):
 
 
 class RAPLSample(object):
+    # whether the energy values are running totals from a RAPLEnergyIntegrator rather than raw counter readings
+    integrated = False
+
     @classmethod
     def take_sample(cls):
         sample = RAPLSample()
@@ -126,6 +144,37 @@ class RAPLSample(object):
 
         return sample
 
+    @classmethod
+    def from_readings(cls, topology, energy_uj, max_energy_uj=None, timestamp=None):
+        """Builds a sample from counter readings of a RAPLTopology, without touching sysfs.
+
+        :param topology: the RAPLTopology the readings are for
+        :param energy_uj: the energy per domain, in the same order as topology.ids
+        :param max_energy_uj: the value at which each domain's energy wraps around, defaults to the topology's
+        :param timestamp: when the readings were taken, defaults to now
+        :return: a RAPLSample
+        """
+        if max_energy_uj is None:
+            max_energy_uj = topology.max_energy_uj
+        sample = cls()
+        sample.domains = {}
+        sample.domains_by_id = {}
+        sample.timestamp = datetime.now() if timestamp is None else timestamp
+        # tolist so the values logged are plain python numbers rather than numpy scalars
+        for domain_id, name, energy, max_energy in zip(
+            topology.ids, topology.names, energy_uj.tolist(), max_energy_uj.tolist()
+        ):
+            domain = RAPLDomain()
+            domain.name = name
+            domain.id = domain_id
+            domain.values = {"energy_uj": energy}
+            domain.max_values = {"energy_uj": max_energy}
+            domain.subdomains = {}
+            domain.parent = None
+            sample.domains_by_id[domain_id] = domain
+            sample._link_tree(domain)
+        return sample
+
     def _link_tree(self, domain):
         if domain.is_subdomain():
             parent = self.domains_by_id[domain.parent_id()]
@@ -165,13 +214,235 @@ class RAPLSample(object):
         elif unit == WATT_HOURS:
             return e / (1000000 * 3600)
 
+    def energies(self, unit=UJOULES):
+        """
+        :param unit: the unit to return the energies in
+        :return: the energy per domain, subdomains are keyed by <package>/<subdomain>, e.g. package-0/dram.
+        """
+        energies = {}
+        for name, domain in self.domains.items():
+            energies[name] = self.energy(name, unit=unit)
+            for subdomain in domain.subdomains:
+                energies["{}/{}".format(name, subdomain)] = self.energy(
+                    name, subdomain, unit=unit
+                )
+        return energies
+
 
 class RAPLDifference(RAPLSample):
     def average_power(self, package, domain=None):
         return self.energy(package, domain, unit=JOULES) / self.duration
 
 
+def _unwrapped_energy_delta(previous, current, max_energy, elapsed=None, power=None):
+    """Computes the energy used between two readings of a counter that wraps around at max_energy.
+
+    A single wrap shows up as the counter going backwards. If the readings are far enough apart for the counter to
+    have wrapped more than once (e.g., the reading thread was stalled) that can't be seen from the counter alone, so
+    if we know the recent power the number of extra wraps is estimated from how much energy we'd expect to have
+    been used in the elapsed time.
+
+    Works on single readings as well as on numpy arrays of readings for all domains at once.
+
+    :param previous: the previous counter reading in uJ
+    :param current: the current counter reading in uJ
+    :param max_energy: the value at which the counter wraps around (max_energy_range_uj)
+    :param elapsed: seconds between the two readings
+    :param power: recent power in uJ per second
+    :return: the energy used in uJ
+    """
+    delta = np.mod(current - previous, max_energy)
+    if elapsed and power is not None:
+        expected = np.multiply(power, elapsed)
+        extra_wraps = np.floor((expected - delta) / max_energy + 0.5)
+        delta = delta + np.maximum(extra_wraps, 0).astype(np.int64) * max_energy
+    return delta
+
+
+class RAPLTopology(object):
+    """The RAPL domains of this machine, discovered once.
+
+    Domain names and counter ranges don't change while the machine is up, so they are read once and the energy_uj
+    file of every domain is kept open. Reading all the counters is then a single pread per domain into a
+    preallocated array rather than a walk over the sysfs tree opening three files per domain.
+    """
+
+    def __init__(self, path=RAPL_PATH):
+        self.path = path
+        domains = []
+        for dirpath, dirnames, filenames in _walk_rapl_dir(path):
+            current = dirpath.split("/")[-1]
+            if len(current.split(":")) >= 2:
+                name = _read_sysfs_file("%s/name" % dirpath)
+                max_energy_range_uj = int(
+                    _read_sysfs_file("%s/max_energy_range_uj" % dirpath)
+                )
+                domains.append((current, name, max_energy_range_uj, dirpath))
+        # a parent id is a prefix of its subdomains' ids, so sorting puts parents first and samples can link the
+        # tree in order
+        domains.sort()
+
+        self.ids = [domain[0] for domain in domains]
+        self.names = [domain[1] for domain in domains]
+        self.max_energy_uj = np.array([domain[2] for domain in domains], dtype=np.int64)
+        self.energy_uj = np.zeros(len(domains), dtype=np.int64)
+        self._fds = [
+            os.open(os.path.join(domain[3], "energy_uj"), os.O_RDONLY)
+            for domain in domains
+        ]
+
+    def read(self):
+        """Reads the energy counters of all domains.
+
+        :return: the preallocated array of readings in uJ, in the same order as ids. It is overwritten by the next
+            read, so copy it to keep it around.
+        """
+        for i, fd in enumerate(self._fds):
+            self.energy_uj[i] = int(os.pread(fd, _ENERGY_UJ_READ_SIZE, 0))
+        return self.energy_uj
+
+    def sample(self):
+        """Reads the energy counters of all domains.
+
+        :return: a RAPLSample of the readings
+        """
+        return RAPLSample.from_readings(self, self.read())
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+
+class RAPLEnergyIntegrator(object):
+    """Reads the RAPL energy counters at a high rate on a background thread and accumulates the total energy per
+    domain.
+
+    The counters wrap around at max_energy_range_uj, which on busy servers can happen within minutes. Reading the
+    counters often makes sure no wraps are missed, so the accumulated energy is exact and the energy used between
+    any two samples is the difference of the running totals rather than an average power over the window.
+    """
+
+    def __init__(self, rate=None, path=RAPL_PATH, topology=None):
+        self.rate = RAPL_INTEGRATOR_RATE if rate is None else rate
+        # only close the counters on stop if nobody else is reading them
+        self._owns_topology = topology is None
+        self.topology = RAPLTopology(path) if topology is None else topology
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_reading = self.topology.read().copy()
+        self._totals = np.zeros_like(self._last_reading)
+        # the totals are already unwrapped
+        self._max_totals = np.full(len(self._totals), np.inf)
+        self._started = self._last_read = _timer()
+        self.timestamp = datetime.now()
+
+    def read(self):
+        """Reads all counters once and adds the energy used since the last read to the totals."""
+        with self._lock:
+            now = _timer()
+            elapsed = now - self._last_read
+            # only a stalled reader can miss more than one wrap, in which case estimate how many from the average
+            # power so far. Power over the short intervals between regular reads is too noisy for that.
+            stalled = elapsed > 2.0 / self.rate and self._last_read > self._started
+            energy_uj = self.topology.read()
+            self._totals += _unwrapped_energy_delta(
+                self._last_reading,
+                energy_uj,
+                self.topology.max_energy_uj,
+                elapsed=elapsed if stalled else None,
+                power=self._totals / (self._last_read - self._started)
+                if stalled
+                else None,
+            )
+            self._last_reading[:] = energy_uj
+            self._last_read = now
+            self.timestamp = datetime.now()
+
+    def _run(self):
+        while not self._stop_event.wait(1.0 / self.rate):
+            self.read()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="rapl-energy-integrator", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._owns_topology:
+            self.topology.close()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def energy_joules(self):
+        """
+        :return: the energy used per domain since the integrator was created, in Joules. Subdomains are keyed by
+            <package>/<subdomain>, e.g. package-0/dram.
+        """
+        return self.sample().energies(unit=JOULES)
+
+    def sample(self):
+        """Reads the counters and returns the running totals as a RAPLSample.
+
+        The totals never wrap, so differences between these samples are the exact energy used in between.
+
+        :return: a RAPLSample of the accumulated energy
+        """
+        self.read()
+        with self._lock:
+            sample = RAPLSample.from_readings(
+                self.topology,
+                self._totals,
+                max_energy_uj=self._max_totals,
+                timestamp=self.timestamp,
+            )
+        sample.integrated = True
+        return sample
+
+
 class RAPLMonitor(object):
+    # set while a RAPLEnergyIntegrator is running in this process, samples then come from its running totals
+    integrator = None
+    # discovered on the first sample and kept open for all the following ones, see RAPLTopology
+    topology = None
+
+    @classmethod
+    def get_topology(cls):
+        if cls.topology is None:
+            cls.topology = RAPLTopology()
+        return cls.topology
+
+    @classmethod
+    def integrating(cls):
+        return cls.integrator is not None and cls.integrator.running
+
     @classmethod
     def sample(cls):
-        return RAPLSample.take_sample()
+        if cls.integrating():
+            return cls.integrator.sample()
+        return cls.get_topology().sample()
+
+    @classmethod
+    def start_integrator(cls, rate=None):
+        """Starts reading the counters at a high rate in the background, see RAPLEnergyIntegrator."""
+        if cls.integrator is None or not cls.integrator.running:
+            cls.integrator = RAPLEnergyIntegrator(
+                rate=rate, topology=cls.get_topology()
+            ).start()
+        return cls.integrator
+
+    @classmethod
+    def stop_integrator(cls):
+        if cls.integrator is not None:
+            cls.integrator.stop()
+            cls.integrator = None
@@ -7,7 +7,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
-from experiment_impact_tracker.data_utils import load_data_into_frame
+from experiment_impact_tracker.data_utils import iter_data_frames
 
 SMALL_SIZE = 22
 MEDIUM_SIZE = 24
@@ -75,7 +75,8 @@ def create_graphs(
     #     out_dir = out_dir + '_' + random_suffix()
 
     os.makedirs(out_dir, exist_ok=True)
-    df, json_raw = load_data_into_frame(input_path, max_level=max_level)
+    # only the frame, not the samples as they were logged too
+    df = pd.concat(iter_data_frames(input_path, max_level=max_level), ignore_index=True)
     # df = pd.read_csv(os.path.join(input_path, csv), sep=',', parse_dates=[0], date_parser=dateparse)
     created_paths = []
     df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
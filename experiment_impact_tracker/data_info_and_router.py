@@ -8,11 +8,14 @@ from experiment_impact_tracker.cpu.common import (
 from experiment_impact_tracker.cpu.intel import (get_intel_power,
                                                  get_rapl_power,
                                                  is_intel_compatible)
+from experiment_impact_tracker.data_schema import (FLOAT64, INT64, MAPPING,
+                                                   SCALAR, STR, VECTOR)
 from experiment_impact_tracker.disk.common import measure_disk_speed_at_dir
 from experiment_impact_tracker.emissions.common import (
     get_realtime_carbon, is_capable_realtime_carbon_intensity)
 from experiment_impact_tracker.emissions.get_region_metrics import \
     get_current_region_info_cached
+from experiment_impact_tracker.emissions.region_resolver import resolve_region
 from experiment_impact_tracker.gpu.nvidia import (get_gpu_info,
                                                   get_nvidia_gpu_power,
                                                   is_nvidia_compatible)
@@ -68,115 +71,216 @@ INITIAL_INFO = [
         "compatability": [all_compatible],
         "routing": {"function": lambda: get_current_region_info_cached()[1]},
     },
+    {
+        "name": "region_resolution_source",
+        "description": "How the region was determined: an override, a previous lookup cached on this host or an IP lookup.",
+        "compatability": [all_compatible],
+        "routing": {"function": lambda: resolve_region()["source"]},
+    },
 ]
 
 DATA_HEADERS = [
     {
         "name": "timestamp",
         "description": "Time at which sample was drawn based on local machine time in timestamp format.",
+        "dtype": FLOAT64,
+        "unit": "s",
+        "shape": SCALAR,
         "compatability": [all_compatible],
         "routing": {"function": get_timestamp},
     },
     {
         "name": "rapl_power_draw_absolute",
         "description": "The absolute power draw reading read from an Intel RAPL package. This is in terms of Watts across the entire machine.",
+        "dtype": FLOAT64,
+        "unit": "W",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "rapl_estimated_attributable_power_draw",
         "description": "This is the estimated attributable power draw to this process and all child processes based on power draw reading read from an Intel RAPL package. This is calculated as (watts used by cpu) * (relative cpu percentage used) + (watts used by dram) * (relative dram percentage used) + (watts used by other package elements) * (relative cpu percentage used).",
+        "dtype": FLOAT64,
+        "unit": "W",
+        "shape": SCALAR,
+        "compatability": [is_intel_compatible],
+        "routing": {"function": get_intel_power},
+    },
+    {
+        "name": "rapl_energy_joules",
+        "description": "The total energy used by every Intel RAPL domain since the monitor started, in Joules. Only available when the RAPL counters are read directly, in which case they are read at a high rate in the background (see OVERRIDE_RAPL_SAMPLE_RATE) so that no counter wraparound is missed. Subdomains are keyed by <package>/<subdomain>, e.g. package-0/dram.",
+        "dtype": FLOAT64,
+        "unit": "J",
+        "shape": (MAPPING,),
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "nvidia_draw_absolute",
         "description": "This is the absolute power draw of all accessible NVIDIA GPUs on the system (as long as the main process or any child process lives on the GPU). Calculated as sum across all GPUs.",
+        "dtype": FLOAT64,
+        "unit": "W",
+        "shape": SCALAR,
         "compatability": [is_nvidia_compatible, is_linux],
         "routing": {"function": get_nvidia_gpu_power},
     },
     {
         "name": "nvidia_estimated_attributable_power_draw",
         "description": "This is the estimated attributable power draw of all accessible NVIDIA GPUs on the system (as long as the main process or any child process lives on the GPU). Calculated as the sum per gpu of (absolute power draw per gpu) * (relative process percent utilization of gpu)",
+        "dtype": FLOAT64,
+        "unit": "W",
+        "shape": SCALAR,
         "compatability": [is_nvidia_compatible, is_linux],
         "routing": {"function": get_nvidia_gpu_power},
     },
     {
         "name": "cpu_time_seconds",
         "description": "This is the total CPU time used so far by the program in seconds.",
+        "dtype": FLOAT64,
+        "unit": "s",
+        "shape": (MAPPING, MAPPING),
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "average_gpu_estimated_utilization_absolute",
         "description": "This is the absolute utilization of the GPUs by the main process and all child processes. Returns an average result across several trials of nvidia-smi pmon -c 10. Averaged across GPUs. Using .05 to indicate 5%.",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_nvidia_compatible, is_linux],
         "routing": {"function": get_nvidia_gpu_power},
     },
     {
         "name": "average_gpu_estimated_utilization_relative",
         "description": "This is the relative utilization of the GPUs by the main process and all child processes. Returns an average result across several trials of nvidia-smi pmon -c 10 and the percentage that this process and all child process utilize for the gpu.  Averaged across GPUs. Using .05 to indicate 5%. ",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_nvidia_compatible, is_linux],
         "routing": {"function": get_nvidia_gpu_power},
     },
     {
         "name": "average_relative_cpu_utilization",
         "description": "This is the relative CPU utlization compared to the utilization of the whole system at that time. E.g., if the total system is using 50\% of the CPU power, but our program is only using 25\%, this will return .5.",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "absolute_cpu_utilization",
         "description": "This is the relative CPU utlization compared to the utilization of the whole system at that time. E.g., if the total system is using 50\% of 4 CPUs, but our program is only using 25\% of 2 CPUs, this will return .5 (same as in top). There is no multiplier times the number of cores in this case as top does. ",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "per_gpu_performance_state",
         "description": "A concatenated string which gives the performance state of every single GPU used by the main process or all child processes. Example formatting looks like <gpuid>::<performance state>. E.g., 0::P0",
+        "dtype": STR,
+        "unit": None,
+        "shape": (MAPPING,),
         "compatability": [is_nvidia_compatible, is_linux],
         "routing": {"function": get_nvidia_gpu_power},
     },
     {
         "name": "relative_mem_usage",
         "description": "The percentage of all in-use ram this program is using.",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "absolute_mem_usage",
         "description": "The amount of memory being used.",
+        "dtype": FLOAT64,
+        "unit": "bytes",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "absolute_mem_percent_usage",
         "description": "The amount of memory being used as an absolute percentage of total memory (RAM).",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": SCALAR,
         "compatability": [is_intel_compatible],
         "routing": {"function": get_intel_power},
     },
     {
         "name": "cpu_count_adjusted_average_load",
         "description": "Measures the average load on the system for the past 5, 10, 15 minutes divided by number of CPUs (wrapper for psutil method). As fraction (percentage needs multiplication by 100)",
+        "dtype": FLOAT64,
+        "unit": "fraction",
+        "shape": (VECTOR,),
         "compatability": [all_compatible],
         "routing": {"function": get_cpu_count_adjusted_load_avg},
     },
     {
         "name": "cpu_freq",
         "description": "Get cpu frequency including realtime in MHz.",
+        "dtype": FLOAT64,
+        "unit": "MHz",
+        "shape": (VECTOR, MAPPING),
         "compatability": [is_linux, is_cpu_freq_compatible],
         "routing": {"function": get_cpu_freq},
     },
     {
         "name": "realtime_carbon_intensity",
         "description": "If available, the realtime carbon intensity in the region.",
+        "dtype": FLOAT64,
+        "unit": "gCO2eq/kWh",
+        "shape": SCALAR,
         "compatability": [is_capable_realtime_carbon_intensity],
         "routing": {"function": get_realtime_carbon},
     },
     {
         "name": "disk_write_speed",
         "description": "The write speed to the disk estimated over .5 seconds.",
+        "dtype": FLOAT64,
+        "unit": "MB/s",
+        "shape": SCALAR,
         "compatability": [all_compatible],
         "routing": {"function": measure_disk_speed_at_dir},
     },
 ]
+
+# Values samples have besides DATA_HEADERS, added by the monitor or reported by collectors along with their headers
+SAMPLE_FIELDS = [
+    {
+        "name": "process_ids",
+        "description": "The ids of the processes the sample was attributed to.",
+        "dtype": INT64,
+        "unit": None,
+        "shape": (VECTOR,),
+    },
+    {
+        "name": "sampling_durations",
+        "description": "How long the collector of each header took for this sample, in seconds.",
+        "dtype": FLOAT64,
+        "unit": "s",
+        "shape": (MAPPING,),
+    },
+    {
+        "name": "mem_info_per_process",
+        "description": "The memory counters (rss, pss, ...) of each process, in bytes.",
+        "dtype": FLOAT64,
+        "unit": "bytes",
+        "shape": (MAPPING, MAPPING),
+    },
+    {
+        "name": "per_gpu_power_draw",
+        "description": "The absolute power draw of each GPU, in Watts.",
+        "dtype": FLOAT64,
+        "unit": "W",
+        "shape": (MAPPING,),
+    },
+]
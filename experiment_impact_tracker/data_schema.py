@@ -0,0 +1,278 @@
+"""The typed schema of logged samples, generated from the dtype, unit and shape declared for each of DATA_HEADERS.
+
+Every value in a sample is declared as a leaf dtype (one of DTYPES) with a unit, nested in a shape: a tuple with
+VECTOR for a list and MAPPING for a dict keyed by process id, GPU, RAPL domain, ... at each level. SCALAR (an empty
+tuple) is a single value, (MAPPING, MAPPING) is e.g. the cpu times of each process and (VECTOR, MAPPING) the
+frequencies of each cpu.
+
+The monitor's writers coerce samples to the schema before logging them, so e.g. "n/a" for a realtime carbon
+intensity that couldn't be looked up is logged as a missing value rather than turning the whole column into strings.
+Loading builds each declared column straight into a numpy array of its dtype rather than having pandas infer it.
+Values that aren't declared are logged and loaded as they are.
+"""
+import logging
+import math
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
+
+SCALAR = ()
+VECTOR = "vector"
+MAPPING = "mapping"
+
+FLOAT64 = "float64"
+INT64 = "int64"
+STR = "str"
+DTYPES = (FLOAT64, INT64, STR)
+
+# what collectors report for values they couldn't read
+MISSING_MARKERS = ("n/a", "nan", "")
+
+log = logging.getLogger(__name__)
+
+Field = namedtuple("Field", ["name", "dtype", "unit", "shape", "description"])
+
+
+def _coerce_leaf(value, dtype):
+    if value is None:
+        return None
+    if dtype == STR:
+        return str(value)
+    if isinstance(value, str):
+        if value.strip().lower() in MISSING_MARKERS:
+            return None
+        value = float(value)
+    if dtype == FLOAT64:
+        value = float(value)
+        return None if math.isnan(value) else value
+    if float(value) != int(value):
+        raise ValueError("{} isn't an integer".format(value))
+    return int(value)
+
+
+def _coerce(value, dtype, shape):
+    if value is None:
+        return None
+    if not shape:
+        return _coerce_leaf(value, dtype)
+    if shape[0] == VECTOR:
+        if not isinstance(value, (list, tuple, np.ndarray)):
+            raise ValueError("expected a list, got {!r}".format(value))
+        return [_coerce(item, dtype, shape[1:]) for item in value]
+    if not isinstance(value, dict):
+        raise ValueError("expected a dict, got {!r}".format(value))
+    # keys become strings when logged as json anyway
+    return {str(key): _coerce(item, dtype, shape[1:]) for key, item in value.items()}
+
+
+class SampleSchema(object):
+    """The declared fields of a sample.
+
+    Args:
+        fields ([Field]): the declared fields
+    """
+
+    def __init__(self, fields):
+        self.fields = OrderedDict((field.name, field) for field in fields)
+        for field in self.fields.values():
+            if field.dtype not in DTYPES:
+                raise ValueError(
+                    "{} has unknown dtype {}, expected one of {}".format(
+                        field.name, field.dtype, DTYPES
+                    )
+                )
+            if any(level not in (VECTOR, MAPPING) for level in field.shape):
+                raise ValueError(
+                    "{} has unknown shape {}".format(field.name, field.shape)
+                )
+        self._warned = set()
+
+    @classmethod
+    def from_headers(cls, *header_lists):
+        """Generates the schema from header declarations, headers without a dtype are left undeclared.
+
+        Args:
+            header_lists ([dict]): e.g. DATA_HEADERS and SAMPLE_FIELDS
+        """
+        return cls(
+            Field(
+                header["name"],
+                header["dtype"],
+                header.get("unit"),
+                tuple(header.get("shape", SCALAR)),
+                header.get("description"),
+            )
+            for header in chain(*header_lists)
+            if "dtype" in header
+        )
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def get(self, name):
+        return self.fields.get(name)
+
+    def coerce(self, sample, strict=False):
+        """Coerces the declared values of a sample to their dtypes, other values are kept as they are.
+
+        Args:
+            sample (dict): the sample
+            strict (bool, optional): raise on values that can't be coerced rather than logging a warning (once per
+                field) and leaving them out. Defaults to False.
+
+        Raises:
+            ValueError: If strict and a value doesn't fit its declaration.
+
+        Returns:
+            dict: the coerced sample
+        """
+        coerced = {}
+        for name, value in sample.items():
+            field = self.fields.get(name)
+            if field is None:
+                coerced[name] = value
+                continue
+            try:
+                coerced[name] = _coerce(value, field.dtype, field.shape)
+            except (ValueError, TypeError, OverflowError) as e:
+                if strict:
+                    raise ValueError("{} doesn't fit its schema: {}".format(name, e))
+                if name not in self._warned:
+                    self._warned.add(name)
+                    log.warning(
+                        "Leaving out %s, it doesn't fit its schema: %s", name, e
+                    )
+        return coerced
+
+
+@lru_cache(maxsize=1)
+def get_schema():
+    """
+    Returns:
+        SampleSchema: the schema of DATA_HEADERS and SAMPLE_FIELDS
+    """
+    from experiment_impact_tracker.data_info_and_router import (DATA_HEADERS,
+                                                                SAMPLE_FIELDS)
+
+    return SampleSchema.from_headers(DATA_HEADERS, SAMPLE_FIELDS)
+
+
+def _fill_leaf(values, dtype):
+    count = len(values)
+    if dtype == STR:
+        array = np.empty(count, dtype=object)
+        array[:] = values
+        return array
+    array = np.empty(count, dtype=np.float64)
+    try:
+        # the common case, numbers and missing values
+        array[:] = [np.nan if value is None else value for value in values]
+    except (ValueError, TypeError):
+        for i, value in enumerate(values):
+            try:
+                value = _coerce_leaf(value, FLOAT64)
+            except (ValueError, TypeError, OverflowError):
+                value = None
+            array[i] = np.nan if value is None else value
+    if dtype == INT64 and not np.isnan(array).any():
+        return array.astype(np.int64)
+    return array
+
+
+def _ordered_keys(dicts):
+    keys = set().union(*dicts)
+    ordered = OrderedDict()
+    # in the order they first appear, like json_normalize
+    for item in dicts:
+        ordered.update((key, None) for key in item)
+        if len(ordered) == len(keys):
+            break
+    return list(ordered)
+
+
+def _fill_columns(columns, name, values, dtype, shape, max_level, level):
+    if not shape:
+        columns[name] = _fill_leaf(values, dtype)
+    elif shape[0] == MAPPING and (max_level is None or level < max_level):
+        dicts = [value if isinstance(value, dict) else {} for value in values]
+        for key in _ordered_keys(dicts):
+            _fill_columns(
+                columns,
+                "{}.{}".format(name, key),
+                [item.get(key) for item in dicts],
+                dtype,
+                shape[1:],
+                max_level,
+                level + 1,
+            )
+    else:
+        # lists (and dicts below max_level) stay whole, like json_normalize
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        columns[name] = array
+
+
+def fill_field_columns(columns, field, values, max_level=None):
+    """Fills the values of a declared field into numpy arrays of its dtype, mappings flattened into "name.key"
+    columns like json_normalize does and missing values nan.
+
+    Args:
+        columns (OrderedDict): the columns to add to
+        field (Field): the declared field
+        values (list): the value of each sample, None where it's missing
+        max_level (int, optional): how many levels of mappings to flatten. Defaults to all of them.
+    """
+    _fill_columns(columns, field.name, values, field.dtype, field.shape, max_level, 0)
+
+
+def build_frame(samples, schema=None, max_level=None):
+    """Builds a frame from samples like json_normalize does, but with the declared values filled into numpy arrays
+    of their dtype. Declared mappings are flattened into "name.key" columns and missing values are nan.
+
+    Args:
+        samples ([dict]): the samples
+        schema (SampleSchema, optional): Defaults to get_schema().
+        max_level (int, optional): how many levels of nested values to flatten. Defaults to all of them.
+
+    Returns:
+        pandas.DataFrame: the samples
+    """
+    import pandas as pd
+    from pandas.io.json import json_normalize
+
+    schema = get_schema() if schema is None else schema
+    columns = OrderedDict()
+    undeclared = []
+    for name in _ordered_keys(samples):
+        field = schema.get(name)
+        if field is None:
+            undeclared.append(name)
+            # keeps the column order
+            columns[name] = None
+            continue
+        fill_field_columns(
+            columns, field, [sample.get(name) for sample in samples], max_level
+        )
+
+    if undeclared:
+        normalized = json_normalize(
+            [
+                {name: sample[name] for name in undeclared if name in sample}
+                for sample in samples
+            ],
+            max_level=max_level,
+        )
+        flattened = OrderedDict((name, []) for name in undeclared)
+        for column in normalized.columns:
+            flattened[column.split(".", 1)[0]].append(column)
+        filled, columns = columns, OrderedDict()
+        for name, array in filled.items():
+            if array is not None:
+                columns[name] = array
+                continue
+            for column in flattened[name]:
+                columns[column] = normalized[column].values
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(samples)))
@@ -1,15 +1,39 @@
 import csv
 import os
 import pickle
+import time
 import zipfile
 from datetime import datetime
 
 import ujson as json
-from pandas.io.json import json_normalize
 
 BASE_LOG_PATH = "impacttracker/"
 DATAPATH = BASE_LOG_PATH + "data.json"
 INFOPATH = BASE_LOG_PATH + "info.pkl"
+# directory of the columnar sample log, see columnar_log
+ARROWPATH = BASE_LOG_PATH + "data.arrow"
+
+FORMAT_JSON = "json"
+FORMAT_ARROW = "arrow"
+DATA_FORMATS = (FORMAT_JSON, FORMAT_ARROW)
+# How the monitor logs samples, see get_data_writer
+DATA_FORMAT = os.getenv("OVERRIDE_DATA_FORMAT", FORMAT_JSON)
+
+# When the monitor writes the buffered samples out, whichever comes first: this many samples, this many bytes or this
+# many seconds since the oldest buffered sample
+DATA_FLUSH_RECORDS = int(os.getenv("OVERRIDE_DATA_FLUSH_RECORDS", 10))
+DATA_FLUSH_BYTES = int(os.getenv("OVERRIDE_DATA_FLUSH_BYTES", 1024 * 1024))
+DATA_FLUSH_INTERVAL = float(os.getenv("OVERRIDE_DATA_FLUSH_INTERVAL", 10))
+
+FSYNC_NEVER = "never"
+FSYNC_ON_FLUSH = "flush"
+FSYNC_ON_CLOSE = "close"
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_ON_FLUSH, FSYNC_ON_CLOSE)
+# Whether the sample log is fsynced, see BufferedRecordWriter
+DATA_FSYNC = os.getenv("OVERRIDE_DATA_FSYNC", FSYNC_NEVER)
+
+# How many samples iter_data_frames loads at a time
+DATA_CHUNK_SIZE = 10000
 
 
 def load_initial_info(log_dir):
@@ -20,14 +44,118 @@ def load_initial_info(log_dir):
 
 def _read_json_file(filename):
     with open(filename, "r") as f:
-        lines = f.readlines()
-        return [json.loads(line) for line in lines]
+        return [json.loads(line) for line in f]
+
+
+def load_data_into_frame(log_dir, max_level=None, columns=None):
+    """Loads the samples of a log directory, from the columnar log if there is one (see columnar_log) and from
+    data.json otherwise. Values declared in the sample schema (see data_schema) are loaded as their declared dtype.
+
+    Args:
+        log_dir (str): the log directory
+        max_level (int, optional): how many levels of nested values to flatten into columns of their own, see
+            json_normalize. Defaults to flattening all of them.
+        columns ([str], optional): only load these (top level) values of each sample. Defaults to all of them.
+
+    Returns:
+        (pandas.DataFrame, [dict]): the flattened samples and the samples as they were logged
+    """
+    from experiment_impact_tracker import columnar_log
 
+    if columnar_log.has_log(log_dir):
+        return columnar_log.load_data_into_frame(
+            log_dir, max_level=max_level, columns=columns
+        )
+
+    from experiment_impact_tracker.data_schema import build_frame
 
-def load_data_into_frame(log_dir, max_level=None):
     data_path = safe_file_path(os.path.join(log_dir, DATAPATH))
     json_array = _read_json_file(data_path)
-    return json_normalize(json_array, max_level=max_level), json_array
+    if columns is not None:
+        json_array = [
+            {key: sample[key] for key in columns if key in sample}
+            for sample in json_array
+        ]
+    # declared values go straight into arrays of their dtype, see data_schema
+    return build_frame(json_array, max_level=max_level), json_array
+
+
+def iter_samples(log_dir, columns=None):
+    """Yields the samples of a log directory one at a time as they were logged, reading the log as it goes rather
+    than all at once.
+
+    Args:
+        log_dir (str): the log directory
+        columns ([str], optional): only load these (top level) values of each sample. Defaults to all of them.
+
+    Yields:
+        dict: a sample
+    """
+    from experiment_impact_tracker import columnar_log
+
+    if columnar_log.has_log(log_dir):
+        yield from columnar_log.iter_samples(log_dir, columns=columns)
+        return
+
+    with open(os.path.join(log_dir, DATAPATH), "r") as f:
+        for line in f:
+            sample = json.loads(line)
+            if columns is not None:
+                sample = {key: sample[key] for key in columns if key in sample}
+            yield sample
+
+
+def iter_data_frames(log_dir, chunk_size=None, columns=None, max_level=None):
+    """Loads the samples of a log directory a chunk at a time, so how much memory it takes doesn't grow with the
+    length of the log. The chunks are the frames load_data_into_frame would return for those samples, indexed by
+    the position of the samples in the whole log. Samples that don't have a value in the chunk they're in have nan
+    there, chunks can have different columns when a value isn't logged throughout.
+
+    Args:
+        log_dir (str): the log directory
+        chunk_size (int, optional): how many samples each chunk has, all but the last one. Defaults to
+            DATA_CHUNK_SIZE.
+        columns ([str], optional): only load these (top level) values of each sample. Defaults to all of them.
+        max_level (int, optional): how many levels of nested values to flatten, see load_data_into_frame. Defaults
+            to flattening all of them.
+
+    Yields:
+        pandas.DataFrame: the next chunk_size samples
+    """
+    import pandas as pd
+
+    from experiment_impact_tracker import columnar_log
+    from experiment_impact_tracker.data_schema import build_frame
+
+    chunk_size = DATA_CHUNK_SIZE if chunk_size is None else chunk_size
+    if chunk_size < 1:
+        raise ValueError("chunk_size has to be at least 1, got {}".format(chunk_size))
+    if columnar_log.has_log(log_dir):
+        frames = columnar_log.iter_data_frames(
+            log_dir, chunk_size, columns=columns, max_level=max_level
+        )
+    else:
+        frames = (
+            build_frame(samples, max_level=max_level)
+            for samples in _chunked(iter_samples(log_dir, columns), chunk_size)
+        )
+
+    start = 0
+    for frame in frames:
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        start += len(frame)
+        yield frame
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 def log_final_info(log_dir):
@@ -60,10 +188,218 @@ def write_json_data_to_file(file_path, data, overwrite=False):
         outfile.write(json.dumps(data) + "\n")
 
 
+class BufferedRecordWriter(object):
+    """Base class for the writers of the sample log, which buffer records and write them out in batches.
+
+    Opening and closing the log for every record is a metadata round trip to the server on network file systems
+    (NFS, Lustre, ...). Records are buffered instead and written out once max_records or max_bytes are buffered or
+    the oldest one has waited max_interval seconds, checked whenever a record is added. Records still buffered are
+    written out by flush and close. Subclasses encode records and write batches of them out.
+
+    Args:
+        max_records (int, optional): write out once this many records are buffered. Defaults to DATA_FLUSH_RECORDS.
+        max_bytes (int, optional): write out once the buffered records take this many bytes (as json). Defaults to
+            DATA_FLUSH_BYTES.
+        max_interval (float, optional): write out once the oldest buffered record is this old, in seconds. Defaults
+            to DATA_FLUSH_INTERVAL.
+        fsync (str, optional): FSYNC_NEVER to leave it to the OS when the data reaches the disk, FSYNC_ON_FLUSH to
+            fsync every time records are written out or FSYNC_ON_CLOSE to fsync once when closing. Defaults to
+            DATA_FSYNC.
+        sample_schema (data_schema.SampleSchema, optional): coerce records to this schema before writing them.
+            Defaults to writing them as they are.
+    """
+
+    def __init__(
+        self,
+        max_records=None,
+        max_bytes=None,
+        max_interval=None,
+        fsync=None,
+        sample_schema=None,
+    ):
+        self.max_records = DATA_FLUSH_RECORDS if max_records is None else max_records
+        self.max_bytes = DATA_FLUSH_BYTES if max_bytes is None else max_bytes
+        self.max_interval = (
+            DATA_FLUSH_INTERVAL if max_interval is None else max_interval
+        )
+        self.fsync = DATA_FSYNC if fsync is None else fsync
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(
+                "Unknown fsync policy {}, expected one of {}".format(
+                    self.fsync, FSYNC_POLICIES
+                )
+            )
+        self.sample_schema = sample_schema
+        self.closed = False
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._oldest = None
+
+    def _encode(self, data):
+        """
+        Returns:
+            (object, int): what to buffer for the record and its size in bytes
+        """
+        raise NotImplementedError
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _sync(self, fsync):
+        """Pushes what was written out to the OS, and to the disk if fsync is True."""
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def write(self, data):
+        """Buffers a record, writing out the buffer if it reached one of the limits.
+
+        Args:
+            data (dict): json serializable record
+        """
+        if self.closed:
+            raise ValueError("write to closed {}".format(type(self).__name__))
+        if self.sample_schema is not None:
+            data = self.sample_schema.coerce(data)
+        encoded, size = self._encode(data)
+        if not self._buffer:
+            self._oldest = time.monotonic()
+        self._buffer.append(encoded)
+        self._buffered_bytes += size
+        if (
+            len(self._buffer) >= self.max_records
+            or self._buffered_bytes >= self.max_bytes
+            or time.monotonic() - self._oldest >= self.max_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Writes out the buffered records."""
+        if self.closed:
+            return
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+            self._buffered_bytes = 0
+            self._oldest = None
+        self._sync(self.fsync == FSYNC_ON_FLUSH)
+
+    def close(self):
+        """Writes out the buffered records and closes the log, closing again does nothing."""
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if self.fsync == FSYNC_ON_CLOSE:
+                self._sync(True)
+        finally:
+            self.closed = True
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class JSONLinesWriter(BufferedRecordWriter):
+    """Appends json records to a file that stays open, one per line, see BufferedRecordWriter.
+
+    Args:
+        file_path (str): the file to append to, its directory is created if needed
+    """
+
+    def __init__(self, file_path, **kwargs):
+        super(JSONLinesWriter, self).__init__(**kwargs)
+        self.file_path = file_path
+        self._file = open(safe_file_path(file_path), "ab")
+
+    def _encode(self, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        return line, len(line)
+
+    def _write_batch(self, batch):
+        self._file.write(b"".join(batch))
+
+    def _sync(self, fsync):
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+
+def check_data_format(data_format=None):
+    """Makes sure samples can be logged in a format, so a bad format fails right away rather than in the monitor.
+
+    Args:
+        data_format (str, optional): FORMAT_JSON or FORMAT_ARROW. Defaults to DATA_FORMAT.
+
+    Raises:
+        ValueError: If the format isn't one of DATA_FORMATS.
+        ImportError: If the format is FORMAT_ARROW and pyarrow isn't installed.
+
+    Returns:
+        str: the format
+    """
+    data_format = DATA_FORMAT if data_format is None else data_format
+    if data_format not in DATA_FORMATS:
+        raise ValueError(
+            "Unknown data format {}, expected one of {}".format(
+                data_format, DATA_FORMATS
+            )
+        )
+    if data_format == FORMAT_ARROW:
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(
+                "Logging samples in the {} format needs pyarrow, install it or use the {} format.".format(
+                    FORMAT_ARROW, FORMAT_JSON
+                )
+            )
+    return data_format
+
+
+def get_data_writer(log_dir, data_format=None, **kwargs):
+    """Opens the sample log of a log directory for writing.
+
+    Args:
+        log_dir (str): the log directory
+        data_format (str, optional): FORMAT_JSON for data.json or FORMAT_ARROW for the columnar log (see
+            columnar_log, needs pyarrow). Defaults to DATA_FORMAT.
+        kwargs: passed on to the writer, see BufferedRecordWriter
+
+    Returns:
+        BufferedRecordWriter: the writer
+    """
+    data_format = check_data_format(data_format)
+    if data_format == FORMAT_ARROW:
+        from experiment_impact_tracker.columnar_log import ArrowLogWriter
+
+        return ArrowLogWriter(os.path.join(log_dir, ARROWPATH), **kwargs)
+    return JSONLinesWriter(os.path.join(log_dir, DATAPATH), **kwargs)
+
+
 def zip_data_and_info(log_dir, zip_path):
+    from experiment_impact_tracker import columnar_log
+
     info_path = safe_file_path(os.path.join(log_dir, INFOPATH))
     data_path = safe_file_path(os.path.join(log_dir, DATAPATH))
-    zip_files([info_path, data_path], zip_path)
+    src = [info_path, data_path]
+    arcname = [os.path.basename(path) for path in src]
+    for part_path in columnar_log.get_part_paths(log_dir):
+        src.append(part_path)
+        arcname.append(
+            os.path.join(
+                os.path.basename(os.path.dirname(part_path)),
+                os.path.basename(part_path),
+            )
+        )
+    zip_files(src, zip_path, arcname=arcname)
     return zip_path
 
 
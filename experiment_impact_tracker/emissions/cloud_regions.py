@@ -0,0 +1,126 @@
+"""Emission zones and carbon intensities of cloud provider regions.
+
+The zone of every region of every provider is found in one vectorized lookup (see get_region_metrics.ZoneIndex) and
+kept in a table shipped with the package (data/cloud_regions.json), keyed by "provider/region", e.g. "aws/us-east-1".
+Looking a region up in the table doesn't need the zone geometries. Rebuild it after updating the region files or the
+zone data with:
+
+    lookup-cloud-region-info all --output experiment_impact_tracker/emissions/data/cloud_regions.json
+"""
+import csv
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+import ujson as json
+
+from . import constants
+from .get_region_metrics import get_regions_by_coords
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+TABLE_PATH = os.path.join(DATA_DIR, "cloud_regions.json")
+PROVIDERS = ("aws", "azure", "gcp")
+
+
+def _read_semicolon_csv(filename):
+    with open(os.path.join(DATA_DIR, filename), "rt") as f:
+        rows = [row for row in csv.reader(f, delimiter=";") if row]
+    # name, city, latitude, longitude
+    return [(row[0], float(row[2]), float(row[3])) for row in rows]
+
+
+def get_provider_regions(provider):
+    """Reads the locations of a cloud provider's regions from the package data.
+
+    Args:
+        provider (str): one of PROVIDERS
+
+    Returns:
+        [(str, float, float)]: region name, latitude and longitude of each region
+    """
+    if provider == "aws":
+        return _read_semicolon_csv("aws_regions.csv")
+    if provider == "gcp":
+        return _read_semicolon_csv("gcp_regions.csv")
+    if provider == "azure":
+        with open(os.path.join(DATA_DIR, "azure_regions.json"), "rb") as f:
+            return [
+                (region["name"], float(region["latitude"]), float(region["longitude"]))
+                for region in json.load(f)
+            ]
+    raise ValueError("region not supported")
+
+
+def resolve_cloud_regions(providers=PROVIDERS):
+    """Finds the zones of all regions of the given providers in one lookup.
+
+    Args:
+        providers ([str], optional): providers to resolve. Defaults to all of PROVIDERS.
+
+    Returns:
+        OrderedDict: "provider/region" to a dict with the provider, region, latitude, longitude, zone_id,
+            carbon_intensity (g CO2eq/kWh) and carbon_intensity_source, the last three None if the region isn't in
+            any zone
+    """
+    regions = [
+        (provider, name, latitude, longitude)
+        for provider in providers
+        for name, latitude, longitude in get_provider_regions(provider)
+    ]
+    zones = get_regions_by_coords(
+        [(latitude, longitude) for _, _, latitude, longitude in regions]
+    )
+
+    table = OrderedDict()
+    for (provider, name, latitude, longitude), zone in zip(regions, zones):
+        zone_info = constants.ZONE_INFO[zone["id"]] if zone is not None else {}
+        table["{}/{}".format(provider, name)] = {
+            "provider": provider,
+            "region": name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "zone_id": zone["id"] if zone is not None else None,
+            "carbon_intensity": zone_info.get("carbonIntensity"),
+            "carbon_intensity_source": zone_info.get("_source"),
+        }
+    return table
+
+
+def write_table(table, path=TABLE_PATH):
+    with open(path, "w") as f:
+        json.dump(table, f, indent=2, escape_forward_slashes=False)
+        f.write("\n")
+
+
+@lru_cache(maxsize=1)
+def load_table(path=TABLE_PATH):
+    """
+    Returns:
+        dict: the precomputed table, see resolve_cloud_regions
+    """
+    with open(path, "rt") as f:
+        return json.load(f)
+
+
+def get_cloud_region_info(cloud_region):
+    """Looks up a cloud region in the precomputed table.
+
+    Args:
+        cloud_region (str): "provider/region", e.g. "aws/us-east-1" or "gcp/europe-west4"
+
+    Raises:
+        ValueError: If the region isn't in the table or in any zone.
+
+    Returns:
+        dict: see resolve_cloud_regions
+    """
+    info = load_table().get(cloud_region.strip().lower())
+    if info is None:
+        raise ValueError(
+            "Unknown cloud region {}, expected provider/region, e.g. aws/us-east-1.".format(
+                cloud_region
+            )
+        )
+    if info["zone_id"] is None:
+        raise ValueError("Cloud region {} isn't in any zone.".format(cloud_region))
+    return info
@@ -1,8 +1,13 @@
+from importlib import import_module
+
 import numpy
 
-import experiment_impact_tracker.emissions.us_ca_parser as us_ca_parser
+# parsers are imported on first use since they pull in pandas, requests and bs4
+REALTIME_REGIONS = {"US-CA": "experiment_impact_tracker.emissions.us_ca_parser"}
+
 
-REALTIME_REGIONS = {"US-CA": us_ca_parser}
+def _get_realtime_parser(region):
+    return import_module(REALTIME_REGIONS[region])
 
 
 def is_capable_realtime_carbon_intensity(*args, region=None, **kwargs):
@@ -10,14 +15,14 @@ def is_capable_realtime_carbon_intensity(*args, region=None, **kwargs):
 
 
 def get_realtime_carbon_source(region):
-    return REALTIME_REGIONS[region].get_realtime_carbon_source()
+    return _get_realtime_parser(region).get_realtime_carbon_source()
 
 
 def get_realtime_carbon(*args, **kwargs):
     if "region" not in kwargs:
         raise ValueError("region was not passed to function")
     try:
-        carbon_intensity = REALTIME_REGIONS[kwargs["region"]].fetch_supply()[0][
+        carbon_intensity = _get_realtime_parser(kwargs["region"]).fetch_supply()[0][
             "carbon_intensity"
         ]
         if numpy.isnan(carbon_intensity):
@@ -1,9 +1,13 @@
+"""Data about emission regions and the carbon intensity of their electricity.
+
+The zone geometries and tables are large, so they are only loaded from the package data on first access (e.g.,
+constants.ZONE_INFO) rather than whenever a module imports this one. PUE is read from the environment right away.
+"""
 import os
+import threading
 
 import numpy as np
 import ujson as json
-from progiter import ProgIter
-from shapely.geometry import shape
 
 
 def read_terrible_json(path):
@@ -16,6 +20,8 @@ def read_terrible_json(path):
     Returns:
         [dict]: list of dictionaries
     """
+    from progiter import ProgIter
+
     with open(path, "rt") as f:
         lines = []
         test_read_lines = [x for x in f.readlines()]
@@ -51,20 +57,22 @@ def _load_zone_names():
     return x
 
 
-def load_regions_with_bounding_boxes():
-    """Loads bounding boxes as shapely objects.
+def load_regions_from_json(path):
+    """Loads the zone geometry json and converts the geometries to shapely objects.
+
+    Args:
+        path (string): the filepath to read from
 
     Returns:
         list: list of shapely objects containing regional geometries
     """
+    from shapely.geometry import shape
+
     print(
         "loading region bounding boxes for computing carbon emissions region, this may take a moment..."
     )
 
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    all_geoms = []
-    # with open('data/zone_geometries.json') as f:
-    all_geoms = read_terrible_json(os.path.join(dir_path, "data/zonegeometries.json"))
+    all_geoms = read_terrible_json(path)
 
     for i, geom in enumerate(all_geoms):
         all_geoms[i]["geometry"] = shape(geom["geometry"])
@@ -72,7 +80,45 @@ def load_regions_with_bounding_boxes():
     return all_geoms
 
 
+def load_regions_with_bounding_boxes():
+    """Loads bounding boxes as shapely objects.
+
+    Uses the compiled zone_geometry_cache when it is up to date with the json, otherwise loads the json and
+    rebuilds the cache for next time.
+
+    Returns:
+        list: list of shapely objects containing regional geometries
+    """
+    from experiment_impact_tracker.emissions import zone_geometry_cache
+
+    source_path = zone_geometry_cache.SOURCE_PATH
+    all_geoms = zone_geometry_cache.load(source_path)
+    if all_geoms is None:
+        all_geoms = load_regions_from_json(source_path)
+        zone_geometry_cache.save(all_geoms, source_path)
+    return all_geoms
+
+
 PUE = float(os.getenv("OVERRIDE_PUE", 1.58))
-REGIONS_WITH_BOUNDING_BOXES = load_regions_with_bounding_boxes()
-ZONE_INFO = _load_zone_info()["fallbackZoneMixes"]
-ZONE_NAMES = _load_zone_names()
+
+_LAZY_CONSTANTS = {
+    "REGIONS_WITH_BOUNDING_BOXES": load_regions_with_bounding_boxes,
+    "ZONE_INFO": lambda: _load_zone_info()["fallbackZoneMixes"],
+    "ZONE_NAMES": _load_zone_names,
+}
+_lazy_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Loads REGIONS_WITH_BOUNDING_BOXES, ZONE_INFO and ZONE_NAMES the first time they are accessed."""
+    if name not in _LAZY_CONSTANTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    # startup gathers info from several threads, only load once
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = _LAZY_CONSTANTS[name]()
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_CONSTANTS))
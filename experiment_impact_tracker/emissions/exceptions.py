@@ -0,0 +1,4 @@
+class RegionResolutionError(Exception):
+    """An exception that occurs when the region this host is in can't be determined."""
+
+    pass
@@ -1,34 +1,133 @@
 import time
 from functools import lru_cache
 
-from shapely.geometry import Point
+import numpy as np
 
-from .constants import REGIONS_WITH_BOUNDING_BOXES, ZONE_INFO, ZONE_NAMES
+from . import constants
+
+
+class ZoneIndex(object):
+    """An R-tree over the zone geometries so finding the zone of a coordinate is a bounding box query plus exact
+    tests against the few zones it returns, rather than testing every zone.
+
+    Args:
+        zones ([dict]): zones with their shapely geometry, e.g. REGIONS_WITH_BOUNDING_BOXES
+    """
+
+    def __init__(self, zones):
+        import shapely
+        from shapely.strtree import STRtree
+
+        self.zones = zones
+        self.geometries = np.array([zone["geometry"] for zone in zones], dtype=object)
+        # prepared geometries make the exact tests much cheaper
+        shapely.prepare(self.geometries)
+        self.areas = shapely.area(self.geometries)
+        self.tree = STRtree(self.geometries)
+
+    def lookup(self, coords):
+        """Finds the zones of many coordinates at once.
+
+        Args:
+            coords ([(float, float)]): (latitude, longitude) pairs
+
+        Returns:
+            np.ndarray: for each coordinate the index of the smallest zone containing it, -1 if there is none
+        """
+        import shapely
+
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        lat, lon = coords[:, 0], coords[:, 1]
+        points = shapely.points(lon, lat)
+        # pairs of (coordinate, zone) whose bounding boxes intersect
+        coord_ids, zone_ids = self.tree.query(points)
+        contained = shapely.contains_xy(
+            self.geometries[zone_ids], lon[coord_ids], lat[coord_ids]
+        )
+        coord_ids, zone_ids = coord_ids[contained], zone_ids[contained]
+
+        # zones can overlap (e.g. a country and its regions), use the most specific one
+        order = np.lexsort((self.areas[zone_ids], coord_ids))
+        coord_ids, zone_ids = coord_ids[order], zone_ids[order]
+        first = np.unique(coord_ids, return_index=True)[1]
+        results = np.full(len(coords), -1, dtype=np.int64)
+        results[coord_ids[first]] = zone_ids[first]
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_zone_index():
+    """Builds the ZoneIndex for REGIONS_WITH_BOUNDING_BOXES once."""
+    return ZoneIndex(constants.REGIONS_WITH_BOUNDING_BOXES)
 
 
 def get_zone_information_by_coords(coords):
     region = get_region_by_coords(coords)
-    return region, ZONE_INFO[region["id"]]
+    return region, constants.ZONE_INFO[region["id"]]
 
 
 def get_region_by_coords(coords):
-    # TODO: automatically narrow down possibilities
-    lat, lon = coords
-    point = Point(lon, lat)
-    zone_possibilities = []
-    for zone in REGIONS_WITH_BOUNDING_BOXES:
-        try:
-            if zone["geometry"].contains(point):
-                zone_possibilities.append(zone)
-        except:
-            import pdb
-
-            pdb.set_trace()
-    if len(zone_possibilities) == 0:
+    region = get_regions_by_coords([coords])[0]
+    if region is None:
         raise ValueError("No possibilities found, may need to add a zone.")
+    return region
+
 
-    z = min(zone_possibilities, key=lambda x: x["geometry"].area)
-    return z
+def get_region_by_id(zone_id):
+    """Gets a zone by its id without loading the zone geometries, which are only needed to find the zone of a
+    coordinate.
+
+    Args:
+        zone_id (str): e.g. "US-CA"
+
+    Raises:
+        ValueError: If there is no carbon intensity information for the zone.
+
+    Returns:
+        dict: the zone like REGIONS_WITH_BOUNDING_BOXES has it, but with None as its geometry
+    """
+    if zone_id not in constants.ZONE_INFO:
+        raise ValueError("Unknown zone {}.".format(zone_id))
+    return {
+        "type": "Feature",
+        "id": zone_id,
+        "properties": {"zoneName": zone_id},
+        "geometry": None,
+    }
+
+
+def get_regions_by_coords(coords_list):
+    """Finds the zones of many coordinates in one call.
+
+    Args:
+        coords_list ([(float, float)]): (latitude, longitude) pairs
+
+    Returns:
+        [dict]: the zone for each coordinate, None for coordinates outside of every zone
+    """
+    index = get_zone_index()
+    return [
+        index.zones[zone_id] if zone_id >= 0 else None
+        for zone_id in index.lookup(coords_list)
+    ]
+
+
+def get_zone_information_by_coords_list(coords_list):
+    """Like get_zone_information_by_coords for many coordinates in one call.
+
+    Args:
+        coords_list ([(float, float)]): (latitude, longitude) pairs
+
+    Returns:
+        [(dict, dict)]: the zone and its carbon intensity information for each coordinate, (None, None) for
+            coordinates outside of every zone
+    """
+    return [
+        (region, constants.ZONE_INFO[region["id"]])
+        if region is not None
+        else (None, None)
+        for region in get_regions_by_coords(coords_list)
+    ]
 
 
 def get_current_location():
@@ -44,7 +143,10 @@ def get_current_region_info(*args, **kwargs):
 
 
 def get_zone_name_by_id(zone_id):
-    zone = ZONE_NAMES["zoneShortName"][zone_id]
+    zone = constants.ZONE_NAMES["zoneShortName"].get(zone_id)
+    if zone is None:
+        # e.g. the unknown region of a host that couldn't be located
+        return zone_id
     name = zone["zoneName"]
     if "countryName" in zone:
         name += ", {}".format(zone["countryName"])
@@ -52,7 +154,9 @@ def get_zone_name_by_id(zone_id):
 
 
 def get_sorted_region_infos():
-    zone_infos = [(key, value["carbonIntensity"]) for key, value in ZONE_INFO.items()]
+    zone_infos = [
+        (key, value["carbonIntensity"]) for key, value in constants.ZONE_INFO.items()
+    ]
     return sorted(zone_infos, key=lambda x: x[1])
 
 
@@ -62,4 +166,13 @@ def get_ttl_hash(seconds=3600):
 
 
 def get_current_region_info_cached():
-    return get_current_region_info(ttl_hash=get_ttl_hash(seconds=60 * 60))
+    """Gets the region this host is in and its carbon intensity information without looking it up every time, see
+    region_resolver for how.
+
+    Returns:
+        (dict, dict): the zone and its carbon intensity information
+    """
+    from .region_resolver import resolve_region
+
+    resolution = resolve_region()
+    return resolution["region"], resolution["zone_info"]
@@ -0,0 +1,215 @@
+"""Figures out which emission region (zone) this host is in without hitting the network on every tracker start.
+
+In order, the region comes from:
+
+1. an explicit override, either passed in (e.g. ImpactTracker(logdir, region="US-CA")) or set in OVERRIDE_REGION, as
+   a zone id, a cloud region (e.g. "aws/us-east-1", see cloud_regions) or "latitude,longitude". Nothing is looked
+   up, so this works on air-gapped nodes.
+2. a previous lookup on this host, kept in the host cache (see host_cache) under the host's network addresses for
+   REGION_CACHE_TTL seconds, so moving the machine to another network looks the region up again.
+3. geolocating the host's public IP, with a timeout of REGION_LOOKUP_TIMEOUT seconds.
+4. if that fails too (e.g. the host is offline), an unknown region with UNKNOWN_REGION_CARBON_INTENSITY as its
+   carbon intensity, so the tracker still starts. This is logged as a warning and not cached on disk, so the next
+   process looks the region up again.
+
+Which one was used is recorded with the region, e.g. as region_resolution_source in info.pkl.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+
+import psutil
+
+from experiment_impact_tracker.operating_system import host_cache
+
+from . import constants
+from .cloud_regions import get_cloud_region_info
+from .exceptions import RegionResolutionError
+from .get_region_metrics import get_region_by_coords, get_region_by_id
+
+# How long (in seconds) a looked up region is reused on the same host and network
+REGION_CACHE_TTL = float(os.getenv("OVERRIDE_REGION_CACHE_TTL", 7 * 24 * 60 * 60))
+# How long (in seconds) to wait for the IP geolocation service
+REGION_LOOKUP_TIMEOUT = float(os.getenv("OVERRIDE_REGION_LOOKUP_TIMEOUT", 5))
+
+SOURCE_OVERRIDE = "override"
+SOURCE_CACHE = "cache"
+SOURCE_IP_LOOKUP = "ip_lookup"
+SOURCE_UNKNOWN = "unknown"
+
+UNKNOWN_ZONE_ID = "UNKNOWN"
+# Carbon intensity (gCO2eq/kWh) assumed when the region can't be resolved, roughly the world average
+UNKNOWN_REGION_CARBON_INTENSITY = float(
+    os.getenv("OVERRIDE_UNKNOWN_REGION_CARBON_INTENSITY", 475.0)
+)
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_resolutions = {}
+
+
+def get_network_addresses():
+    """
+    Returns:
+        [str]: the host's addresses, other than loopback and link-local ones, sorted
+    """
+    addresses = set()
+    for interface_addresses in psutil.net_if_addrs().values():
+        for address in interface_addresses:
+            if address.family not in (socket.AF_INET, socket.AF_INET6):
+                continue
+            ip = address.address.split("%")[0]
+            if ip.startswith(("127.", "169.254.", "fe80:")) or ip == "::1":
+                continue
+            addresses.add(ip)
+    return sorted(addresses)
+
+
+def parse_region_override(override):
+    """Parses a region override.
+
+    Args:
+        override (str or (float, float)): a zone id (e.g. "US-CA"), a cloud region (e.g. "aws/us-east-1"),
+            "latitude,longitude" or a (latitude, longitude) pair
+
+    Returns:
+        (str, (float, float)): the zone id or None, and the coordinates or None
+    """
+    if isinstance(override, (tuple, list)):
+        latitude, longitude = override
+        return None, (float(latitude), float(longitude))
+    parts = override.split(",")
+    if len(parts) == 2:
+        try:
+            return None, (float(parts[0]), float(parts[1]))
+        except ValueError:
+            pass
+    if "/" in override:
+        return get_cloud_region_info(override)["zone_id"], None
+    return override.strip(), None
+
+
+def lookup_location(timeout=None):
+    """Geolocates the host's public IP.
+
+    Raises:
+        RegionResolutionError: If the location can't be looked up, e.g. there is no network.
+
+    Returns:
+        (float, float): latitude and longitude
+    """
+    import geocoder
+
+    timeout = REGION_LOOKUP_TIMEOUT if timeout is None else timeout
+    try:
+        location = geocoder.ip("me", timeout=timeout)
+    except Exception as e:
+        raise RegionResolutionError(
+            "Couldn't look up the location of this host: {}".format(e)
+        )
+    if not location.ok or location.latlng is None:
+        raise RegionResolutionError(
+            "Couldn't look up the location of this host ({}), set OVERRIDE_REGION to a zone id, a cloud region "
+            'or "latitude,longitude" to skip the lookup.'.format(location.status)
+        )
+    latitude, longitude = location.latlng
+    return float(latitude), float(longitude)
+
+
+def _get_cache_name():
+    addresses = "|".join(get_network_addresses())
+    return "region-" + hashlib.sha1(addresses.encode("utf-8")).hexdigest()
+
+
+def get_unknown_region():
+    """
+    Returns:
+        dict: the resolution used when the region can't be looked up, see resolve_region
+    """
+    return {
+        "region": {"id": UNKNOWN_ZONE_ID, "geometry": None, "properties": {}},
+        "zone_info": {
+            "carbonIntensity": UNKNOWN_REGION_CARBON_INTENSITY,
+            "_source": "assumed world average, the region couldn't be resolved",
+        },
+        "source": SOURCE_UNKNOWN,
+        "coordinates": None,
+    }
+
+
+def _resolve(override=None, refresh=False):
+    coordinates = None
+    if override is not None:
+        zone_id, coordinates = parse_region_override(override)
+        source = SOURCE_OVERRIDE
+    else:
+        looked_up = []
+
+        def _lookup():
+            latitude, longitude = lookup_location()
+            looked_up.append(True)
+            region = get_region_by_coords((latitude, longitude))
+            return {"zone_id": region["id"], "coordinates": [latitude, longitude]}
+
+        try:
+            cached = host_cache.get_cached(
+                _get_cache_name(), _lookup, max_age=REGION_CACHE_TTL, refresh=refresh
+            )
+        except RegionResolutionError as e:
+            log.warning(
+                "%s Assuming an unknown region with a carbon intensity of %s gCO2eq/kWh.",
+                e,
+                UNKNOWN_REGION_CARBON_INTENSITY,
+            )
+            return get_unknown_region()
+        zone_id, coordinates = cached["zone_id"], tuple(cached["coordinates"])
+        source = SOURCE_IP_LOOKUP if looked_up else SOURCE_CACHE
+
+    if zone_id is not None:
+        region = get_region_by_id(zone_id)
+    else:
+        region = get_region_by_coords(coordinates)
+
+    return {
+        "region": region,
+        "zone_info": constants.ZONE_INFO[region["id"]],
+        "source": source,
+        "coordinates": coordinates,
+    }
+
+
+def resolve_region(override=None, refresh=False):
+    """Finds the region this host is in, see the module documentation for how.
+
+    Resolutions are kept for the rest of the process, including falling back to get_unknown_region() when the
+    lookup fails, so startup only waits for the lookup once. Pass refresh=True to try again.
+
+    Args:
+        override (str or (float, float), optional): a zone id, cloud region, "latitude,longitude" or a (latitude,
+            longitude) pair to use rather than looking the region up. Defaults to OVERRIDE_REGION if it is set.
+        refresh (bool, optional): look the region up again even if it was resolved before. Defaults to False.
+
+    Raises:
+        ValueError: If the override isn't a known zone or the coordinates aren't in any zone.
+
+    Returns:
+        dict: region (the zone), zone_info (its carbon intensity information), source (one of SOURCE_OVERRIDE,
+            SOURCE_CACHE, SOURCE_IP_LOOKUP and SOURCE_UNKNOWN) and coordinates (or None if the override was a zone id)
+    """
+    if override is None:
+        override = os.getenv("OVERRIDE_REGION") or None
+    key = tuple(override) if isinstance(override, list) else override
+    # initial info is gathered from several threads, only resolve once
+    with _lock:
+        if refresh or key not in _resolutions:
+            _resolutions[key] = _resolve(override, refresh=refresh)
+        return _resolutions[key]
+
+
+def clear_resolutions():
+    """Forgets the regions resolved in this process, the on-disk cache is left alone."""
+    with _lock:
+        _resolutions.clear()
@@ -0,0 +1,204 @@
+"""A compiled copy of the zone geometry dataset (data/zonegeometries.json) that loads in milliseconds.
+
+Parsing the GeoJSON lines and building shapely objects from them takes seconds. The cache stores every geometry as
+WKB back to back in a single file, behind a small json header with the zone ids and properties, and is memory-mapped
+when loading so shapely parses the geometries straight from the page cache.
+
+The header records the size and modification time of the json it was built from. A cache that doesn't match the
+json (or was written by a different version of this module) is ignored, the json is loaded instead and the cache is
+rebuilt. It can also be built ahead of time, e.g. when installing into a read-only environment:
+
+    python -m experiment_impact_tracker.emissions.zone_geometry_cache
+"""
+import argparse
+import mmap
+import os
+import struct
+
+import ujson as json
+
+from experiment_impact_tracker.operating_system import host_cache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+SOURCE_PATH = os.path.join(DATA_DIR, "zonegeometries.json")
+CACHE_FILENAME = "zonegeometries.bin"
+
+FORMAT_VERSION = 1
+_MAGIC = b"EITZONES"
+# magic, format version, header length
+_PREAMBLE = struct.Struct("<8sIQ")
+
+
+def get_cache_paths():
+    """
+    Returns:
+        [str]: where the cache is looked for and written to, in order. Next to the json in the package, then in the
+            host cache directory (see host_cache) for read-only installs. OVERRIDE_ZONE_GEOMETRY_CACHE replaces both.
+    """
+    override = os.getenv("OVERRIDE_ZONE_GEOMETRY_CACHE")
+    if override:
+        return [override]
+    paths = [os.path.join(DATA_DIR, CACHE_FILENAME)]
+    cache_dir = host_cache.get_cache_dir()
+    if cache_dir is not None:
+        paths.append(os.path.join(cache_dir, CACHE_FILENAME))
+    return paths
+
+
+def _get_source_stamp(source_path):
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write(zones, cache_path, source_path=SOURCE_PATH):
+    """Writes the cache for zones loaded from source_path.
+
+    Args:
+        zones ([dict]): zones with their shapely geometry, as load_regions_with_bounding_boxes returns them
+        cache_path (str): where to write the cache
+        source_path (str, optional): the json the zones were loaded from. Defaults to the one in the package.
+
+    Raises:
+        OSError: If the cache can't be written.
+    """
+    import shapely
+
+    blobs = shapely.to_wkb([zone["geometry"] for zone in zones])
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    header = json.dumps(
+        {
+            "source": _get_source_stamp(source_path),
+            "offsets": offsets,
+            # geometries are filled back in when reading, keeping the keys in the same order
+            "zones": [
+                {
+                    key: None if key == "geometry" else value
+                    for key, value in zone.items()
+                }
+                for zone in zones
+            ],
+        }
+    ).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(_MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            f.writelines(blobs)
+        # so concurrent readers never see a partial file
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read(cache_path, source_path=SOURCE_PATH):
+    """Loads the zones from the cache.
+
+    Args:
+        cache_path (str): the cache to load
+        source_path (str, optional): the json the cache has to match. Defaults to the one in the package.
+
+    Returns:
+        [dict]: zones with their shapely geometry, or None if there is no cache or it doesn't match source_path
+    """
+    import shapely
+
+    try:
+        f = open(cache_path, "rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+    with data:
+        if len(data) < _PREAMBLE.size:
+            return None
+        magic, version, header_length = _PREAMBLE.unpack_from(data)
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            return None
+        try:
+            start = _PREAMBLE.size + header_length
+            header = json.loads(data[_PREAMBLE.size : start])
+            if header["source"] != _get_source_stamp(source_path):
+                return None
+            offsets = header["offsets"]
+            if len(data) != start + offsets[-1]:
+                return None
+            blobs = [
+                data[start + begin : start + end]
+                for begin, end in zip(offsets[:-1], offsets[1:])
+            ]
+        except (ValueError, KeyError, OSError):
+            return None
+
+    zones = header["zones"]
+    for zone, geometry in zip(zones, shapely.from_wkb(blobs)):
+        zone["geometry"] = geometry
+    return zones
+
+
+def load(source_path=SOURCE_PATH):
+    """Loads the zones from the first cache that matches source_path.
+
+    Returns:
+        [dict]: zones with their shapely geometry, or None if no cache matches
+    """
+    for cache_path in get_cache_paths():
+        zones = read(cache_path, source_path)
+        if zones is not None:
+            return zones
+    return None
+
+
+def save(zones, source_path=SOURCE_PATH):
+    """Writes the cache to the first of get_cache_paths that is writable.
+
+    Returns:
+        str: where the cache was written, or None if it couldn't be written anywhere
+    """
+    for cache_path in get_cache_paths():
+        try:
+            write(zones, cache_path, source_path)
+            return cache_path
+        except OSError:
+            continue
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compiles the zone geometry dataset into a cache that loads quickly."
+    )
+    parser.add_argument("--source", default=SOURCE_PATH, help="the zone geometry json")
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="where to write the cache, defaults to the first writable of {}".format(
+            get_cache_paths()
+        ),
+    )
+    args = parser.parse_args()
+
+    from experiment_impact_tracker.emissions.constants import load_regions_from_json
+
+    zones = load_regions_from_json(args.source)
+    if args.output is not None:
+        write(zones, args.output, args.source)
+        cache_path = args.output
+    else:
+        cache_path = save(zones, args.source)
+        if cache_path is None:
+            raise OSError("None of {} is writable".format(get_cache_paths()))
+    print("Wrote {} zones to {}".format(len(zones), cache_path))
+
+
+if __name__ == "__main__":
+    main()
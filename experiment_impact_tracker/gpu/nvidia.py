@@ -1,6 +1,7 @@
 import atexit
 import re
 import subprocess
+import threading
 import time
 from collections import OrderedDict
 from io import StringIO
@@ -9,17 +10,36 @@ from xml.etree.ElementTree import fromstring
 
 import cpuinfo
 import numpy as np
-import pandas as pd
 import psutil
-import requests
-from bs4 import BeautifulSoup
 
+from experiment_impact_tracker.operating_system import host_cache
 from experiment_impact_tracker.utils import *
 
 from .exceptions import GPUAttributeAssertionError
+from .nvml import get_nvml_gpu_info, get_nvml_gpu_power, is_nvml_compatible
 
 _timer = getattr(time, "monotonic", time.time)
 
+# How long to wait for the first readings of a streaming nvidia-smi pmon, in seconds
+PMON_FIRST_READING_TIMEOUT = 10
+
+# the only fields we read per gpu and per process, see nvidia-smi --help-query-gpu and --help-query-compute-apps
+QUERY_GPU_FIELDS = (
+    "uuid",
+    "pstate",
+    "power.draw",
+    "utilization.gpu",
+    "utilization.memory",
+    "memory.total",
+    "memory.used",
+    "memory.free",
+    "name",
+)
+QUERY_COMPUTE_APPS_FIELDS = ("gpu_uuid", "pid", "used_memory", "process_name")
+
+# whether this nvidia-smi supports --query-gpu, None until we've tried
+_query_supported = None
+
 
 def is_nvidia_compatible(*args, **kwargs):
     """Check if this system supports nvidia tools required
@@ -30,6 +50,9 @@ def is_nvidia_compatible(*args, **kwargs):
     """
     from shutil import which
 
+    if is_nvml_compatible():
+        return True
+
     if which("nvidia-smi") is None:
         return False
 
@@ -48,10 +71,20 @@ def is_nvidia_compatible(*args, **kwargs):
 def get_gpu_info(*args, **kwargs):
     """Gathers general hardware information about an nvidia GPU
 
+    This doesn't change until the driver does, so it's cached per host, see host_cache.
+
     :param args:
     :param kwargs:
     :return:
     """
+    return [dict(gpu) for gpu in host_cache.get_cached("gpu_info", _probe_gpu_info)]
+
+
+def _probe_gpu_info():
+    if is_nvml_compatible():
+        # nvidia-smi might not even be installed
+        return get_nvml_gpu_info()
+
     p = Popen(["nvidia-smi", "-q", "-x"], stdout=PIPE)
     outs, errors = p.communicate()
     xml = fromstring(outs)
@@ -117,7 +150,189 @@ def _stringify_performance_states(state_dict):
     return "|".join("::".join(map(lambda x: str(x), z)) for z in state_dict.items())
 
 
-def get_nvidia_gpu_power(pid_list, logger=None, **kwargs):
+def _parse_pmon_line(columns, line):
+    """Parses one row of nvidia-smi pmon output.
+
+    Args:
+        columns ([str]): the column names from the header row, e.g. gpu, pid, type, sm, mem, enc, dec, command
+        line (str): the row
+
+    Returns:
+        ((int, int), dict): the (gpu, pid) the row is for and its numeric columns, with readings nvidia-smi didn't
+            have ("-") as 0. None if the row is a header or doesn't have a process.
+    """
+    if line.startswith("#"):
+        return None
+    values = line.split()
+    if len(values) < len(columns) - 1:
+        return None
+    values = dict(zip(columns, values))
+    try:
+        key = (int(values["gpu"]), int(values["pid"]))
+    except (KeyError, ValueError):
+        # an idle gpu shows up with "-" as the pid
+        return None
+    readings = {}
+    for column, value in values.items():
+        if column in ("gpu", "pid", "type", "command"):
+            continue
+        try:
+            readings[column] = float(value)
+        except ValueError:
+            readings[column] = 0.0
+    return key, readings
+
+
+class PmonStream(object):
+    """Runs a single `nvidia-smi pmon` for the whole experiment and parses its output as it is printed.
+
+    A reader thread keeps running sums of the per process readings for every (gpu, pid), so averages() returns the
+    average utilization since the previous call right away instead of relaunching nvidia-smi pmon for several
+    seconds and parsing its output every sample.
+    """
+
+    def __init__(self, delay=1):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._has_readings = threading.Condition(self._lock)
+        self._sums = {}
+        self._counts = {}
+        self._rows = 0
+        self._last_averages = None
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        self._process = subprocess.Popen(
+            ["nvidia-smi", "pmon", "-d", str(self.delay)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        self._thread = threading.Thread(
+            target=self._read, name="nvidia-smi-pmon-reader", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def _read(self):
+        columns = None
+        for line in self._process.stdout:
+            line = line.strip()
+            # nvidia-smi reprints the header every so often, with more processes or gpus the columns can change
+            if re.match(r"#\s*gpu\s", line):
+                columns = line.lstrip("#").split()
+                continue
+            if columns is None:
+                continue
+            row = _parse_pmon_line(columns, line)
+            if row is None:
+                continue
+            key, readings = row
+            with self._lock:
+                sums = self._sums.setdefault(key, {})
+                for column, value in readings.items():
+                    sums[column] = sums.get(column, 0.0) + value
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._rows += 1
+                self._has_readings.notify_all()
+
+    @property
+    def running(self):
+        return (
+            self._process is not None
+            and self._process.poll() is None
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    def averages(self, timeout=PMON_FIRST_READING_TIMEOUT):
+        """
+        Args:
+            timeout (float, optional): how long to wait for readings if there haven't been any yet
+
+        Returns:
+            dict: (gpu, pid) to the average of each pmon column (sm, mem, ...) since the last call. If there were no
+                new readings, the previous averages.
+        """
+        with self._lock:
+            if self._last_averages is None and self._rows == 0:
+                self._has_readings.wait_for(lambda: self._rows > 0, timeout=timeout)
+            if self._rows == 0:
+                return dict(self._last_averages or {})
+            averages = {
+                key: {
+                    column: total / self._counts[key] for column, total in sums.items()
+                }
+                for key, sums in self._sums.items()
+            }
+            self._sums = {}
+            self._counts = {}
+            self._rows = 0
+            self._last_averages = averages
+        return dict(averages)
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._process is not None:
+            self._process.stdout.close()
+
+
+class PmonMonitor(object):
+    # set while a PmonStream is running in this process, samples then come from its readings
+    stream = None
+
+    @classmethod
+    def streaming(cls):
+        return cls.stream is not None and cls.stream.running
+
+    @classmethod
+    def start_stream(cls, delay=1):
+        """Starts a single nvidia-smi pmon that runs until stop_stream, see PmonStream."""
+        if not cls.streaming():
+            cls.stream = PmonStream(delay=delay).start()
+        return cls.stream
+
+    @classmethod
+    def stop_stream(cls):
+        if cls.stream is not None:
+            cls.stream.stop()
+            cls.stream = None
+
+
+def _get_pmon_utilization_from_stream():
+    import pandas as pd
+
+    averages = PmonMonitor.stream.averages()
+    rows = [
+        dict(gpu=gpu, pid=pid, **readings) for (gpu, pid), readings in averages.items()
+    ]
+    columns = ["gpu", "pid", "sm", "mem", "enc", "dec"]
+    for row in rows:
+        columns.extend(column for column in row if column not in columns)
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _get_pmon_utilization():
+    """Gets the average utilization per gpu and process from nvidia-smi pmon.
+
+    Returns:
+        pd.DataFrame: gpu, pid and the average of every pmon reading (sm, mem, enc, dec, ...)
+    """
+    if PmonMonitor.streaming():
+        return _get_pmon_utilization_from_stream()
+
+    import pandas as pd
+
     # Find per process per gpu usage info
     sp = subprocess.Popen(
         ["nvidia-smi", "pmon", "-c", "5"],
@@ -152,66 +367,217 @@ def get_nvidia_gpu_power(pid_list, logger=None, **kwargs):
     out_str_final = re.sub("\s+\n", "\n", out_str_final)  # else pd will mis-align
     out_str_final = out_str_final.strip()
     df = pd.read_csv(StringIO(out_str_final), engine="python", delimiter="\t")
-    process_percentage_used_gpu = df.groupby(["gpu", "pid"]).mean().reset_index()
+    return df.groupby(["gpu", "pid"]).mean().reset_index()
 
-    p = Popen(["nvidia-smi", "-q", "-x"], stdout=PIPE)
-    outs, errors = p.communicate()
+
+def _to_number(text):
+    """Parses a reading from nvidia-smi, e.g. "250.10 W" or "87 %". Readings that aren't available are 0."""
+    try:
+        return float(text.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        # N/A, [N/A], [Not Supported], ...
+        return 0.0
+
+
+def _parse_gpu_xml(outs):
+    """Pulls the readings we use out of `nvidia-smi -q -x` output.
+
+    Args:
+        outs (bytes or str): the xml
+
+    Returns:
+        [dict]: per gpu (in nvidia-smi order) its name, uuid, performance_state, power_draw (W), utilization
+            (gpu_util and memory_util in %), memory (total, used_memory and free_memory in MiB) and processes (pid,
+            process_name and used_memory in MiB)
+    """
     xml = fromstring(outs)
-    num_gpus = int(xml.findall("attached_gpus")[0].text)
-    results = []
-    power = 0
-    per_gpu_absolute_percent_usage = {}
-    per_gpu_relative_percent_usage = {}
-    absolute_power = 0
-    per_gpu_performance_states = {}
+    gpus = []
+    for gpu in xml.findall("gpu"):
+        memory_usage = gpu.find("fb_memory_usage")
+        utilization = gpu.find("utilization")
+        processes = []
+        for info in gpu.find("processes").findall("process_info"):
+            processes.append(
+                {
+                    "pid": int(info.find("pid").text),
+                    "process_name": info.find("process_name").text,
+                    "used_memory": _to_number(info.find("used_memory").text),
+                }
+            )
+        gpus.append(
+            {
+                "name": gpu.find("product_name").text,
+                "uuid": gpu.findtext("uuid"),
+                "performance_state": gpu.find("performance_state").text,
+                "power_draw": _to_number(gpu.find("power_readings/power_draw").text),
+                "utilization": {
+                    "gpu_util": _to_number(utilization.find("gpu_util").text),
+                    "memory_util": _to_number(utilization.find("memory_util").text),
+                },
+                "memory": {
+                    "total": _to_number(memory_usage.find("total").text),
+                    "used_memory": _to_number(memory_usage.find("used").text),
+                    "free_memory": _to_number(memory_usage.find("free").text),
+                },
+                "processes": processes,
+            }
+        )
+    return gpus
 
-    for gpu_id, gpu in enumerate(xml.findall("gpu")):
-        gpu_data = {}
 
-        name = gpu.findall("product_name")[0].text
-        gpu_data["name"] = name
+def _parse_gpu_query(gpu_csv, compute_apps_csv):
+    """Parses the output of `nvidia-smi --query-gpu` and `--query-compute-apps` with QUERY_GPU_FIELDS and
+    QUERY_COMPUTE_APPS_FIELDS in csv,noheader,nounits format.
 
-        # get memory
-        memory_usage = gpu.findall("fb_memory_usage")[0]
-        total_memory = memory_usage.findall("total")[0].text
-        used_memory = memory_usage.findall("used")[0].text
-        free_memory = memory_usage.findall("free")[0].text
-        gpu_data["memory"] = {
-            "total": total_memory,
-            "used_memory": used_memory,
-            "free_memory": free_memory,
+    The free text columns come last so every line can be split exactly once, names with commas and all.
+
+    Args:
+        gpu_csv (str): --query-gpu output
+        compute_apps_csv (str): --query-compute-apps output
+
+    Returns:
+        [dict]: the same as _parse_gpu_xml
+    """
+    gpus = []
+    gpus_by_uuid = {}
+    n_gpu_splits = len(QUERY_GPU_FIELDS) - 1
+    for line in gpu_csv.splitlines():
+        values = line.split(", ", n_gpu_splits)
+        if len(values) <= n_gpu_splits:
+            continue
+        (
+            uuid,
+            pstate,
+            power_draw,
+            gpu_util,
+            memory_util,
+            total,
+            used,
+            free,
+            name,
+        ) = values
+        gpu = {
+            "name": name.strip(),
+            "uuid": uuid,
+            "performance_state": pstate,
+            "power_draw": _to_number(power_draw),
+            "utilization": {
+                "gpu_util": _to_number(gpu_util),
+                "memory_util": _to_number(memory_util),
+            },
+            "memory": {
+                "total": _to_number(total),
+                "used_memory": _to_number(used),
+                "free_memory": _to_number(free),
+            },
+            "processes": [],
         }
+        gpus.append(gpu)
+        gpus_by_uuid[uuid] = gpu
+
+    n_app_splits = len(QUERY_COMPUTE_APPS_FIELDS) - 1
+    for line in compute_apps_csv.splitlines():
+        values = line.split(", ", n_app_splits)
+        if len(values) <= n_app_splits or values[0] not in gpus_by_uuid:
+            continue
+        gpu_uuid, pid, used_memory, process_name = values
+        gpus_by_uuid[gpu_uuid]["processes"].append(
+            {
+                "pid": int(pid),
+                "process_name": process_name.strip(),
+                "used_memory": _to_number(used_memory),
+            }
+        )
+    return gpus
+
+
+def _query_gpu_states():
+    """Runs the two nvidia-smi queries for exactly the fields we use.
+
+    Raises:
+        subprocess.CalledProcessError: If nvidia-smi doesn't support the queries.
+    """
+    gpu_csv = subprocess.check_output(
+        [
+            "nvidia-smi",
+            "--query-gpu=" + ",".join(QUERY_GPU_FIELDS),
+            "--format=csv,noheader,nounits",
+        ],
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    compute_apps_csv = subprocess.check_output(
+        [
+            "nvidia-smi",
+            "--query-compute-apps=" + ",".join(QUERY_COMPUTE_APPS_FIELDS),
+            "--format=csv,noheader,nounits",
+        ],
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    return _parse_gpu_query(gpu_csv, compute_apps_csv)
+
 
-        # get utilization
-        utilization = gpu.findall("utilization")[0]
-        gpu_util = utilization.findall("gpu_util")[0].text
-        memory_util = utilization.findall("memory_util")[0].text
-        gpu_data["utilization"] = {"gpu_util": gpu_util, "memory_util": memory_util}
+def _get_gpu_states():
+    """Reads the power draw, performance state and processes of every gpu.
 
-        # get power
-        power_readings = gpu.findall("power_readings")[0]
-        power_draw = power_readings.findall("power_draw")[0].text
+    Asks nvidia-smi for just the fields we need, falling back to the full xml dump if this nvidia-smi doesn't
+    support the queries.
 
-        gpu_data["power_readings"] = {"power_draw": power_draw}
-        absolute_power += float(power_draw.replace("W", ""))
+    Returns:
+        [dict]: see _parse_gpu_xml
+    """
+    global _query_supported
+    if _query_supported is not False:
+        try:
+            gpus = _query_gpu_states()
+            _query_supported = True
+            return gpus
+        except (subprocess.CalledProcessError, ValueError):
+            if _query_supported:
+                raise
+            _query_supported = False
+
+    p = Popen(["nvidia-smi", "-q", "-x"], stdout=PIPE)
+    outs, errors = p.communicate()
+    return _parse_gpu_xml(outs)
 
-        # processes
-        processes = gpu.findall("processes")[0]
 
-        infos = []
+def get_nvidia_gpu_power(pid_list, logger=None, **kwargs):
+    if is_nvml_compatible():
+        # much cheaper than running and parsing nvidia-smi
+        return get_nvml_gpu_power(pid_list, logger=logger, **kwargs)
+
+    processes = kwargs.get("processes")
+    if processes is not None:
+        # the monitor's process tree hands us the live processes directly
+        pid_list = [p.pid for p in processes]
+    pid_set = set(pid_list)
+
+    process_percentage_used_gpu = _get_pmon_utilization()
+
+    gpus = _get_gpu_states()
+    power = 0
+    per_gpu_absolute_percent_usage = {}
+    per_gpu_relative_percent_usage = {}
+    absolute_power = 0
+    per_gpu_performance_states = {}
+    per_gpu_power_draw = {}
+
+    for gpu_id, gpu in enumerate(gpus):
+        power_draw = gpu["power_draw"]
+        absolute_power += power_draw
+
         # all the info for processes on this particular gpu that we're on
         gpu_based_processes = process_percentage_used_gpu[
             process_percentage_used_gpu["gpu"] == gpu_id
         ]
         # what's the total absolute SM for this gpu across all accessible processes
         percentage_of_gpu_used_by_all_processes = float(gpu_based_processes["sm"].sum())
-        per_gpu_power_draw = {}
-        for info in processes.findall("process_info"):
-            pid = info.findall("pid")[0].text
-            process_name = info.findall("process_name")[0].text
-            used_memory = info.findall("used_memory")[0].text
+        for info in gpu["processes"]:
+            pid = info["pid"]
             sm_absolute_percent = gpu_based_processes[
-                gpu_based_processes["pid"] == int(pid)
+                gpu_based_processes["pid"] == pid
             ]["sm"].sum()
             if percentage_of_gpu_used_by_all_processes == 0:
                 # avoid divide by zero, sometimes nothing is used so 0/0 should = 0 in this case
@@ -220,17 +586,8 @@ def get_nvidia_gpu_power(pid_list, logger=None, **kwargs):
                 sm_relative_percent = (
                     sm_absolute_percent / percentage_of_gpu_used_by_all_processes
                 )
-            infos.append(
-                {
-                    "pid": pid,
-                    "process_name": process_name,
-                    "used_memory": used_memory,
-                    "sm_relative_percent": sm_relative_percent,
-                    "sm_absolute_percent": sm_absolute_percent,
-                }
-            )
 
-            if int(pid) in pid_list:
+            if pid in pid_set:
                 # only add a gpu to the list if it's being used by one of the processes. sometimes nvidia-smi seems to list all gpus available
                 # even if they're not being used by our application, this is a problem in a slurm setting
                 if gpu_id not in per_gpu_absolute_percent_usage:
@@ -243,19 +600,14 @@ def get_nvidia_gpu_power(pid_list, logger=None, **kwargs):
                 if gpu_id not in per_gpu_performance_states:
                     # we only log information for gpus that we're using, we've noticed that nvidia-smi will sometimes return information
                     # about all gpu's on a slurm cluster even if they're not assigned to a worker
-                    performance_state = gpu.findall("performance_state")[0].text
-                    per_gpu_performance_states[gpu_id] = performance_state
+                    per_gpu_performance_states[gpu_id] = gpu["performance_state"]
 
-                power += sm_relative_percent * float(power_draw.replace("W", ""))
-                per_gpu_power_draw[gpu_id] = float(power_draw.replace("W", ""))
+                power += sm_relative_percent * power_draw
+                per_gpu_power_draw[gpu_id] = power_draw
                 # want a proportion value rather than percentage
                 per_gpu_absolute_percent_usage[gpu_id] += sm_absolute_percent / 100.0
                 per_gpu_relative_percent_usage[gpu_id] += sm_relative_percent
 
-        gpu_data["processes"] = infos
-
-        results.append(gpu_data)
-
     if len(per_gpu_absolute_percent_usage.values()) == 0:
         average_gpu_utilization = 0
         average_gpu_relative_utilization = 0
@@ -0,0 +1,251 @@
+"""Reads NVIDIA GPU power and utilization through NVML.
+
+nvidia-smi is a thin wrapper around NVML, but going through it means running `nvidia-smi pmon` for several seconds
+and parsing its text output, then running `nvidia-smi -q -x` and walking the whole XML tree, every sample. Talking to
+NVML directly (through the pynvml bindings, loaded lazily so they stay optional) we keep one handle per GPU and read
+just the values we need.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+# NVML counters per process, same names as the nvidia-smi pmon columns
+PROCESS_UTILIZATION_FIELDS = (
+    ("sm", "smUtil"),
+    ("mem", "memUtil"),
+    ("enc", "encUtil"),
+    ("dec", "decUtil"),
+)
+
+_nvml = None
+_nvml_unavailable = False
+_collector = None
+
+
+def _load_nvml():
+    """Imports and initializes pynvml on first use.
+
+    Raises:
+        ImportError: If pynvml isn't installed.
+        pynvml.NVMLError: If NVML can't be initialized, e.g., there is no NVIDIA driver.
+
+    Returns:
+        module: the initialized pynvml module
+    """
+    global _nvml
+    if _nvml is None:
+        import pynvml
+
+        pynvml.nvmlInit()
+        _nvml = pynvml
+    return _nvml
+
+
+def is_nvml_compatible(*args, **kwargs):
+    global _nvml_unavailable
+    if _nvml_unavailable:
+        return False
+    try:
+        return _load_nvml().nvmlDeviceGetCount() > 0
+    except Exception:
+        # no need to try loading the library again every time
+        _nvml_unavailable = True
+        return False
+
+
+def _to_str(value):
+    # older pynvml versions return bytes
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def get_nvml_gpu_info(nvml=None):
+    """Gathers the same general hardware information about every GPU as `nvidia-smi -q -x`, so it is available
+    where only the NVML library is, e.g. in a container that mounts libnvidia-ml but not nvidia-smi.
+
+    Args:
+        nvml (module, optional): the pynvml module to use. Defaults to loading pynvml.
+
+    Returns:
+        [dict]: per gpu its name, total_memory, driver_version and cuda_version, formatted like nvidia-smi does
+    """
+    nvml = _load_nvml() if nvml is None else nvml
+    driver_version = _to_str(nvml.nvmlSystemGetDriverVersion())
+    # e.g. 12020 for 12.2
+    cuda_version = nvml.nvmlSystemGetCudaDriverVersion()
+    cuda_version = "{}.{}".format(cuda_version // 1000, cuda_version % 1000 // 10)
+
+    datas = []
+    for i in range(nvml.nvmlDeviceGetCount()):
+        handle = nvml.nvmlDeviceGetHandleByIndex(i)
+        datas.append(
+            {
+                "name": _to_str(nvml.nvmlDeviceGetName(handle)),
+                "total_memory": "{} MiB".format(
+                    nvml.nvmlDeviceGetMemoryInfo(handle).total // (1024 * 1024)
+                ),
+                "driver_version": driver_version,
+                "cuda_version": cuda_version,
+            }
+        )
+    return datas
+
+
+def _get_running_pids(nvml, handle):
+    """Gets the processes with a context on a GPU, the same ones nvidia-smi -q -x lists."""
+    pids = OrderedDict()
+    for get_processes in (
+        nvml.nvmlDeviceGetComputeRunningProcesses,
+        nvml.nvmlDeviceGetGraphicsRunningProcesses,
+    ):
+        try:
+            for process in get_processes(handle):
+                pids[process.pid] = True
+        except nvml.NVMLError:
+            # e.g., graphics processes aren't supported on some datacenter GPUs
+            continue
+    return list(pids.keys())
+
+
+class NVMLCollector(object):
+    """Keeps the NVML handles for all GPUs and the timestamp of the last per process utilization sample seen on
+    each, so every sample averages the utilization since the previous one.
+    """
+
+    def __init__(self, nvml=None):
+        self.nvml = _load_nvml() if nvml is None else nvml
+        self.handles = [
+            self.nvml.nvmlDeviceGetHandleByIndex(i)
+            for i in range(self.nvml.nvmlDeviceGetCount())
+        ]
+        self.last_seen_timestamps = [0] * len(self.handles)
+
+    def _read_process_utilization(self, gpu_id):
+        """Averages the per process utilization samples NVML collected since the last call.
+
+        Returns:
+            dict: pid to the average of each PROCESS_UTILIZATION_FIELDS field as a percentage
+        """
+        try:
+            samples = self.nvml.nvmlDeviceGetProcessUtilization(
+                self.handles[gpu_id], self.last_seen_timestamps[gpu_id]
+            )
+        except self.nvml.NVMLError as e:
+            if getattr(e, "value", None) == self.nvml.NVML_ERROR_NOT_FOUND:
+                # no process used the gpu since the last call
+                return {}
+            raise
+
+        per_pid = {}
+        for sample in samples:
+            per_pid.setdefault(sample.pid, []).append(
+                [getattr(sample, field) for _, field in PROCESS_UTILIZATION_FIELDS]
+            )
+            self.last_seen_timestamps[gpu_id] = max(
+                self.last_seen_timestamps[gpu_id], sample.timeStamp
+            )
+        return {
+            pid: dict(
+                zip(
+                    [name for name, _ in PROCESS_UTILIZATION_FIELDS],
+                    np.mean(values, axis=0).tolist(),
+                )
+            )
+            for pid, values in per_pid.items()
+        }
+
+    def sample(self, pid_set):
+        """Reads the power draw, performance state and per process utilization of every GPU.
+
+        Args:
+            pid_set (set): processes to attribute power to
+
+        Returns:
+            dict: the same information as get_nvidia_gpu_power
+        """
+        power = 0
+        absolute_power = 0
+        per_gpu_absolute_percent_usage = {}
+        per_gpu_relative_percent_usage = {}
+        per_gpu_performance_states = {}
+        per_gpu_power_draw = {}
+        process_percentage_used_gpu = {}
+
+        for gpu_id, handle in enumerate(self.handles):
+            # NVML reports milliwatts
+            power_draw = self.nvml.nvmlDeviceGetPowerUsage(handle) / 1000.0
+            absolute_power += power_draw
+
+            utilization = self._read_process_utilization(gpu_id)
+            for pid, fields in utilization.items():
+                process_percentage_used_gpu[(gpu_id, pid)] = fields
+            # what's the total absolute SM for this gpu across all accessible processes
+            percentage_of_gpu_used_by_all_processes = float(
+                sum(fields["sm"] for fields in utilization.values())
+            )
+
+            for pid in _get_running_pids(self.nvml, handle):
+                if pid not in pid_set:
+                    continue
+                sm_absolute_percent = utilization.get(pid, {}).get("sm", 0)
+                if percentage_of_gpu_used_by_all_processes == 0:
+                    # avoid divide by zero, sometimes nothing is used so 0/0 should = 0 in this case
+                    sm_relative_percent = 0
+                else:
+                    sm_relative_percent = (
+                        sm_absolute_percent / percentage_of_gpu_used_by_all_processes
+                    )
+
+                # only log gpus that our processes are using, on a shared machine NVML sees all of them
+                if gpu_id not in per_gpu_performance_states:
+                    per_gpu_absolute_percent_usage[gpu_id] = 0
+                    per_gpu_relative_percent_usage[gpu_id] = 0
+                    per_gpu_performance_states[gpu_id] = "P{}".format(
+                        self.nvml.nvmlDeviceGetPerformanceState(handle)
+                    )
+
+                power += sm_relative_percent * power_draw
+                per_gpu_power_draw[gpu_id] = power_draw
+                # want a proportion value rather than percentage
+                per_gpu_absolute_percent_usage[gpu_id] += sm_absolute_percent / 100.0
+                per_gpu_relative_percent_usage[gpu_id] += sm_relative_percent
+
+        if len(per_gpu_absolute_percent_usage.values()) == 0:
+            average_gpu_utilization = 0
+            average_gpu_relative_utilization = 0
+        else:
+            average_gpu_utilization = np.mean(
+                list(per_gpu_absolute_percent_usage.values())
+            )
+            average_gpu_relative_utilization = np.mean(
+                list(per_gpu_relative_percent_usage.values())
+            )
+
+        return {
+            "nvidia_draw_absolute": absolute_power,
+            "nvidia_estimated_attributable_power_draw": power,
+            "average_gpu_estimated_utilization_absolute": average_gpu_utilization,
+            "per_gpu_average_estimated_utilization_absolute": process_percentage_used_gpu,
+            "average_gpu_estimated_utilization_relative": average_gpu_relative_utilization,
+            "per_gpu_performance_state": per_gpu_performance_states,
+            "per_gpu_power_draw": per_gpu_power_draw,
+        }
+
+
+def get_nvml_gpu_power(pid_list, logger=None, **kwargs):
+    """Gathers GPU power and utilization through NVML.
+
+    Args:
+        pid_list ([int]): List of process IDs to attribute power to.
+        logger (optional): Logger to use when logging information. Defaults to None.
+        processes ([psutil.Process], optional): Process objects for pid_list.
+
+    Returns:
+        dict: Information about the GPUs, see get_nvidia_gpu_power
+    """
+    global _collector
+    processes = kwargs.get("processes")
+    if processes is not None:
+        pid_list = [p.pid for p in processes]
+    if _collector is None:
+        _collector = NVMLCollector()
+    return _collector.sample(set(pid_list))
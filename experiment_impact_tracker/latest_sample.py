@@ -0,0 +1,81 @@
+"""Hands the newest sample from the monitor process to the tracker through shared memory.
+
+The monitor appends every sample to data.json, and reading the newest one back from there means reading the end of a
+file the other process is still writing. Instead the monitor also publishes each sample into a fixed size shared
+buffer, guarded by a sequence number (a seqlock): the writer makes the sequence odd while it writes and even again
+once it is done, and the reader retries if the sequence was odd or changed while it was copying. Reads never block
+the writer and never see a partially written sample.
+"""
+import struct
+from multiprocessing import RawArray
+
+import ujson as json
+
+# Samples are json encoded, with one entry per process of the experiment in some fields. Samples that don't fit
+# aren't published and readers fall back to data.json.
+DEFAULT_CAPACITY = 1024 * 1024
+MAX_READ_ATTEMPTS = 1000
+
+# sequence number, payload length
+_HEADER = struct.Struct("<QQ")
+_SEQUENCE = struct.Struct("<Q")
+_TOO_LARGE = 2**64 - 1
+
+
+class LatestSampleChannel(object):
+    """A single slot holding the newest sample, shared with processes forked after it was created.
+
+    Args:
+        capacity (int, optional): the largest encoded sample in bytes. Defaults to DEFAULT_CAPACITY.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._buffer = RawArray("B", _HEADER.size + capacity)
+        self._view = memoryview(self._buffer).cast("B")
+
+    def __getstate__(self):
+        # memoryviews can't be pickled, the shared buffer can when starting a process
+        return {"capacity": self.capacity, "_buffer": self._buffer}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._view = memoryview(self._buffer).cast("B")
+
+    def publish(self, sample):
+        """Replaces the sample in the slot, only one process may publish.
+
+        Args:
+            sample (dict): json serializable sample
+        """
+        payload = json.dumps(sample).encode("utf-8")
+        length = len(payload) if len(payload) <= self.capacity else _TOO_LARGE
+        sequence = _SEQUENCE.unpack_from(self._view)[0]
+
+        # odd while the slot is being written
+        _SEQUENCE.pack_into(self._view, 0, sequence + 1)
+        if length != _TOO_LARGE:
+            self._view[_HEADER.size : _HEADER.size + length] = payload
+        _HEADER.pack_into(self._view, 0, sequence + 1, length)
+        _SEQUENCE.pack_into(self._view, 0, sequence + 2)
+
+    def read(self):
+        """Reads the newest sample.
+
+        Returns:
+            dict: the sample, or None if nothing was published yet, the sample didn't fit or the writer kept
+                overwriting it while reading
+        """
+        for _ in range(MAX_READ_ATTEMPTS):
+            sequence, length = _HEADER.unpack_from(self._view)
+            if sequence % 2 == 1:
+                # being written
+                continue
+            payload = None
+            if 0 < length <= self.capacity:
+                payload = bytes(self._view[_HEADER.size : _HEADER.size + length])
+            if _SEQUENCE.unpack_from(self._view)[0] != sequence:
+                # overwritten while we were copying
+                continue
+            return json.loads(payload) if payload is not None else None
+        return None
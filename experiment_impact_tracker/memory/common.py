@@ -0,0 +1,152 @@
+"""Memory attribution for the processes of an experiment.
+
+Proportional (pss) and unique (uss) set sizes are the fair way to split shared memory between processes, but the
+kernel has to walk every mapping of a process to compute them, which for a process with a very large address space
+can take tens of milliseconds and contends with the workload itself. Resident set size (rss) on the other hand is a
+counter the kernel keeps around. So pss/uss are only read every so often and in between we scale the cheap rss
+reading by the pss/rss ratio from the last full reading.
+"""
+import os
+import time
+
+import psutil
+
+from experiment_impact_tracker.operating_system.common import is_linux
+
+# How often (in seconds) to read the expensive pss/uss values of a process
+FULL_MEMORY_SAMPLE_INTERVAL = float(os.getenv("OVERRIDE_PSS_SAMPLE_INTERVAL", 10))
+
+_SMAPS_ROLLUP_FIELDS = {
+    b"Rss:": "rss",
+    b"Pss:": "pss",
+    b"Private_Clean:": "uss",
+    b"Private_Dirty:": "uss",
+    b"Private_Hugetlb:": "uss",
+    b"Swap:": "swap",
+}
+
+_timer = getattr(time, "monotonic", time.time)
+
+
+def is_smaps_rollup_compatible(*args, proc_path="/proc", **kwargs):
+    return is_linux() and os.path.exists(
+        os.path.join(proc_path, str(os.getpid()), "smaps_rollup")
+    )
+
+
+def read_smaps_rollup(pid, proc_path="/proc"):
+    """Reads the summed up memory mappings of a process from /proc/[pid]/smaps_rollup (Linux 4.14+).
+
+    This is the same information psutil's memory_full_info gets by parsing all of /proc/[pid]/smaps, but the kernel
+    does the summing so there's a lot less text to produce and parse.
+
+    Args:
+        pid (int): the process to read
+        proc_path (str, optional): where procfs is mounted. Defaults to "/proc".
+
+    Raises:
+        FileNotFoundError: If the process no longer exists.
+        PermissionError: If we're not allowed to inspect the process.
+
+    Returns:
+        dict: rss, pss, uss and swap in bytes
+    """
+    with open(os.path.join(proc_path, str(pid), "smaps_rollup"), "rb") as f:
+        contents = f.read()
+
+    info = {"rss": 0, "pss": 0, "uss": 0, "swap": 0}
+    for line in contents.splitlines():
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        key = _SMAPS_ROLLUP_FIELDS.get(fields[0])
+        if key is not None:
+            # values are in kB
+            info[key] += int(fields[1]) * 1024
+    return info
+
+
+class ProcessMemoryTracker(object):
+    """Tracks the memory of processes, reading the expensive pss/uss values at a lower rate than rss.
+
+    Full readings come from smaps_rollup where the kernel has it and psutil's memory_full_info otherwise. Between
+    full readings pss and uss are estimated from the current rss and the ratios seen at the last full reading.
+    """
+
+    def __init__(
+        self, full_sample_interval=None, use_smaps_rollup=None, proc_path="/proc"
+    ):
+        if full_sample_interval is None:
+            full_sample_interval = FULL_MEMORY_SAMPLE_INTERVAL
+        if use_smaps_rollup is None:
+            use_smaps_rollup = is_smaps_rollup_compatible(proc_path=proc_path)
+        self.full_sample_interval = full_sample_interval
+        self.use_smaps_rollup = use_smaps_rollup
+        self.proc_path = proc_path
+        # pid -> (time of the full reading, the full reading)
+        self._full_readings = {}
+
+    def _read_full(self, process):
+        if self.use_smaps_rollup:
+            try:
+                return read_smaps_rollup(process.pid, self.proc_path)
+            except PermissionError:
+                raise psutil.AccessDenied(process.pid)
+            except (FileNotFoundError, ProcessLookupError):
+                raise psutil.NoSuchProcess(process.pid)
+        return process.memory_full_info()._asdict()
+
+    def _needs_full_reading(self, pid, now):
+        if pid not in self._full_readings:
+            return True
+        return now - self._full_readings[pid][0] >= self.full_sample_interval
+
+    def sample(self, process_list, rss=None):
+        """Gathers the memory of each process.
+
+        Args:
+            process_list ([psutil.Process]): processes to get memory for.
+            rss (dict, optional): pid -> rss in bytes if those were already read (e.g., with the cpu times). Any
+                process missing from it gets its rss read through psutil.
+
+        Returns:
+            dict: pid -> memory info in bytes. Has rss and, if we're allowed to read them for the process, pss and
+                uss (estimated from rss in between full readings).
+        """
+        if rss is None:
+            rss = {}
+        now = _timer()
+        mem_info_per_process = {}
+        for p in process_list:
+            try:
+                if self._needs_full_reading(p.pid, now):
+                    try:
+                        full = self._read_full(p)
+                    except psutil.AccessDenied:
+                        # Sometimes we don't have access to PSS so just need to make due with rss
+                        mem_info_per_process[p.pid] = p.memory_info()._asdict()
+                        continue
+                    self._full_readings[p.pid] = (now, full)
+                    mem_info_per_process[p.pid] = dict(full)
+                    continue
+
+                full = self._full_readings[p.pid][1]
+                current_rss = rss.get(p.pid)
+                if current_rss is None:
+                    current_rss = p.memory_info().rss
+            except (psutil.ZombieProcess, psutil.NoSuchProcess):
+                continue
+
+            info = dict(full)
+            info["rss"] = current_rss
+            if full["rss"] > 0:
+                scale = float(current_rss) / full["rss"]
+                info["pss"] = full["pss"] * scale
+                info["uss"] = full["uss"] * scale
+            mem_info_per_process[p.pid] = info
+
+        # forget about processes that went away
+        for pid in set(self._full_readings.keys()) - set(p.pid for p in process_list):
+            del self._full_readings[pid]
+
+        return mem_info_per_process
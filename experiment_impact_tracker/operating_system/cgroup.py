@@ -0,0 +1,180 @@
+"""Accounting for a whole cgroup (v2) at once.
+
+In containers and under batch schedulers an experiment usually is exactly one cgroup, and the kernel already keeps
+the cpu and memory totals for it. Reading those is a handful of small files per sample no matter how many processes
+the experiment forks, rather than a walk over every process.
+"""
+import os
+import time
+
+from experiment_impact_tracker.operating_system import procfs
+from experiment_impact_tracker.operating_system.common import is_linux
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+_timer = getattr(time, "monotonic", time.time)
+
+
+def _read_flat_keyed_file(path):
+    """Reads a cgroup file with one "key value" pair per line (e.g., cpu.stat, memory.stat)."""
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2:
+                values[fields[0]] = int(fields[1])
+    return values
+
+
+def _read_single_value(path):
+    with open(path, "r") as f:
+        return int(f.read().strip())
+
+
+def is_cgroup_v2_compatible(*args, cgroup_path=None, **kwargs):
+    """
+    Args:
+        cgroup_path (str, optional): path to the cgroup directory
+
+    Returns:
+        bool: whether cgroup_path is a cgroup v2 directory with the cpu and memory counters we read
+    """
+    if cgroup_path is None:
+        return False
+    return all(
+        os.path.exists(os.path.join(cgroup_path, name))
+        for name in ("cgroup.procs", "cpu.stat", "memory.current")
+    )
+
+
+def get_current_cgroup_path(pid="self", proc_path="/proc", cgroup_root=CGROUP_ROOT):
+    """Finds the cgroup v2 directory a process belongs to.
+
+    Args:
+        pid (int or str, optional): the process to look up. Defaults to the current process.
+        proc_path (str, optional): where procfs is mounted. Defaults to "/proc".
+        cgroup_root (str, optional): where the cgroup v2 hierarchy is mounted. Defaults to "/sys/fs/cgroup".
+
+    Returns:
+        str: path to the cgroup directory or None if the process isn't in a cgroup v2 hierarchy
+    """
+    if not is_linux() and proc_path == "/proc":
+        return None
+    try:
+        with open(os.path.join(proc_path, str(pid), "cgroup"), "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+
+    for line in lines:
+        # the unified hierarchy is the one with id 0 and no controllers, e.g. 0::/user.slice/job-1234
+        hierarchy_id, controllers, path = line.strip().split(":", 2)
+        if hierarchy_id == "0" and controllers == "":
+            return os.path.join(cgroup_root, path.lstrip("/"))
+    return None
+
+
+def read_cgroup_pids(cgroup_path):
+    """Reads the processes in a cgroup and all of its descendants.
+
+    cgroup.procs only lists the processes directly in a cgroup, and in cgroup v2 a cgroup with children has none of
+    its own (e.g. a Slurm job's tasks live in step_*/user/task_*), while cpu.stat and memory.* count the whole
+    subtree. So the pids are collected from the whole subtree too.
+
+    Args:
+        cgroup_path (str): path to the cgroup directory
+
+    Returns:
+        [int]: pids in the cgroup and its descendants
+    """
+    pids = []
+    for directory, _, _ in os.walk(cgroup_path):
+        try:
+            with open(os.path.join(directory, "cgroup.procs"), "r") as f:
+                pids.extend(int(x) for x in f.read().split())
+        except FileNotFoundError:
+            # a descendant cgroup can be removed while we walk it
+            if directory == cgroup_path:
+                raise
+    return pids
+
+
+def read_cgroup_cpu_usage(cgroup_path):
+    """Reads the cpu time used by all processes in a cgroup since it was created.
+
+    Args:
+        cgroup_path (str): path to the cgroup directory
+
+    Returns:
+        dict: usage, user and system in seconds
+    """
+    stat = _read_flat_keyed_file(os.path.join(cgroup_path, "cpu.stat"))
+    return {
+        "usage": stat["usage_usec"] / 1e6,
+        "user": stat.get("user_usec", 0) / 1e6,
+        "system": stat.get("system_usec", 0) / 1e6,
+    }
+
+
+def read_cgroup_memory(cgroup_path):
+    """Reads the memory used by all processes in a cgroup.
+
+    Args:
+        cgroup_path (str): path to the cgroup directory
+
+    Returns:
+        dict: current (all memory charged to the cgroup, including page cache), working_set (current without the
+            inactive page cache the kernel can reclaim at any time, what we attribute), anon and file in bytes
+    """
+    current = _read_single_value(os.path.join(cgroup_path, "memory.current"))
+    stat = _read_flat_keyed_file(os.path.join(cgroup_path, "memory.stat"))
+    inactive_file = stat.get("inactive_file", 0)
+    return {
+        "current": current,
+        "working_set": max(current - inactive_file, 0),
+        "anon": stat.get("anon", 0),
+        "file": stat.get("file", 0),
+    }
+
+
+class CgroupCPUTracker(object):
+    """Keeps the cgroup and system wide cpu usage from the previous call around so every call measures the cpu
+    used by the cgroup since the last one.
+    """
+
+    def __init__(self, cgroup_path, proc_path="/proc"):
+        self.cgroup_path = cgroup_path
+        self.proc_path = proc_path
+        self.last_timestamp = None
+        self.last_system_cpu_time = None
+        self.last_usage = None
+
+    @property
+    def primed(self):
+        return self.last_timestamp is not None
+
+    def sample(self):
+        """Reads the current cpu usage of the cgroup and the system and diffs them against the last call.
+
+        Returns:
+            dict: delta_time (seconds since the last call), delta_system (system wide cpu-seconds in that window),
+                delta_cgroup (cgroup cpu-seconds in that window) and usage (the latest read_cgroup_cpu_usage).
+                Returns None on the first call since there is nothing to diff against yet.
+        """
+        timestamp = _timer()
+        system_cpu_time = procfs.read_system_cpu_time(self.proc_path)
+        usage = read_cgroup_cpu_usage(self.cgroup_path)
+
+        result = None
+        if self.primed:
+            result = {
+                "delta_time": timestamp - self.last_timestamp,
+                "delta_system": system_cpu_time - self.last_system_cpu_time,
+                "delta_cgroup": usage["usage"] - self.last_usage["usage"],
+                "usage": usage,
+            }
+
+        self.last_timestamp = timestamp
+        self.last_system_cpu_time = system_cpu_time
+        self.last_usage = usage
+        return result
@@ -0,0 +1,198 @@
+"""A cache for information about the host that doesn't change while it is up (hardware inventory and the like).
+
+Probing hardware means launching nvidia-smi or spending around a second in cpuinfo, on every tracker started and
+every attribute assertion. Results are kept in memory for the rest of the process and on disk under a fingerprint of
+the host, so the next process on the same host finds them too. The fingerprint covers the hostname, the boot id, the
+cpus in /proc/cpuinfo and the NVIDIA driver version, so rebooting, moving to a different machine (e.g. with a shared
+home directory on a cluster) or upgrading the driver all start from scratch.
+
+Set OVERRIDE_HOST_CACHE_DIR to change where the cache lives, or to an empty string to only cache in memory.
+"""
+import hashlib
+import os
+import platform
+import shutil
+import socket
+import threading
+import time
+
+import psutil
+import ujson as json
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "experiment_impact_tracker"
+)
+# Cached information for fingerprints that weren't used for this long is removed, in seconds
+MAX_UNUSED_AGE = 30 * 24 * 60 * 60
+
+_lock = threading.Lock()
+_memo = {}
+_fingerprint = None
+
+
+def get_cache_dir():
+    cache_dir = os.getenv("OVERRIDE_HOST_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except (FileNotFoundError, PermissionError):
+        return None
+
+
+def get_boot_id(proc_path="/proc"):
+    boot_id = _read_file(os.path.join(proc_path, "sys/kernel/random/boot_id"))
+    if boot_id is not None:
+        return boot_id.decode("utf-8").strip()
+    return str(psutil.boot_time())
+
+
+def get_cpuinfo_hash(proc_path="/proc"):
+    """Hashes the description of the cpus in /proc/cpuinfo, leaving out the constantly changing clock speeds."""
+    cpuinfo = _read_file(os.path.join(proc_path, "cpuinfo"))
+    if cpuinfo is None:
+        cpuinfo = "{} {} {}".format(
+            platform.processor(), platform.machine(), os.cpu_count()
+        ).encode("utf-8")
+    else:
+        cpuinfo = b"\n".join(
+            line for line in cpuinfo.splitlines() if not line.startswith(b"cpu MHz")
+        )
+    return hashlib.sha1(cpuinfo).hexdigest()
+
+
+def get_nvidia_driver_version(proc_path="/proc"):
+    """Reads the loaded NVIDIA kernel module's version without going through nvidia-smi.
+
+    Returns:
+        str: the driver version line or None if no NVIDIA driver is loaded
+    """
+    version = _read_file(os.path.join(proc_path, "driver/nvidia/version"))
+    if version is None:
+        version = _read_file("/sys/module/nvidia/version")
+    if version is None:
+        return None
+    return version.decode("utf-8").splitlines()[0].strip()
+
+
+def get_host_fingerprint():
+    """
+    Returns:
+        str: a hash of the hostname, boot id, cpus and NVIDIA driver version, computed once per process
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        parts = [
+            socket.gethostname(),
+            get_boot_id(),
+            get_cpuinfo_hash(),
+            get_nvidia_driver_version() or "",
+        ]
+        _fingerprint = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return _fingerprint
+
+
+def _prune(cache_dir, keep):
+    now = time.time()
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry == keep or not os.path.isdir(path):
+            continue
+        try:
+            if now - os.path.getmtime(path) > MAX_UNUSED_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def _read_from_disk(path):
+    contents = _read_file(path)
+    if contents is None:
+        return None
+    try:
+        return json.loads(contents)
+    except ValueError:
+        # e.g., a partial write from a process that was killed, just probe again
+        return None
+
+
+def _write_to_disk(path, entry):
+    directory = os.path.dirname(path)
+    new_directory = not os.path.exists(directory)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(entry))
+    # so concurrent readers never see a partial file
+    os.replace(tmp_path, path)
+    if new_directory:
+        _prune(os.path.dirname(directory), keep=os.path.basename(directory))
+
+
+def _is_fresh(entry, max_age):
+    return max_age is None or time.time() - entry["created"] <= max_age
+
+
+def get_cached(name, probe, *args, max_age=None, refresh=False, **kwargs):
+    """Gets information about the host from the cache, probing for it only if this host hasn't been probed yet.
+
+    Args:
+        name (str): what the information is called in the cache, e.g. gpu_info
+        probe (function): gathers the information, called with args and kwargs. What it returns has to be json
+            serializable.
+        max_age (float, optional): how old (in seconds) cached information may be before probing again. Defaults to
+            keeping it for as long as the host fingerprint stays the same.
+        refresh (bool, optional): probe again even if there is cached information. Defaults to False.
+
+    Returns:
+        the information, as it looks after a round trip through json (e.g. tuples become lists) so every call
+        returns the same thing whether it was cached or not
+    """
+    fingerprint = get_host_fingerprint()
+    key = (fingerprint, name)
+    if not refresh:
+        with _lock:
+            entry = _memo.get(key)
+        if entry is not None and _is_fresh(entry, max_age):
+            return entry["value"]
+
+    cache_dir = get_cache_dir()
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, fingerprint, "{}.json".format(name))
+        entry = None if refresh else _read_from_disk(path)
+        if (
+            entry is not None
+            and entry.get("name") == name
+            and "created" in entry
+            and _is_fresh(entry, max_age)
+        ):
+            with _lock:
+                _memo[key] = entry
+            return entry["value"]
+
+    entry = {
+        "name": name,
+        "created": time.time(),
+        "value": json.loads(json.dumps(probe(*args, **kwargs))),
+    }
+    if path is not None:
+        try:
+            _write_to_disk(path, entry)
+        except OSError:
+            # read-only home directories and the like, caching in memory is still worth it
+            pass
+    with _lock:
+        _memo[key] = entry
+    return entry["value"]
+
+
+def clear_memo():
+    """Forgets what was cached in memory (and the fingerprint), the on-disk cache is left alone."""
+    global _fingerprint
+    with _lock:
+        _memo.clear()
+        _fingerprint = None
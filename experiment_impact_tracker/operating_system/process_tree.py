@@ -0,0 +1,121 @@
+import os
+from collections import OrderedDict
+
+import psutil
+
+from experiment_impact_tracker.operating_system.common import is_linux
+
+
+def _read_proc_children(pid, proc_path="/proc"):
+    """Reads the direct children of a process from /proc/[pid]/task/[tid]/children.
+
+    This only looks at the process itself rather than scanning every process on the system like
+    psutil.Process.children does.
+
+    Args:
+        pid (int): the process to get children for
+        proc_path (str, optional): where procfs is mounted. Defaults to "/proc".
+
+    Raises:
+        FileNotFoundError: If the process no longer exists.
+        PermissionError: If the process can't be inspected.
+
+    Returns:
+        set: pids of the direct children
+    """
+    children = set()
+    task_dir = os.path.join(proc_path, str(pid), "task")
+    for tid in os.listdir(task_dir):
+        try:
+            with open(os.path.join(task_dir, tid, "children"), "r") as f:
+                children.update(int(x) for x in f.read().split())
+        except FileNotFoundError:
+            # the thread exited while we were reading
+            continue
+    return children
+
+
+def _supports_proc_children(proc_path="/proc"):
+    return is_linux() and os.path.exists(
+        os.path.join(proc_path, str(os.getpid()), "task", str(os.getpid()), "children")
+    )
+
+
+class ProcessTree(object):
+    """A registry of the processes we attribute usage to, kept alive across samples.
+
+    Rather than rebuilding the process tree from scratch every sample, the tree keeps the psutil.Process objects it
+    has seen (and any state psutil caches on them) and on every refresh only walks down from the processes it
+    already knows to find new children. Processes that exited or are no longer part of the tree are dropped.
+    """
+
+    def __init__(self, root_pid, proc_path="/proc"):
+        self.proc_path = proc_path
+        self.root = psutil.Process(root_pid)
+        self._processes = OrderedDict([(self.root.pid, self.root)])
+        self._use_proc_children = _supports_proc_children(proc_path)
+
+    @property
+    def pids(self):
+        return list(self._processes.keys())
+
+    @property
+    def processes(self):
+        return list(self._processes.values())
+
+    def _get_process(self, pid):
+        """Reuses the Process we already have for a pid unless the pid was recycled by a new process."""
+        process = self._processes.get(pid)
+        if process is not None and process.is_running():
+            return process
+        return psutil.Process(pid)
+
+    def _walk_proc_children(self):
+        reachable = OrderedDict()
+        to_visit = [self.root.pid]
+        while to_visit:
+            pid = to_visit.pop()
+            if pid in reachable:
+                continue
+            try:
+                process = self._get_process(pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError):
+                continue
+            try:
+                children = _read_proc_children(pid, self.proc_path)
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            except PermissionError:
+                # still attribute to the process, we just can't see its children
+                children = set()
+            reachable[pid] = process
+            to_visit.extend(children - set(reachable.keys()))
+        return reachable
+
+    def _walk_psutil_children(self):
+        reachable = OrderedDict([(self.root.pid, self.root)])
+        for child in self.root.children(recursive=True):
+            if child.pid in reachable:
+                continue
+            known = self._processes.get(child.pid)
+            # keep the old object (and its cached state) as long as it is the same process
+            reachable[child.pid] = known if known == child else child
+        return reachable
+
+    def refresh(self):
+        """Discovers new children and drops processes that exited.
+
+        Raises:
+            psutil.NoSuchProcess: If the root process exited.
+
+        Returns:
+            [psutil.Process]: the live processes in the tree, root first
+        """
+        if not self.root.is_running():
+            raise psutil.NoSuchProcess(self.root.pid)
+
+        if self._use_proc_children:
+            self._processes = self._walk_proc_children()
+        else:
+            self._processes = self._walk_psutil_children()
+        return self.processes
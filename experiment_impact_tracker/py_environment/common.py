@@ -1,10 +1,11 @@
 import copyreg
 import zipimport
 
-import pkg_resources
-
 copyreg.pickle(zipimport.zipimporter, lambda x: (x.__class__, (x.archive,)))
 
 
 def get_python_packages_and_versions(*args, **kwargs):
+    # slow to import, it scans every installed distribution
+    import pkg_resources
+
     return list(pkg_resources.working_set)
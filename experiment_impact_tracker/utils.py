@@ -1,4 +1,5 @@
 import logging
+import re
 import sys
 import time
 import traceback
@@ -6,10 +7,9 @@ from functools import wraps
 from multiprocessing import Process, Queue
 
 import numpy as np
-import pandas as pd
 
 from experiment_impact_tracker.data_utils import *
-from experiment_impact_tracker.data_utils import load_data_into_frame
+from experiment_impact_tracker.data_utils import iter_data_frames
 from experiment_impact_tracker.emissions.constants import PUE
 
 _timer = getattr(time, "monotonic", time.time)
@@ -85,156 +85,226 @@ def processify(func):
     return wrapper
 
 
-def _get_cpu_hours_from_per_process_data(json_array):
-    latest_per_pid = {}
-    for datapoint in json_array:
-        cpu_point = datapoint.get("cpu_time_seconds", {})
-        for pid, value in cpu_point.items():
-            latest_per_pid[pid] = value["user"] + value["system"]
-    return sum(latest_per_pid.values())
+# The values gather_additional_info needs from each sample
+IMPACT_COLUMNS = [
+    "timestamp",
+    "rapl_estimated_attributable_power_draw",
+    "nvidia_estimated_attributable_power_draw",
+    "average_gpu_estimated_utilization_absolute",
+    "realtime_carbon_intensity",
+    "cpu_time_seconds",
+]
 
+CPU_TIME_PATTERN = re.compile(r"^cpu_time_seconds\.(.+)\.user$")
 
-def gather_additional_info(info, logdir):
-    df, json_array = load_data_into_frame(logdir)
-    cpu_seconds = _get_cpu_hours_from_per_process_data(json_array)
 
-    if "experiment_end" not in info:
-        log.warning(
-            "It looks like your experiment ended abruptly and didn't log an appropriate end time due to some "
-            "error. We're falling back to using the last logged timestamp, but this may not be accurate."
-            "Please keep this in mind before reporting information."
-        )
-        exp_end_timestamp = df["timestamp"].max()
-    else:
+def _column(frame, name):
+    import pandas as pd
 
-        exp_end_timestamp = datetime.timestamp(info["experiment_end"])
+    if name not in frame:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[name], errors="coerce").to_numpy(dtype=np.float64)
 
-    exp_len = exp_end_timestamp - datetime.timestamp(info["experiment_start"])
-    exp_len_hours = exp_len / 3600.0
-    # integrate power
-    # https://electronics.stackexchange.com/questions/237025/converting-watt-values-over-time-to-kwh
-    # multiply by carbon intensity to get Kg Carbon eq
-    time_differences = df["timestamp"].diff()
-    time_differences[0] = df["timestamp"][0] - datetime.timestamp(
-        info["experiment_start"]
-    )
-
-    # Add final timestamp and extrapolate last row of power estimates
-    time_differences.loc[len(time_differences)] = (
-        exp_end_timestamp - df["timestamp"][len(df["timestamp"]) - 1]
-    )
-
-    # elementwise multiplication and sum
-    time_differences_in_hours = time_differences / 3600.0
-    power_draw_rapl_kw = None
-
-    if "rapl_estimated_attributable_power_draw" in df:
-        power_draw_rapl_kw = df["rapl_estimated_attributable_power_draw"] / 1000.0
-        power_draw_rapl_kw.loc[len(power_draw_rapl_kw)] = power_draw_rapl_kw.loc[
-            len(power_draw_rapl_kw) - 1
-        ]
-    has_gpu = False
-
-    if "gpu_info" in info.keys():
-        has_gpu = True
-        num_gpus = len(info["gpu_info"])
-        nvidia_power_draw_kw = df["nvidia_estimated_attributable_power_draw"] / 1000.0
-        nvidia_power_draw_kw.loc[len(nvidia_power_draw_kw)] = nvidia_power_draw_kw.loc[
-            len(nvidia_power_draw_kw) - 1
+
+class _ImpactAccumulator(object):
+    """Folds chunks of samples into the totals gather_additional_info reports, so the whole log never has to be
+    loaded at once.
+
+    Every sample is a timestep lasting from the previous sample (the start of the experiment for the first one) to
+    its own timestamp, plus a last timestep from the last sample to the end of the experiment with the power draw of
+    the last sample. The energy of each timestep is its length times the power draw, the emissions its energy times
+    the realtime carbon intensity, forward filled over samples that don't have it, backward filled over the ones
+    before the first that has it and the region average if none has it.
+    """
+
+    # how the energy of a timestep is added up, depending on what was measured
+    CPU_AND_GPU = "cpu+gpu"
+    CPU = "cpu"
+    GPU = "gpu"
+
+    def __init__(self, info):
+        self.has_gpu = "gpu_info" in info
+        self.last_timestamp = datetime.timestamp(info["experiment_start"])
+        self.max_timestamp = None
+        self.seen = set()
+        self.last_sample = None
+        self.kw_hr_cpu = 0.0
+        self.kw_hr_gpu = 0.0
+        self.gpu_hours = 0.0
+        self.total_power = {self.CPU_AND_GPU: 0.0, self.CPU: 0.0, self.GPU: 0.0}
+        self.carbon_grams = dict.fromkeys(self.total_power, 0.0)
+        # the energy of the timesteps before the first carbon intensity, to be backward filled
+        self.pending_power = dict.fromkeys(self.total_power, 0.0)
+        self.pending_count = 0
+        self.last_carbon = None
+        self.carbon_sum = 0.0
+        self.carbon_count = 0
+        self.cpu_seconds_per_pid = {}
+
+    def update(self, frame):
+        """
+        Args:
+            frame (pandas.DataFrame): the next chunk of samples, see data_utils.iter_data_frames
+        """
+        if len(frame) == 0:
+            return
+        self.seen.update(frame.columns)
+        timestamps = _column(frame, "timestamp")
+        self.max_timestamp = np.nanmax(
+            [np.nanmax(timestamps), self.max_timestamp or -np.inf]
+        )
+        previous = np.concatenate([[self.last_timestamp], timestamps[:-1]])
+        self.last_timestamp = timestamps[-1]
+        values = [
+            _column(frame, "rapl_estimated_attributable_power_draw"),
+            _column(frame, "nvidia_estimated_attributable_power_draw"),
+            _column(frame, "average_gpu_estimated_utilization_absolute"),
+            _column(frame, "realtime_carbon_intensity"),
         ]
-        gpu_absolute_util = df["average_gpu_estimated_utilization_absolute"]
-        gpu_absolute_util.loc[len(gpu_absolute_util)] = gpu_absolute_util.loc[
-            len(gpu_absolute_util) - 1
+        self._add_timesteps((timestamps - previous) / 3600.0, *values)
+        self.last_sample = [value[-1:] for value in values]
+
+        # the latest cpu time of each process
+        for column in frame.columns:
+            match = CPU_TIME_PATTERN.match(column)
+            if match is None:
+                continue
+            pid = match.group(1)
+            user = _column(frame, column)
+            logged = np.flatnonzero(~np.isnan(user))
+            if len(logged):
+                last = logged[-1]
+                system = _column(frame, "cpu_time_seconds.{}.system".format(pid))
+                self.cpu_seconds_per_pid[pid] = user[last] + system[last]
+
+    def _add_timesteps(self, hours, rapl_draw, nvidia_draw, gpu_util, carbon):
+        kw_hr_cpu = hours * rapl_draw / 1000.0
+        kw_hr_gpu = hours * nvidia_draw / 1000.0
+        self.kw_hr_cpu += np.nansum(kw_hr_cpu)
+        self.kw_hr_gpu += np.nansum(kw_hr_gpu)
+        self.gpu_hours += np.nansum(hours * gpu_util)
+
+        # forward fill the carbon intensity, from the last one of the previous chunk
+        filled = carbon.copy()
+        if self.last_carbon is not None and np.isnan(filled[0]):
+            filled[0] = self.last_carbon
+        logged = ~np.isnan(filled)
+        filled = filled[
+            np.maximum.accumulate(np.where(logged, np.arange(len(filled)), 0))
         ]
+        # before the first carbon intensity there is nothing to forward fill
+        pending = np.isnan(filled)
+
+        power = {
+            self.CPU_AND_GPU: PUE * (kw_hr_cpu + kw_hr_gpu),
+            self.CPU: PUE * kw_hr_cpu,
+            self.GPU: PUE * kw_hr_gpu,
+        }
+        for key, timesteps in power.items():
+            self.total_power[key] += np.nansum(timesteps)
+            self.carbon_grams[key] += np.nansum(timesteps[~pending] * filled[~pending])
+            self.pending_power[key] += np.nansum(timesteps[pending])
+        self.carbon_sum += np.nansum(filled[~pending])
+        self.carbon_count += np.count_nonzero(~pending)
+        self.pending_count += np.count_nonzero(pending)
+        if not pending.all():
+            if self.last_carbon is None:
+                self._fill_pending(filled[~pending][0])
+            self.last_carbon = filled[-1]
+
+    def _fill_pending(self, carbon):
+        for key, power in self.pending_power.items():
+            self.carbon_grams[key] += power * carbon
+            self.pending_power[key] = 0.0
+        self.carbon_sum += self.pending_count * carbon
+        self.carbon_count += self.pending_count
+        self.pending_count = 0
+
+    def result(self, info):
+        """
+        Args:
+            info (dict): the initial info of the experiment, with its end if it was logged
+
+        Returns:
+            dict: the totals, see gather_additional_info
+        """
+        if "experiment_end" not in info:
+            log.warning(
+                "It looks like your experiment ended abruptly and didn't log an appropriate end time due to some "
+                "error. We're falling back to using the last logged timestamp, but this may not be accurate."
+                "Please keep this in mind before reporting information."
+            )
+            exp_end_timestamp = self.max_timestamp
+        else:
+            exp_end_timestamp = datetime.timestamp(info["experiment_end"])
 
-        # elementwise multiplication and sum
-        kw_hr_nvidia = np.multiply(time_differences_in_hours, nvidia_power_draw_kw)
-
-    kw_hr_rapl = (
-        np.multiply(time_differences_in_hours, power_draw_rapl_kw)
-        if power_draw_rapl_kw is not None
-        else None
-    )
-
-    if has_gpu and (kw_hr_rapl is not None):
-        total_power_per_timestep = PUE * (kw_hr_nvidia + kw_hr_rapl)
-    elif kw_hr_rapl is not None:
-        total_power_per_timestep = PUE * (kw_hr_rapl)
-    elif has_gpu:
-        total_power_per_timestep = PUE * (kw_hr_nvidia)
-    else:
-        raise ValueError("Unable to get either GPU or CPU metric.")
-
-    realtime_carbon = None
-    total_power = (
-        total_power_per_timestep.sum() if total_power_per_timestep is not None else None
-    )
-
-    estimated_carbon_impact_grams = None
-    if "realtime_carbon_intensity" in df:
-        realtime_carbon = df["realtime_carbon_intensity"]
-        realtime_carbon.loc[len(realtime_carbon)] = realtime_carbon.loc[
-            len(realtime_carbon) - 1
-        ]
-        # If we lost some values due to network errors, forward fill the last available value.
-        # Backfill in a second pass to get any values that haven't been picked up.
-        # Then finally, if any values remain, replace with the region average.
-        realtime_carbon = (
-            pd.to_numeric(realtime_carbon, errors="coerce")
-            .fillna(method="ffill")
-            .fillna(method="bfill")
-            .fillna(value=info["region_carbon_intensity_estimate"]["carbonIntensity"])
-        )
-        try:
-            estimated_carbon_impact_grams_per_timestep = (
-                np.multiply(total_power_per_timestep, realtime_carbon)
-                if not total_power_per_timestep.empty
-                else pd.DataFrame()
+        exp_len = exp_end_timestamp - datetime.timestamp(info["experiment_start"])
+        exp_len_hours = exp_len / 3600.0
+
+        # extrapolate the last sample to the end of the experiment
+        if self.last_sample is not None:
+            self._add_timesteps(
+                np.array([(exp_end_timestamp - self.last_timestamp) / 3600.0]),
+                *self.last_sample
             )
-        except :
-            log.exception("")
+        region_carbon = info["region_carbon_intensity_estimate"]["carbonIntensity"]
+        if self.last_carbon is None:
+            self._fill_pending(region_carbon)
+
+        has_cpu = "rapl_estimated_attributable_power_draw" in self.seen
+        if self.has_gpu and has_cpu:
+            combined = self.CPU_AND_GPU
+        elif has_cpu:
+            combined = self.CPU
+        elif self.has_gpu:
+            combined = self.GPU
+        else:
+            raise ValueError("Unable to get either GPU or CPU metric.")
+        total_power = self.total_power[combined]
 
-        estimated_carbon_impact_grams = (
-            estimated_carbon_impact_grams_per_timestep.sum()
-            if not estimated_carbon_impact_grams_per_timestep.empty
-            else pd.DataFrame()
-        )
-    else:
-        if total_power is not None:
-            estimated_carbon_impact_grams = (
-                total_power
-                * info["region_carbon_intensity_estimate"]["carbonIntensity"]
+        realtime_carbon = "realtime_carbon_intensity" in self.seen
+        if realtime_carbon:
+            estimated_carbon_impact_grams = self.carbon_grams[combined]
+        else:
+            estimated_carbon_impact_grams = total_power * region_carbon
+
+        data = {
+            "cpu_hours": sum(self.cpu_seconds_per_pid.values()) / 3600.0,
+            "estimated_carbon_impact_kg": estimated_carbon_impact_grams / 1000.0,
+            "total_power": total_power,
+            "exp_len_hours": exp_len_hours,
+        }
+        if has_cpu:
+            data["kw_hr_cpu"] = self.kw_hr_cpu
+        if self.has_gpu:
+            # GPU-hours percent utilization * length of time utilized (assumes absolute utliziation)
+            data["gpu_hours"] = self.gpu_hours * len(info["gpu_info"])
+            data["kw_hr_gpu"] = self.kw_hr_gpu
+        if realtime_carbon:
+            data["average_realtime_carbon_intensity"] = (
+                self.carbon_sum / self.carbon_count
             )
+        return data
 
-    estimated_carbon_impact_kg = (
-        estimated_carbon_impact_grams / 1000.0
-        if estimated_carbon_impact_grams is not None
-        else None
-    )
-
-    cpu_hours = cpu_seconds / 3600.0
-
-    data = {}
-
-    if cpu_hours is not None:
-        data["cpu_hours"] = cpu_hours
-    if estimated_carbon_impact_kg is not None:
-        data["estimated_carbon_impact_kg"] = estimated_carbon_impact_kg
-    if total_power is not None:
-        data["total_power"] = total_power
-    if kw_hr_rapl is not None:
-        data["kw_hr_cpu"] = kw_hr_rapl.sum()
-    if exp_len_hours is not None:
-        data["exp_len_hours"] = exp_len_hours
-
-    if has_gpu:
-        # GPU-hours percent utilization * length of time utilized (assumes absolute utliziation)
-        gpu_hours = (
-            np.multiply(time_differences_in_hours, gpu_absolute_util).sum() * num_gpus
-        )
-        data.update({"gpu_hours": gpu_hours, "kw_hr_gpu": kw_hr_nvidia.sum()})
 
-    if realtime_carbon is not None:
-        data["average_realtime_carbon_intensity"] = realtime_carbon.mean()
+def gather_additional_info(info, logdir, chunk_size=None):
+    """Adds up the energy, emissions and compute time of an experiment from its samples, a chunk of samples at a
+    time so memory use stays flat however long the experiment ran.
+
+    Args:
+        info (dict): the initial info of the experiment, see load_initial_info
+        logdir (str): the log directory of the experiment
+        chunk_size (int, optional): how many samples to load at a time. Defaults to DATA_CHUNK_SIZE.
 
-    return data
+    Returns:
+        dict: cpu_hours, estimated_carbon_impact_kg, total_power (kWh with PUE), exp_len_hours, kw_hr_cpu if the
+            cpu power draw was measured, gpu_hours and kw_hr_gpu if there are GPUs and
+            average_realtime_carbon_intensity if it was logged
+    """
+    # integrate power
+    # https://electronics.stackexchange.com/questions/237025/converting-watt-values-over-time-to-kwh
+    # multiply by carbon intensity to get Kg Carbon eq
+    accumulator = _ImpactAccumulator(info)
+    for frame in iter_data_frames(logdir, chunk_size, columns=IMPACT_COLUMNS):
+        accumulator.update(frame)
+    return accumulator.result(info)
@@ -28,7 +28,7 @@ setup(
     install_requires=[
         "requests",
         "bs4",
-        "shapely",
+        "shapely>=2.0",
         "scipy",
         "joblib",
         "numpy",
@@ -54,6 +54,8 @@ setup(
     extras_require={
         "tests": ["pytest==3.5.1", "pytest-cov", "pytest-env", "pytest-xdist"],
         "docs": ["sphinx", "sphinx-autobuild", "sphinx-rtd-theme", "recommonmark"],
+        "nvml": ["pynvml"],
+        "arrow": ["pyarrow>=14"],
     },
     description="A toolkit for tracking energy, carbon, and compute metrics for machine learning (or any other) experiments.",
     author="Peter Henderson",
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from experiment_impact_tracker.operating_system import host_cache
+
+# timing benchmarks are flaky on loaded machines, they only run with RUN_BENCHMARKS=1
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS", "0") not in ("", "0")
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: timing benchmark, only runs with RUN_BENCHMARKS=1"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def isolated_host_cache(tmpdir, monkeypatch):
+    """Keeps what tests probe (and fake) out of the real host cache and from leaking between tests."""
+    monkeypatch.setenv(
+        "OVERRIDE_HOST_CACHE_DIR", os.path.join(str(tmpdir), "host_cache")
+    )
+    host_cache.clear_memo()
+    yield
+    host_cache.clear_memo()
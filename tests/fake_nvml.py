@@ -0,0 +1,134 @@
+"""A pure python stand-in for the parts of pynvml the NVML collector uses, so it can be tested (and benchmarked)
+without a GPU.
+
+Configure the simulated GPUs with set_devices, then use this module wherever pynvml is expected.
+"""
+from collections import namedtuple
+
+NVML_ERROR_NOT_SUPPORTED = 3
+NVML_ERROR_NOT_FOUND = 6
+
+MemoryInfo = namedtuple("MemoryInfo", ["total", "free", "used"])
+ProcessInfo = namedtuple("ProcessInfo", ["pid", "usedGpuMemory"])
+ProcessUtilizationSample = namedtuple(
+    "ProcessUtilizationSample",
+    ["pid", "timeStamp", "smUtil", "memUtil", "encUtil", "decUtil"],
+)
+
+
+class NVMLError(Exception):
+    def __init__(self, value):
+        super(NVMLError, self).__init__(value)
+        self.value = value
+
+
+class FakeDevice(object):
+    def __init__(
+        self,
+        power_mw=100000,
+        performance_state=0,
+        processes=(),
+        utilization_samples=(),
+        graphics_supported=True,
+        name="Fake GPU",
+        memory_total=16 * 1024 * 1024 * 1024,
+    ):
+        """
+        :param power_mw: power draw in milliwatts
+        :param performance_state: 0 for P0, 1 for P1, ...
+        :param processes: pids with a compute context on the device
+        :param utilization_samples: (pid, timestamp in us, sm, mem, enc, dec) tuples
+        :param graphics_supported: whether graphics processes can be queried
+        :param name: the product name
+        :param memory_total: memory in bytes
+        """
+        self.power_mw = power_mw
+        self.performance_state = performance_state
+        self.processes = list(processes)
+        self.utilization_samples = [
+            ProcessUtilizationSample(*sample) for sample in utilization_samples
+        ]
+        self.graphics_supported = graphics_supported
+        self.name = name
+        self.memory_total = memory_total
+
+
+_devices = []
+initialized = False
+
+
+def set_devices(devices):
+    global _devices
+    _devices = list(devices)
+
+
+def nvmlInit():
+    global initialized
+    initialized = True
+
+
+def nvmlShutdown():
+    global initialized
+    initialized = False
+
+
+def _check_initialized():
+    if not initialized:
+        raise NVMLError(1)
+
+
+def nvmlDeviceGetCount():
+    _check_initialized()
+    return len(_devices)
+
+
+def nvmlDeviceGetHandleByIndex(index):
+    _check_initialized()
+    return _devices[index]
+
+
+def nvmlSystemGetDriverVersion():
+    _check_initialized()
+    return "535.54.03"
+
+
+def nvmlSystemGetCudaDriverVersion():
+    _check_initialized()
+    return 12020
+
+
+def nvmlDeviceGetName(handle):
+    return handle.name
+
+
+def nvmlDeviceGetMemoryInfo(handle):
+    return MemoryInfo(handle.memory_total, handle.memory_total, 0)
+
+
+def nvmlDeviceGetPowerUsage(handle):
+    return handle.power_mw
+
+
+def nvmlDeviceGetPerformanceState(handle):
+    return handle.performance_state
+
+
+def nvmlDeviceGetComputeRunningProcesses(handle):
+    return [ProcessInfo(pid, 1024 * 1024 * 1024) for pid in handle.processes]
+
+
+def nvmlDeviceGetGraphicsRunningProcesses(handle):
+    if not handle.graphics_supported:
+        raise NVMLError(NVML_ERROR_NOT_SUPPORTED)
+    return []
+
+
+def nvmlDeviceGetProcessUtilization(handle, lastSeenTimeStamp):
+    samples = [
+        sample
+        for sample in handle.utilization_samples
+        if sample.timeStamp > lastSeenTimeStamp
+    ]
+    if not samples:
+        raise NVMLError(NVML_ERROR_NOT_FOUND)
+    return samples
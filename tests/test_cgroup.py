@@ -0,0 +1,144 @@
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from experiment_impact_tracker.compute_tracker import ImpactTracker
+from experiment_impact_tracker.cpu import intel, rapl
+from experiment_impact_tracker.operating_system.cgroup import (
+    CgroupCPUTracker, get_current_cgroup_path, is_cgroup_v2_compatible,
+    read_cgroup_memory, read_cgroup_pids)
+
+
+def _write(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def _fake_cgroupfs(root, usage_usec, memory_current):
+    cgroup_path = os.path.join(root, "sys/fs/cgroup/system.slice/job-42.scope")
+    _write(
+        os.path.join(cgroup_path, "cpu.stat"),
+        "usage_usec {}\nuser_usec {}\nsystem_usec {}\nnr_periods 0\n".format(
+            usage_usec, usage_usec * 3 // 4, usage_usec // 4
+        ),
+    )
+    _write(os.path.join(cgroup_path, "memory.current"), "{}\n".format(memory_current))
+    _write(
+        os.path.join(cgroup_path, "memory.stat"),
+        "anon {}\nfile 4096\ninactive_file 4096\n".format(memory_current - 4096),
+    )
+    _write(os.path.join(cgroup_path, "cgroup.procs"), "101\n102\n103\n")
+    return cgroup_path
+
+
+def _fake_proc_stat(root, user_ticks, system_ticks):
+    _write(
+        os.path.join(root, "proc/stat"),
+        "cpu  {} 0 {} 100000 0 0 0 0 0 0\ncpu0 1 0 1 1 0 0 0 0 0 0\n".format(
+            user_ticks, system_ticks
+        ),
+    )
+    return os.path.join(root, "proc")
+
+
+def _fake_rapl_sample(energy_uj, timestamp):
+    sample = rapl.RAPLSample()
+    sample.domains = {}
+    sample.domains_by_id = {}
+    sample.timestamp = timestamp
+    for domain_id, name, energy in [
+        ("intel-rapl:0", "package-0", energy_uj),
+        ("intel-rapl:0:0", "core", energy_uj // 2),
+        ("intel-rapl:0:1", "dram", energy_uj // 4),
+    ]:
+        domain = rapl.RAPLDomain()
+        domain.name = name
+        domain.id = domain_id
+        domain.values = {"energy_uj": energy}
+        domain.max_values = {"energy_uj": 2 ** 32}
+        domain.subdomains = {}
+        domain.parent = None
+        sample.domains_by_id[domain_id] = domain
+        sample._link_tree(domain)
+    return sample
+
+
+def test_read_fake_cgroupfs(tmpdir):
+    root = str(tmpdir)
+    cgroup_path = _fake_cgroupfs(root, usage_usec=2000000, memory_current=1 << 20)
+    _write(
+        os.path.join(root, "proc/self/cgroup"),
+        "1:name=systemd:/\n0::/system.slice/job-42.scope\n",
+    )
+
+    assert (
+        get_current_cgroup_path(
+            proc_path=os.path.join(root, "proc"),
+            cgroup_root=os.path.join(root, "sys/fs/cgroup"),
+        )
+        == cgroup_path
+    )
+    assert is_cgroup_v2_compatible(cgroup_path=cgroup_path)
+    assert read_cgroup_pids(cgroup_path) == [101, 102, 103]
+    memory = read_cgroup_memory(cgroup_path)
+    assert memory["current"] == 1 << 20
+    assert memory["working_set"] == (1 << 20) - 4096
+
+
+def test_pids_of_nested_cgroups(tmpdir):
+    # like a Slurm job, whose tasks live in step_*/user/task_* and the job's cgroup has no processes of its own
+    cgroup_path = _fake_cgroupfs(str(tmpdir), usage_usec=0, memory_current=1 << 20)
+    _write(os.path.join(cgroup_path, "cgroup.procs"), "")
+    _write(os.path.join(cgroup_path, "step_0/user/task_0/cgroup.procs"), "201\n")
+    _write(os.path.join(cgroup_path, "step_0/user/task_1/cgroup.procs"), "202\n203\n")
+    _write(os.path.join(cgroup_path, "step_batch/cgroup.procs"), "204\n")
+    os.makedirs(os.path.join(cgroup_path, "step_0/user/removed"))
+
+    assert sorted(read_cgroup_pids(cgroup_path)) == [201, 202, 203, 204]
+    with pytest.raises(FileNotFoundError):
+        read_cgroup_pids(os.path.join(cgroup_path, "step_0/user/removed"))
+
+
+def test_tracker_rejects_a_path_that_isnt_a_cgroup(tmpdir):
+    # e.g. a typo or a cgroup v1 directory
+    missing = os.path.join(str(tmpdir), "sys/fs/cgroup/cpu/job-42")
+    os.makedirs(missing)
+    with pytest.raises(ValueError, match="cgroup v2"):
+        ImpactTracker(str(tmpdir.join("log")), cgroup_path=missing)
+    assert not is_cgroup_v2_compatible(cgroup_path=missing)
+
+
+def test_cgroup_power_attribution(tmpdir):
+    root = str(tmpdir)
+    cgroup_path = _fake_cgroupfs(root, usage_usec=0, memory_current=1 << 20)
+    proc_path = _fake_proc_stat(root, user_ticks=0, system_ticks=0)
+
+    start = datetime.now()
+    first_sample = _fake_rapl_sample(0, start)
+    second_sample = _fake_rapl_sample(20000000, start + timedelta(seconds=2))
+
+    with patch.object(rapl, "_is_rapl_compatible", lambda: True), patch.object(
+        rapl.RAPLMonitor, "sample", lambda: second_sample
+    ), patch.dict(
+        intel._cgroup_cpu_trackers,
+        {cgroup_path: CgroupCPUTracker(cgroup_path, proc_path=proc_path)},
+    ), patch.object(
+        intel, "_last_rapl_sample", first_sample
+    ):
+        # prime the baseline and then have the cgroup use 1 of the 4 cpu-seconds the system used
+        intel._cgroup_cpu_trackers[cgroup_path].sample()
+        _fake_cgroupfs(root, usage_usec=1000000, memory_current=1 << 20)
+        _fake_proc_stat(root, user_ticks=300, system_ticks=100)
+
+        results = intel.get_intel_power([], cgroup_path=cgroup_path)
+
+    np.testing.assert_allclose(results["rapl_power_draw_absolute"], 10.0, rtol=1e-3)
+    np.testing.assert_allclose(results["average_relative_cpu_utilization"], 0.25)
+    assert results["cpu_time_seconds"][cgroup_path]["user"] == 0.75
+    assert results["absolute_mem_usage"] == (1 << 20) - 4096
+    # 5W cores and 2.5W other at 25%, and some share of the 2.5W dram
+    assert 1.875 < results["rapl_estimated_attributable_power_draw"] < 1.875 + 2.5
@@ -0,0 +1,74 @@
+import subprocess
+import sys
+
+import pytest
+from shapely.geometry import box
+
+from experiment_impact_tracker.emissions import (cloud_regions, constants,
+                                                 get_region_metrics,
+                                                 region_resolver)
+
+
+def test_shipped_table_covers_every_region():
+    table = cloud_regions.load_table()
+    for provider in cloud_regions.PROVIDERS:
+        for name, latitude, longitude in cloud_regions.get_provider_regions(provider):
+            info = table["{}/{}".format(provider, name)]
+            assert (info["latitude"], info["longitude"]) == (latitude, longitude)
+            assert info["zone_id"] in constants.ZONE_INFO
+            assert (
+                info["carbon_intensity"]
+                == constants.ZONE_INFO[info["zone_id"]]["carbonIntensity"]
+            )
+
+    assert cloud_regions.get_cloud_region_info("AWS/us-west-1")["zone_id"] == "US-CA"
+    with pytest.raises(ValueError):
+        cloud_regions.get_cloud_region_info("aws/mars-north-1")
+
+
+def test_resolve_cloud_regions(monkeypatch):
+    # boxes are (min lon, min lat, max lon, max lat)
+    zones = [{"id": "US-CA", "geometry": box(-125, 32, -114, 42), "properties": {}}]
+    monkeypatch.setattr(
+        get_region_metrics,
+        "get_zone_index",
+        lambda: get_region_metrics.ZoneIndex(zones),
+    )
+    monkeypatch.setattr(constants, "REGIONS_WITH_BOUNDING_BOXES", zones, raising=False)
+
+    table = cloud_regions.resolve_cloud_regions(["aws", "gcp"])
+    assert len(table) == len(cloud_regions.get_provider_regions("aws")) + len(
+        cloud_regions.get_provider_regions("gcp")
+    )
+    assert table["aws/us-west-1"]["zone_id"] == "US-CA"
+    assert table["aws/us-east-1"]["zone_id"] is None
+    assert table["aws/us-east-1"]["carbon_intensity"] is None
+
+    # the tracker can be told which cloud region it runs in
+    region_resolver.clear_resolutions()
+    try:
+        resolution = region_resolver.resolve_region("gcp/us-west2")
+    finally:
+        region_resolver.clear_resolutions()
+    assert resolution["region"]["id"] == "US-CA"
+    assert resolution["source"] == region_resolver.SOURCE_OVERRIDE
+
+
+def test_cloud_region_override_skips_the_zone_geometries():
+    # in a new interpreter, since the tests load the geometries and shapely
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from experiment_impact_tracker.emissions import constants, region_resolver\n"
+            "resolution = region_resolver.resolve_region('aws/us-east-1')\n"
+            "print(resolution['region']['id'], resolution['zone_info']['carbonIntensity'] > 0, "
+            "'shapely' in sys.modules, 'REGIONS_WITH_BOUNDING_BOXES' in vars(constants))",
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    zone_id = cloud_regions.get_cloud_region_info("aws/us-east-1")["zone_id"]
+    assert output.stdout.split() == [zone_id, "True", "False", "False"]
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+import ujson as json
+
+from experiment_impact_tracker.data_schema import get_schema
+from experiment_impact_tracker.data_utils import (ARROWPATH, DATAPATH,
+                                                  FORMAT_ARROW,
+                                                  JSONLinesWriter,
+                                                  get_data_writer,
+                                                  load_data_into_frame)
+
+pa = pytest.importorskip("pyarrow")
+
+from experiment_impact_tracker import columnar_log  # isort:skip
+
+
+def _make_samples(count):
+    samples = []
+    for i in range(count):
+        sample = {
+            "timestamp": 1000.0 + i,
+            # missing at first, then reported
+            "rapl_power_draw_absolute": None if i < 3 else 10.0 + i,
+            # processes come and go
+            "cpu_time_seconds": {
+                100 + pid: {"user": float(i), "system": 0.5} for pid in range(i % 4)
+            },
+            "cpu_count_adjusted_average_load": [0.1, 0.2, 0.3],
+            "sampling_durations": {"timestamp": 0.001},
+        }
+        if i > 10:
+            sample["sampling_durations"]["rapl_power_draw_absolute"] = 0.01
+        if i == 20:
+            # a value that doesn't fit the schema so far, starts a new stream
+            sample["rapl_power_draw_absolute"] = "unavailable"
+        samples.append(sample)
+    return samples
+
+
+def _without_none(sample):
+    return {key: value for key, value in sample.items() if value is not None}
+
+
+def test_round_trip(tmpdir):
+    log_dir = str(tmpdir)
+    samples = _make_samples(25)
+    with get_data_writer(log_dir, FORMAT_ARROW, max_records=5) as writer:
+        for sample in samples:
+            writer.write(sample)
+    assert len(columnar_log.get_part_paths(log_dir)) > 1
+
+    frame, loaded = load_data_into_frame(log_dir)
+    # keyed values come back with string keys, like from json
+    assert loaded == [_without_none(json.loads(json.dumps(s))) for s in samples]
+    assert list(frame["timestamp"]) == [s["timestamp"] for s in samples]
+    # the declared float column leaves out what isn't a number
+    assert frame["rapl_power_draw_absolute"].dtype == "float64"
+    assert frame["rapl_power_draw_absolute"].isnull().sum() == 4
+    assert frame["sampling_durations.timestamp"].tolist() == [0.001] * 25
+    assert frame["cpu_time_seconds.101.user"].isnull().tolist()[:4] == [
+        True,
+        True,
+        False,
+        False,
+    ]
+    assert frame["cpu_time_seconds.101.user"][2] == 2.0
+
+    frame, loaded = load_data_into_frame(
+        log_dir, columns=["timestamp", "sampling_durations"], max_level=0
+    )
+    assert list(frame.columns) == ["timestamp", "sampling_durations"]
+    assert loaded[-1] == {
+        "timestamp": 1024.0,
+        "sampling_durations": {"timestamp": 0.001, "rapl_power_draw_absolute": 0.01},
+    }
+
+
+def test_readable_while_writing_and_after_truncation(tmpdir):
+    log_dir = str(tmpdir)
+    writer = get_data_writer(log_dir, FORMAT_ARROW, max_records=2)
+    for sample in _make_samples(5):
+        writer.write(sample)
+    # the fifth sample is still buffered
+    assert len(load_data_into_frame(log_dir)[1]) == 4
+
+    # as if the monitor was killed in the middle of writing out a batch
+    part_path = columnar_log.get_part_paths(log_dir)[-1]
+    size = os.path.getsize(part_path)
+    writer.flush()
+    with open(part_path, "r+b") as f:
+        f.truncate(size + (os.path.getsize(part_path) - size) // 2)
+    assert len(load_data_into_frame(log_dir)[1]) == 4
+    writer.close()
+
+
+def test_convert_log(tmpdir):
+    log_dir = str(tmpdir)
+    samples = _make_samples(21)
+    with JSONLinesWriter(os.path.join(log_dir, DATAPATH)) as writer:
+        for sample in samples:
+            writer.write(sample)
+    json_frame, json_samples = load_data_into_frame(log_dir)
+
+    assert columnar_log.convert_log(log_dir) == 21
+    assert os.path.isdir(os.path.join(log_dir, ARROWPATH))
+    frame, loaded = load_data_into_frame(log_dir)
+    # converted samples are coerced to the schema, "unavailable" is left out
+    assert loaded == [
+        _without_none(get_schema().coerce(sample)) for sample in json_samples
+    ]
+    assert list(frame.columns) == list(json_frame.columns)
+    for column in frame.columns:
+        assert frame[column].dtype == json_frame[column].dtype, column
+    for column in ("timestamp", "rapl_power_draw_absolute"):
+        assert frame[column].equals(json_frame[column])
+
+    # converting again replaces the log
+    assert columnar_log.convert_log(log_dir) == 21
+    assert len(columnar_log.get_part_paths(log_dir)) == 1
@@ -1,10 +1,17 @@
+import os
+import time
 from unittest.mock import patch
 
+import numpy as np
+import psutil
 import pytest
 
 from experiment_impact_tracker.compute_tracker import \
     _get_compatible_data_headers
 from experiment_impact_tracker.cpu.common import is_cpu_freq_compatible
+from experiment_impact_tracker.cpu.intel import ProcessCPUTracker
+from experiment_impact_tracker.operating_system.procfs import (
+    is_procfs_compatible, read_process_stats)
 
 
 def test_cpu_freq_is_avail():
@@ -12,3 +19,43 @@ def test_cpu_freq_is_avail():
         assert is_cpu_freq_compatible() == False
         headers = _get_compatible_data_headers()
         assert "cpu_freq" not in headers
+
+
+@pytest.mark.parametrize("use_procfs", [True, False])
+def test_process_cpu_tracker_measures_since_last_sample(use_procfs):
+    if use_procfs and not is_procfs_compatible():
+        pytest.skip("procfs is not available")
+    tracker = ProcessCPUTracker(use_procfs=use_procfs)
+    process = psutil.Process(os.getpid())
+
+    # nothing to diff against on the first call
+    assert tracker.sample([process]) is None
+
+    start = time.time()
+    while time.time() - start < 0.3:
+        pass
+
+    sample = tracker.sample([process])
+    assert sample["delta_time"] >= 0.3
+    assert sample["pids"].tolist() == [process.pid]
+    delta_proc = sample["deltas"][0]
+    user, system = sample["cpu_times"][0][:2]
+    assert delta_proc > 0
+    assert delta_proc <= sample["delta_system"] + 2e-2
+    assert user + system >= delta_proc
+    assert sample["rss"][0] > 0
+
+
+def test_procfs_matches_psutil():
+    if not is_procfs_compatible():
+        pytest.skip("procfs is not available")
+    process = psutil.Process(os.getpid())
+    pids, cpu_times, rss = read_process_stats([process.pid, 2 ** 22 + 1])
+
+    # pids that don't exist are skipped
+    assert pids.tolist() == [process.pid]
+    expected = process.cpu_times()
+    np.testing.assert_allclose(
+        cpu_times[0][:2], [expected.user, expected.system], atol=0.05
+    )
+    np.testing.assert_allclose(rss[0], process.memory_info().rss, rtol=0.1)
@@ -0,0 +1,141 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from pandas.io.json import json_normalize
+
+from experiment_impact_tracker.data_info_and_router import (DATA_HEADERS,
+                                                            SAMPLE_FIELDS)
+from experiment_impact_tracker.data_schema import (DTYPES, FLOAT64, Field,
+                                                   SampleSchema, build_frame,
+                                                   get_schema)
+from experiment_impact_tracker.data_utils import (DATAPATH, JSONLinesWriter,
+                                                  load_data_into_frame)
+
+# e.g. BENCHMARK_SAMPLES=1000000 for a long run's worth of samples
+BENCHMARK_SAMPLES = int(os.environ.get("BENCHMARK_SAMPLES", 100000))
+
+
+def test_every_data_header_is_declared():
+    schema = get_schema()
+    for header in DATA_HEADERS + SAMPLE_FIELDS:
+        assert header["dtype"] in DTYPES, header["name"]
+        assert "unit" in header, header["name"]
+        assert schema.get(header["name"]).shape == tuple(header["shape"])
+
+
+def test_coerce():
+    schema = get_schema()
+    sample = {
+        "timestamp": 1,
+        "realtime_carbon_intensity": "n/a",
+        "rapl_power_draw_absolute": "12.5",
+        "cpu_time_seconds": {123: {"user": 1, "system": None}},
+        "per_gpu_performance_state": {0: "P2"},
+        "process_ids": [1.0, 2],
+        "not_declared": {"kept": "as is"},
+    }
+    assert schema.coerce(sample) == {
+        "timestamp": 1.0,
+        "realtime_carbon_intensity": None,
+        "rapl_power_draw_absolute": 12.5,
+        "cpu_time_seconds": {"123": {"user": 1.0, "system": None}},
+        "per_gpu_performance_state": {"0": "P2"},
+        "process_ids": [1, 2],
+        "not_declared": {"kept": "as is"},
+    }
+
+    bad = {"timestamp": 1.0, "process_ids": [1.5], "cpu_freq": "fast"}
+    assert schema.coerce(bad) == {"timestamp": 1.0}
+    with pytest.raises(ValueError):
+        schema.coerce(bad, strict=True)
+
+    with pytest.raises(ValueError):
+        SampleSchema([Field("x", "float32", None, (), None)])
+    with pytest.raises(ValueError):
+        SampleSchema([Field("x", FLOAT64, None, ("matrix",), None)])
+
+
+def _make_samples(count, pids=4, undeclared=True):
+    samples = []
+    for i in range(count):
+        sample = {
+            "timestamp": 1000.0 + i,
+            "rapl_power_draw_absolute": 20.0 + i % 7,
+            "realtime_carbon_intensity": None if i % 2 else 250.0,
+            "cpu_time_seconds": {
+                str(100 + pid): {"user": float(i), "system": 0.5} for pid in range(pids)
+            },
+            "per_gpu_performance_state": {"0": "P2"},
+            "cpu_count_adjusted_average_load": [0.1, 0.2, 0.3],
+            "process_ids": list(range(100, 100 + pids)),
+            "sampling_durations": {"timestamp": 0.001, "cpu_time_seconds": 0.01},
+        }
+        if undeclared:
+            sample["not_declared"] = {"a": i, "b": "x"}
+        samples.append(sample)
+    return samples
+
+
+def test_build_frame_matches_json_normalize():
+    samples = _make_samples(20)
+    samples[3]["rapl_power_draw_absolute"] = "n/a"
+    samples[5]["cpu_time_seconds"]["999"] = {"user": 1.0, "system": 1.0}
+    del samples[7]["timestamp"]
+
+    for max_level in (None, 0, 1):
+        frame = build_frame(samples, max_level=max_level)
+        normalized = json_normalize(samples, max_level=max_level)
+        assert sorted(frame.columns) == sorted(normalized.columns)
+
+    frame = build_frame(samples)
+    assert frame["timestamp"].dtype == np.float64
+    assert np.isnan(frame["timestamp"][7])
+    assert frame["realtime_carbon_intensity"].dtype == np.float64
+    assert frame["rapl_power_draw_absolute"].isnull().sum() == 1
+    assert frame["cpu_time_seconds.999.user"].isnull().sum() == 19
+    assert frame["per_gpu_performance_state.0"].tolist() == ["P2"] * 20
+    assert frame["process_ids"][0] == [100, 101, 102, 103]
+    assert frame["not_declared.a"].tolist() == list(range(20))
+
+
+def test_load_json_log_with_declared_dtypes(tmpdir):
+    log_dir = str(tmpdir)
+    schema = get_schema()
+    with JSONLinesWriter(
+        os.path.join(log_dir, DATAPATH), sample_schema=schema
+    ) as writer:
+        for sample in _make_samples(10):
+            sample["realtime_carbon_intensity"] = "n/a"
+            writer.write(sample)
+    frame, samples = load_data_into_frame(log_dir)
+    assert samples[0]["realtime_carbon_intensity"] is None
+    assert frame["realtime_carbon_intensity"].dtype == np.float64
+    assert frame["realtime_carbon_intensity"].isnull().all()
+
+
+def test_build_frame_of_declared_samples():
+    # everything the monitor logs is declared
+    samples = _make_samples(50, undeclared=False)
+    frame = build_frame(samples)
+    assert sorted(frame.columns) == sorted(json_normalize(samples).columns)
+    assert frame["cpu_time_seconds.100.user"].dtype == np.float64
+
+
+@pytest.mark.benchmark
+def test_build_frame_benchmark(record_property):
+    samples = _make_samples(BENCHMARK_SAMPLES, undeclared=False)
+
+    start = time.perf_counter()
+    build_frame(samples)
+    typed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json_normalize(samples)
+    inferred = time.perf_counter() - start
+
+    record_property("samples", len(samples))
+    record_property("schema_seconds", typed)
+    record_property("json_normalize_seconds", inferred)
+    assert typed < inferred
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from experiment_impact_tracker.cpu import common
+from experiment_impact_tracker.operating_system import host_cache
+
+
+@pytest.fixture
+def cache_dir(tmpdir, monkeypatch):
+    cache_dir = os.path.join(str(tmpdir), "cache")
+    monkeypatch.setenv("OVERRIDE_HOST_CACHE_DIR", cache_dir)
+    host_cache.clear_memo()
+    yield cache_dir
+    host_cache.clear_memo()
+
+
+def test_probes_once_per_host(cache_dir):
+    calls = []
+
+    def probe(value):
+        calls.append(value)
+        return {"name": value, "clocks": (1410, 1593)}
+
+    first = host_cache.get_cached("thing", probe, "a100")
+    # in process
+    assert host_cache.get_cached("thing", probe, "a100") == first
+    # a new process on the same host
+    host_cache.clear_memo()
+    assert host_cache.get_cached("thing", probe, "a100") == first
+
+    assert calls == ["a100"]
+    # the same after a round trip through the cache, whether it was probed or not
+    assert first == {"name": "a100", "clocks": [1410, 1593]}
+    assert os.listdir(cache_dir) == [host_cache.get_host_fingerprint()]
+
+
+def test_new_fingerprint_probes_again(cache_dir, monkeypatch):
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return len(calls)
+
+    assert host_cache.get_cached("thing", probe) == 1
+    host_cache.clear_memo()
+    # e.g. after a reboot or driver upgrade
+    monkeypatch.setattr(host_cache, "get_boot_id", lambda: "another-boot")
+    assert host_cache.get_cached("thing", probe) == 2
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_memory_only_without_cache_dir(monkeypatch):
+    monkeypatch.setenv("OVERRIDE_HOST_CACHE_DIR", "")
+    host_cache.clear_memo()
+    calls = []
+    try:
+        for _ in range(3):
+            host_cache.get_cached("thing", lambda: calls.append(1))
+    finally:
+        host_cache.clear_memo()
+    assert len(calls) == 1
+
+
+def test_cpu_info_and_assertions_use_the_cache(cache_dir, monkeypatch):
+    calls = []
+
+    def get_cpu_info():
+        calls.append(1)
+        return {"brand_raw": "Fake CPU @ 2.60GHz", "count": 4}
+
+    monkeypatch.setattr(common.cpuinfo, "get_cpu_info", get_cpu_info)
+    info = common.get_my_cpu_info()
+    assert info["brand_raw"] == "Fake CPU @ 2.60GHz"
+    common.assert_cpus_by_attributes({"brand_raw": "Fake CPU @ 2.60GHz"})
+    with pytest.raises(common.CPUAttributeAssertionError):
+        common.assert_cpus_by_attributes({"count": 8})
+    assert len(calls) == 1
+    # the per process part isn't cached
+    assert "usable_cpus" not in host_cache.get_cached("cpu_info", get_cpu_info)
+
+
+def test_max_age_and_refresh(cache_dir, monkeypatch):
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return len(calls)
+
+    now = [1000.0]
+    monkeypatch.setattr(host_cache.time, "time", lambda: now[0])
+    assert host_cache.get_cached("thing", probe, max_age=60) == 1
+    now[0] += 30
+    assert host_cache.get_cached("thing", probe, max_age=60) == 1
+    host_cache.clear_memo()
+    assert host_cache.get_cached("thing", probe, max_age=60) == 1
+
+    # expired, in memory and on disk
+    now[0] += 31
+    assert host_cache.get_cached("thing", probe, max_age=60) == 2
+    host_cache.clear_memo()
+    assert host_cache.get_cached("thing", probe, max_age=60) == 2
+
+    assert host_cache.get_cached("thing", probe, refresh=True) == 3
+    host_cache.clear_memo()
+    assert host_cache.get_cached("thing", probe) == 3
@@ -0,0 +1,71 @@
+import subprocess
+import sys
+
+import pytest
+
+# cumulative time python reports for importing compute_tracker, in seconds. It's around 0.2s on a laptop, most of
+# it numpy, and was over 2s when the zone geometries were loaded at import time.
+IMPORT_TIME_BUDGET = 0.75
+
+# only needed for specific features (realtime carbon, scraping TDPs, region lookup, analysis, columnar logs), loaded
+# on first use
+LAZY_MODULES = (
+    "pandas",
+    "requests",
+    "bs4",
+    "shapely",
+    "progiter",
+    "pkg_resources",
+    "pyarrow",
+)
+
+
+def _import_in_new_interpreter(module):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, {module}; print(' '.join(sorted(sys.modules)))".format(
+                module=module
+            ),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    loaded = set(output.stdout.split())
+    for line in output.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return loaded, int(fields[1]) / 1e6
+    raise AssertionError("no import time reported for {}".format(module))
+
+
+def test_heavy_modules_are_imported_lazily():
+    loaded, _ = _import_in_new_interpreter("experiment_impact_tracker.compute_tracker")
+    assert loaded.isdisjoint(LAZY_MODULES)
+
+
+@pytest.mark.benchmark
+def test_import_time_budget(record_property):
+    # best of a few runs to not fail on a busy machine
+    durations = [
+        _import_in_new_interpreter("experiment_impact_tracker.compute_tracker")[1]
+        for _ in range(3)
+    ]
+    record_property("import_seconds", min(durations))
+    assert min(durations) < IMPORT_TIME_BUDGET
+
+
+def test_constants_are_loaded_on_first_access():
+    from experiment_impact_tracker.emissions import constants
+
+    assert "ZONE_INFO" in dir(constants)
+    assert constants.ZONE_INFO["US-CA"]["carbonIntensity"] > 0
+    assert constants.ZONE_INFO is constants.ZONE_INFO
+    with pytest.raises(AttributeError):
+        constants.NOT_A_CONSTANT
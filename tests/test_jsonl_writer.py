@@ -0,0 +1,137 @@
+import logging
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+import ujson as json
+
+from experiment_impact_tracker.compute_tracker import (STOP_MESSAGE,
+                                                    TERMINATE_TIMEOUT,
+                                                    ImpactTracker,
+                                                    launch_power_monitor)
+from experiment_impact_tracker.data_utils import (DATAPATH, FORMAT_ARROW,
+                                                  FORMAT_JSON, FSYNC_ON_CLOSE,
+                                                  FSYNC_ON_FLUSH,
+                                                  JSONLinesWriter,
+                                                  check_data_format)
+from experiment_impact_tracker.latest_sample import LatestSampleChannel
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_flushes_after_max_records(tmpdir):
+    path = str(tmpdir.join("nested", "data.json"))
+    with JSONLinesWriter(path, max_records=3, max_interval=60) as writer:
+        writer.write({"i": 0})
+        writer.write({"i": 1})
+        assert _read_lines(path) == []
+        writer.write({"i": 2})
+        assert _read_lines(path) == [{"i": 0}, {"i": 1}, {"i": 2}]
+        writer.write({"i": 3})
+        assert len(_read_lines(path)) == 3
+    # closing writes out the rest
+    assert _read_lines(path) == [{"i": i} for i in range(4)]
+    assert writer.closed
+
+
+def test_flushes_after_max_bytes_and_interval(tmpdir):
+    path = str(tmpdir.join("data.json"))
+    with JSONLinesWriter(path, max_records=100, max_bytes=30, max_interval=60) as w:
+        w.write({"value": "a" * 10})
+        assert _read_lines(path) == []
+        w.write({"value": "b" * 10})
+        assert len(_read_lines(path)) == 2
+
+    path = str(tmpdir.join("data2.json"))
+    with JSONLinesWriter(path, max_records=100, max_interval=0.2) as w:
+        w.write({"i": 0})
+        assert _read_lines(path) == []
+        time.sleep(0.3)
+        w.write({"i": 1})
+        assert _read_lines(path) == [{"i": 0}, {"i": 1}]
+
+
+def test_appends_and_fsync_policies(tmpdir):
+    path = str(tmpdir.join("data.json"))
+    for fsync in (FSYNC_ON_FLUSH, FSYNC_ON_CLOSE):
+        writer = JSONLinesWriter(path, max_records=1, fsync=fsync)
+        writer.write({"fsync": fsync})
+        writer.close()
+        writer.close()
+        with pytest.raises(ValueError):
+            writer.write({})
+    assert _read_lines(path) == [{"fsync": FSYNC_ON_FLUSH}, {"fsync": FSYNC_ON_CLOSE}]
+
+    with pytest.raises(ValueError):
+        JSONLinesWriter(path, fsync="sometimes")
+
+
+def _counter_factory():
+    count = [0]
+
+    def _counter(*args, **kwargs):
+        count[0] += 1
+        return count[0]
+
+    return _counter
+
+
+FAKE_HEADERS = [
+    {
+        "name": "counter",
+        "compatability": [lambda *args, **kwargs: True],
+        "routing": {"function": _counter_factory()},
+    }
+]
+
+
+@patch("experiment_impact_tracker.compute_tracker.SLEEP_TIME", 0.05)
+@patch("experiment_impact_tracker.compute_tracker.DATA_HEADERS", FAKE_HEADERS)
+@patch("experiment_impact_tracker.data_utils.DATA_FLUSH_RECORDS", 100000)
+@patch("experiment_impact_tracker.data_utils.DATA_FLUSH_INTERVAL", 600)
+@pytest.mark.parametrize("stop", ["message", "terminate"])
+def test_monitor_writes_out_buffered_samples(tmpdir, stop):
+    log_dir = str(tmpdir)
+    data_path = os.path.join(log_dir, DATAPATH)
+    channel = LatestSampleChannel()
+    p, queue = launch_power_monitor(
+        log_dir,
+        {"region": {"id": "US-CA"}},
+        logging.getLogger(__name__),
+        latest_sample=channel,
+    )
+    try:
+        deadline = time.time() + 30
+        while (channel.read() or {}).get("counter", 0) < 5:
+            assert time.time() < deadline
+            time.sleep(0.05)
+        # everything is still buffered
+        assert os.path.getsize(data_path) == 0
+    finally:
+        if stop == "message":
+            queue.put(STOP_MESSAGE)
+        else:
+            p.terminate()
+        p.join(TERMINATE_TIMEOUT)
+
+    assert p.exitcode == 0
+    counters = [sample["counter"] for sample in _read_lines(data_path)]
+    assert len(counters) >= 5
+    assert counters == list(range(1, len(counters) + 1))
+
+
+def test_tracker_checks_the_data_format(tmpdir, monkeypatch):
+    assert check_data_format(FORMAT_JSON) == FORMAT_JSON
+    with pytest.raises(ValueError):
+        ImpactTracker(str(tmpdir), data_format="csv")
+
+    # as if pyarrow wasn't installed
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ImportError, match="pyarrow"):
+        ImpactTracker(str(tmpdir), data_format=FORMAT_ARROW)
+    assert not os.listdir(str(tmpdir))
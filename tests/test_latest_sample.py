@@ -0,0 +1,69 @@
+import multiprocessing
+
+import ujson as json
+
+from experiment_impact_tracker.compute_tracker import (_read_last_line,
+                                                    read_latest_stats)
+from experiment_impact_tracker.data_utils import (DATAPATH, safe_file_path,
+                                                  write_json_data_to_file)
+from experiment_impact_tracker.latest_sample import LatestSampleChannel
+
+
+def test_publish_and_read():
+    channel = LatestSampleChannel(capacity=64)
+    assert channel.read() is None
+    channel.publish({"timestamp": 1, "power": 10.5})
+    assert channel.read() == {"timestamp": 1, "power": 10.5}
+    channel.publish({"timestamp": 2})
+    assert channel.read() == {"timestamp": 2}
+
+    # doesn't fit, readers have to fall back to data.json
+    channel.publish({"timestamp": 3, "process_ids": list(range(100))})
+    assert channel.read() is None
+    channel.publish({"timestamp": 4})
+    assert channel.read() == {"timestamp": 4}
+
+
+def _publish_many(channel, count):
+    for i in range(count):
+        # samples of different lengths so a torn read would be noticed
+        channel.publish({"i": i, "values": [i] * (i % 50)})
+
+
+def test_reads_are_never_torn():
+    channel = LatestSampleChannel()
+    writer = multiprocessing.get_context("fork").Process(
+        target=_publish_many, args=(channel, 20000)
+    )
+    writer.start()
+    last = -1
+    reads = 0
+    while writer.is_alive() or reads == 0:
+        sample = channel.read()
+        if sample is None:
+            continue
+        reads += 1
+        assert sample["values"] == [sample["i"]] * (sample["i"] % 50)
+        assert sample["i"] >= last
+        last = sample["i"]
+    writer.join()
+    assert writer.exitcode == 0
+    assert channel.read()["i"] == 19999
+
+
+def test_read_latest_stats_without_tail(tmpdir):
+    log_dir = str(tmpdir)
+    log_path = safe_file_path(str(tmpdir.join(DATAPATH)))
+    assert read_latest_stats(log_dir) is None
+    open(log_path, "w").close()
+    assert read_latest_stats(log_dir) is None
+
+    for i in range(100):
+        write_json_data_to_file(log_path, {"i": i, "padding": "x" * i})
+    assert read_latest_stats(log_dir) == {"i": 99, "padding": "x" * 99}
+    # lines spanning several blocks
+    assert json.loads(_read_last_line(log_path, block_size=7))["i"] == 99
+
+    with open(log_path, "w") as f:
+        f.write('{"i": 0}')
+    assert _read_last_line(log_path, block_size=3) == b'{"i": 0}'
@@ -3,9 +3,13 @@ import time
 
 import numpy as np
 import psutil
+import pytest
 
 from experiment_impact_tracker.compute_tracker import ImpactTracker
 from experiment_impact_tracker.data_interface import DataInterface
+from experiment_impact_tracker.memory.common import (ProcessMemoryTracker,
+                                                     is_smaps_rollup_compatible,
+                                                     read_smaps_rollup)
 
 
 def test_ram_attribution():
@@ -35,3 +39,32 @@ def test_ram_attribution():
     di2 = DataInterface(fname2)
 
     np.testing.assert_almost_equal(di.total_power * 2, di2.total_power, decimal=4)
+
+
+def test_memory_tracker_scales_pss_between_full_readings():
+    process = psutil.Process()
+    tracker = ProcessMemoryTracker(full_sample_interval=3600)
+
+    first = tracker.sample([process])[process.pid]
+    assert first["pss"] > 0
+    assert first["uss"] <= first["rss"]
+
+    # in between full readings pss follows the cheap rss reading
+    info = tracker.sample([process], rss={process.pid: first["rss"] * 2})[process.pid]
+    np.testing.assert_allclose(info["rss"], first["rss"] * 2)
+    np.testing.assert_allclose(info["pss"], first["pss"] * 2)
+    np.testing.assert_allclose(info["uss"], first["uss"] * 2)
+
+    tracker.full_sample_interval = 0
+    info = tracker.sample([process])[process.pid]
+    assert info["rss"] < first["rss"] * 2
+
+
+def test_smaps_rollup_matches_psutil():
+    if not is_smaps_rollup_compatible():
+        pytest.skip("smaps_rollup is not available")
+    process = psutil.Process()
+    rollup = read_smaps_rollup(process.pid)
+    full = process.memory_full_info()
+    np.testing.assert_allclose(rollup["pss"], full.pss, rtol=0.1)
+    np.testing.assert_allclose(rollup["uss"], full.uss, rtol=0.1)
@@ -0,0 +1,128 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from experiment_impact_tracker.gpu import nvidia, nvml
+from experiment_impact_tracker.gpu.nvidia import (PmonMonitor, PmonStream,
+                                                  _parse_pmon_line)
+
+PMON_HEADER = [
+    "# gpu        pid  type    sm   mem   enc   dec   command",
+    "# Idx          #   C/G     %     %     %     %   name",
+]
+
+GPU_XML = """<gpu id="{gpu_id}">
+    <product_name>Tesla V100-SXM2-16GB</product_name>
+    <performance_state>P0</performance_state>
+    <fb_memory_usage><total>16160 MiB</total><used>1000 MiB</used><free>15160 MiB</free></fb_memory_usage>
+    <utilization><gpu_util>40 %</gpu_util><memory_util>10 %</memory_util></utilization>
+    <power_readings><power_draw>{power} W</power_draw></power_readings>
+    <processes>{processes}</processes>
+</gpu>"""
+
+PROCESS_XML = """<process_info><pid>{pid}</pid><process_name>python</process_name>
+<used_memory>1000 MiB</used_memory></process_info>"""
+
+# prints pmon rows every 10ms (process 4242 alternates between 20% and 60% of gpu 0, gpu 1 is idle) and reprints the
+# headers every few rows like nvidia-smi does. -q -x reports 2 gpus with 4242 on gpu 0.
+FAKE_NVIDIA_SMI = """#!{python}
+import sys
+import time
+
+args = sys.argv[1:]
+if not args:
+    print("NVIDIA-SMI 535.54.03   Driver Version: 535.54.03   CUDA Version: 12.2")
+elif args[0] == "pmon":
+    i = 0
+    while True:
+        if i % 6 == 0:
+            print({header!r}, flush=True)
+        sm = 20 if i % 2 == 0 else 60
+        print("    0       4242     C    {{}}    10     -     -   python".format(sm), flush=True)
+        print("    1          -     -     -     -     -     -   -", flush=True)
+        i += 1
+        time.sleep(0.01)
+elif args[:2] == ["-q", "-x"]:
+    print({xml!r})
+else:
+    # an old nvidia-smi without --query-gpu
+    sys.exit(2)
+"""
+
+
+@pytest.fixture
+def fake_nvidia_smi(tmpdir, monkeypatch):
+    if not sys.platform.startswith("linux"):
+        pytest.skip("the fake nvidia-smi is a linux executable")
+    xml = "<nvidia_smi_log><driver_version>535.54.03</driver_version><cuda_version>12.2</cuda_version>"
+    xml += "<attached_gpus>2</attached_gpus>"
+    xml += GPU_XML.format(gpu_id=0, power=250.0, processes=PROCESS_XML.format(pid=4242))
+    xml += GPU_XML.format(gpu_id=1, power=50.0, processes="")
+    xml += "</nvidia_smi_log>"
+
+    path = os.path.join(str(tmpdir), "nvidia-smi")
+    with open(path, "w") as f:
+        f.write(
+            FAKE_NVIDIA_SMI.format(
+                python=sys.executable, header="\n".join(PMON_HEADER), xml=xml
+            )
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmpdir) + os.pathsep + os.environ["PATH"])
+    # make sure we go through nvidia-smi even if NVML happens to be around
+    monkeypatch.setattr(nvml, "_nvml_unavailable", True)
+    monkeypatch.setattr(nvidia, "_query_supported", None)
+    return path
+
+
+def test_parse_pmon_line():
+    columns = PMON_HEADER[0].lstrip("#").split()
+    assert _parse_pmon_line(
+        columns, "    0       4242     C    45    10     -     -   python"
+    ) == ((0, 4242), {"sm": 45.0, "mem": 10.0, "enc": 0.0, "dec": 0.0})
+    # idle gpu
+    assert (
+        _parse_pmon_line(columns, "    1          -     -     -     -     -     -   -")
+        is None
+    )
+    assert _parse_pmon_line(columns, PMON_HEADER[1]) is None
+
+
+def test_pmon_stream_averages_since_last_call(fake_nvidia_smi):
+    stream = PmonStream().start()
+    try:
+        stream.averages()
+        time.sleep(0.5)
+        assert stream.running
+        averages = stream.averages()
+    finally:
+        stream.stop()
+
+    assert list(averages.keys()) == [(0, 4242)]
+    assert averages[(0, 4242)]["sm"] == pytest.approx(40.0, abs=5.0)
+    assert averages[(0, 4242)]["mem"] == 10.0
+    assert not stream.running
+
+
+def test_nvidia_gpu_power_from_pmon_stream(fake_nvidia_smi):
+    assert nvidia.is_nvidia_compatible()
+    PmonMonitor.start_stream()
+    try:
+        assert PmonMonitor.streaming()
+        start = time.time()
+        results = nvidia.get_nvidia_gpu_power([4242])
+        # no several second nvidia-smi pmon -c 5 run
+        assert time.time() - start < 2.0
+    finally:
+        PmonMonitor.stop_stream()
+
+    assert results["nvidia_draw_absolute"] == 300.0
+    # 4242 is the only process on gpu 0
+    assert results["nvidia_estimated_attributable_power_draw"] == pytest.approx(250.0)
+    assert results["per_gpu_performance_state"] == {0: "P0"}
+    assert results["per_gpu_average_estimated_utilization_absolute"][(0, 4242)][
+        "sm"
+    ] == pytest.approx(40.0, abs=20.0)
@@ -0,0 +1,56 @@
+import os
+import timeit
+
+import pytest
+
+from experiment_impact_tracker.gpu.nvidia import (_parse_gpu_query,
+                                                  _parse_gpu_xml, _to_number)
+
+# one state of an 8 x A100 node in the format nvidia-smi 535 prints it for -q -x and for the two queries
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "nvidia_smi")
+
+
+def _read(name, mode="r"):
+    with open(os.path.join(DATA_DIR, name), mode) as f:
+        return f.read()
+
+
+def test_to_number():
+    assert _to_number("312.45 W") == 312.45
+    assert _to_number("87 %") == 87.0
+    assert _to_number("312.45") == 312.45
+    assert _to_number("N/A") == 0.0
+    assert _to_number("[Not Supported]") == 0.0
+    assert _to_number(None) == 0.0
+
+
+def test_query_and_xml_agree():
+    from_xml = _parse_gpu_xml(_read("query_8_gpus.xml", "rb"))
+    from_query = _parse_gpu_query(
+        _read("query_gpu_8_gpus.csv"), _read("query_compute_apps_8_gpus.csv")
+    )
+
+    assert len(from_query) == 8
+    assert from_query == from_xml
+    assert [p["pid"] for p in from_query[0]["processes"]] == [41230, 52000]
+    assert from_query[7]["processes"] == []
+    assert from_query[7]["performance_state"] == "P2"
+
+
+@pytest.mark.benchmark
+def test_query_parse_benchmark(record_property):
+    xml = _read("query_8_gpus.xml", "rb")
+    gpu_csv = _read("query_gpu_8_gpus.csv")
+    compute_apps_csv = _read("query_compute_apps_8_gpus.csv")
+
+    number = 50
+    xml_seconds = timeit.timeit(lambda: _parse_gpu_xml(xml), number=number) / number
+    query_seconds = (
+        timeit.timeit(
+            lambda: _parse_gpu_query(gpu_csv, compute_apps_csv), number=number
+        )
+        / number
+    )
+    record_property("xml_seconds", xml_seconds)
+    record_property("query_seconds", query_seconds)
+    assert query_seconds < xml_seconds
@@ -0,0 +1,122 @@
+import timeit
+
+import fake_nvml
+import pytest
+
+from experiment_impact_tracker.gpu import nvidia, nvml
+from experiment_impact_tracker.gpu.nvml import NVMLCollector
+
+
+@pytest.fixture
+def fake_gpus(monkeypatch):
+    fake_nvml.set_devices(
+        [
+            # our process 100 shares gpu 0 with someone else's process 900
+            fake_nvml.FakeDevice(
+                power_mw=200000,
+                performance_state=0,
+                processes=[100, 900],
+                utilization_samples=[
+                    (100, 1, 60, 10, 0, 0),
+                    (100, 2, 40, 10, 0, 0),
+                    (900, 2, 50, 20, 0, 0),
+                ],
+            ),
+            # gpu 1 isn't ours
+            fake_nvml.FakeDevice(
+                power_mw=50000,
+                performance_state=8,
+                processes=[900],
+                utilization_samples=[(900, 1, 20, 5, 0, 0)],
+                graphics_supported=False,
+            ),
+        ]
+    )
+    fake_nvml.nvmlInit()
+    monkeypatch.setattr(nvml, "_nvml", fake_nvml)
+    monkeypatch.setattr(nvml, "_nvml_unavailable", False)
+    monkeypatch.setattr(nvml, "_collector", None)
+    return fake_nvml
+
+
+def test_collector_attributes_gpu_power(fake_gpus):
+    results = NVMLCollector(nvml=fake_gpus).sample({100})
+
+    assert results["nvidia_draw_absolute"] == 250.0
+    # process 100 used 50 of the 100 sm percent on gpu 0
+    assert results["nvidia_estimated_attributable_power_draw"] == pytest.approx(100.0)
+    assert results["average_gpu_estimated_utilization_absolute"] == pytest.approx(0.5)
+    assert results["average_gpu_estimated_utilization_relative"] == pytest.approx(0.5)
+    assert results["per_gpu_performance_state"] == {0: "P0"}
+    assert results["per_gpu_power_draw"] == {0: 200.0}
+    assert results["per_gpu_average_estimated_utilization_absolute"][(0, 100)] == {
+        "sm": 50.0,
+        "mem": 10.0,
+        "enc": 0.0,
+        "dec": 0.0,
+    }
+    assert (1, 900) in results["per_gpu_average_estimated_utilization_absolute"]
+
+
+def test_collector_only_averages_new_utilization_samples(fake_gpus):
+    collector = NVMLCollector(nvml=fake_gpus)
+    collector.sample({100})
+    # nothing new since the last sample
+    results = collector.sample({100})
+    assert results["nvidia_estimated_attributable_power_draw"] == 0
+    assert results["per_gpu_average_estimated_utilization_absolute"] == {}
+
+    device = fake_gpus.nvmlDeviceGetHandleByIndex(0)
+    device.utilization_samples.append(
+        fake_nvml.ProcessUtilizationSample(100, 3, 80, 0, 0, 0)
+    )
+    results = collector.sample({100})
+    assert results["nvidia_estimated_attributable_power_draw"] == pytest.approx(200.0)
+
+
+def test_nvidia_gpu_power_prefers_nvml(fake_gpus):
+    assert nvidia.is_nvidia_compatible()
+    results = nvidia.get_nvidia_gpu_power([100])
+    assert results["per_gpu_power_draw"] == {0: 200.0}
+
+
+def test_gpu_info_without_nvidia_smi(fake_gpus, monkeypatch, tmpdir):
+    # e.g. a container that only mounts libnvidia-ml
+    monkeypatch.setenv("PATH", str(tmpdir))
+
+    def no_nvidia_smi(*args, **kwargs):
+        raise FileNotFoundError("nvidia-smi")
+
+    monkeypatch.setattr(nvidia, "Popen", no_nvidia_smi)
+    assert nvidia.is_nvidia_compatible()
+    gpu_info = nvidia.get_gpu_info()
+    assert len(gpu_info) == 2
+    assert gpu_info[0] == {
+        "name": "Fake GPU",
+        "total_memory": "16384 MiB",
+        "driver_version": "535.54.03",
+        "cuda_version": "12.2",
+    }
+
+
+@pytest.mark.benchmark
+def test_nvml_sample_benchmark(fake_gpus, record_property):
+    fake_nvml.set_devices(
+        [
+            fake_nvml.FakeDevice(
+                processes=range(100, 116),
+                utilization_samples=[
+                    (pid, t, 5, 1, 0, 0) for t in range(1, 6) for pid in range(100, 116)
+                ],
+            )
+            for _ in range(8)
+        ]
+    )
+    collector = NVMLCollector(nvml=fake_gpus)
+    seconds = (
+        timeit.timeit(lambda: collector.sample(set(range(100, 108))), number=100)
+        / 100.0
+    )
+    record_property("sample_seconds", seconds)
+    # nvidia-smi pmon alone takes several seconds per sample
+    assert seconds < 0.05
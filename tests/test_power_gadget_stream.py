@@ -0,0 +1,120 @@
+import os
+import shutil
+import stat
+import sys
+import time
+
+import pytest
+
+from experiment_impact_tracker.cpu.powercap import (PowerGadgetMonitor,
+                                                    PowerGadgetStream,
+                                                    _parse_power_log_line)
+
+HEADER = (
+    "System Time,RDTSC,Elapsed Time (sec),CPU Frequency_0(MHz),"
+    "Processor Power_0(Watt),Cumulative Processor Energy_0(Joules),"
+    "IA Power_0(Watt),DRAM Power_0(Watt)"
+)
+
+# prints a header, then one row every 10ms alternating between 10W and 30W of package power until it is killed
+FAKE_POWER_GADGET = """#!{python}
+import sys
+import time
+
+print("Intel(R) Power Gadget")
+print({header!r}, flush=True)
+i = 0
+while True:
+    power = 10.0 if i % 2 == 0 else 30.0
+    print("12:00:00:000,{{}},{{}},2400,{{}},{{}},{{}},1.5".format(i, i * 0.01, power, i, power / 2), flush=True)
+    i += 1
+    time.sleep(0.01)
+"""
+
+# like the real one, which uses C stdio: its output is only line buffered when run under stdbuf -oL, otherwise it
+# comes out in blocks, here after a few seconds
+FAKE_BUFFERED_POWER_GADGET = """#!{python}
+import os
+import time
+
+line_buffered = os.environ.get("_STDBUF_O") == "L"
+out = open(1, "w", buffering=1 if line_buffered else 8192, closefd=False)
+print({header!r}, file=out)
+i = 0
+while True:
+    print("12:00:00:000,{{}},{{}},2400,20.0,{{}},10.0,1.5".format(i, i * 0.05, i), file=out)
+    i += 1
+    time.sleep(0.05)
+"""
+
+
+def _install_fake_power_gadget(tmpdir, monkeypatch, script):
+    if not sys.platform.startswith("linux"):
+        pytest.skip("the fake power gadget mimics the linux one")
+    path = os.path.join(str(tmpdir), "power_gadget")
+    with open(path, "w") as f:
+        f.write(script.format(python=sys.executable, header=HEADER))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmpdir) + os.pathsep + os.environ["PATH"])
+    return path
+
+
+@pytest.fixture
+def fake_power_gadget(tmpdir, monkeypatch):
+    return _install_fake_power_gadget(tmpdir, monkeypatch, FAKE_POWER_GADGET)
+
+
+def test_parse_power_log_line():
+    columns = HEADER.split(",")
+    readings = _parse_power_log_line(
+        columns, "12:00:00:000,1,0.1,2400,12.5,100.0,6.25,1.5\n"
+    )
+    assert readings == {
+        "CPU Frequency_0(MHz)": 2400.0,
+        "Processor Power_0(Watt)": 12.5,
+        "IA Power_0(Watt)": 6.25,
+        "DRAM Power_0(Watt)": 1.5,
+    }
+    # summary power gadget prints when it exits
+    assert _parse_power_log_line(columns, "Total Elapsed Time(sec)=10.0\n") is None
+
+
+def test_stream_averages_readings_since_last_call(fake_power_gadget):
+    stream = PowerGadgetStream(resolution=10).start()
+    try:
+        first = stream.averages()
+        time.sleep(0.5)
+        assert stream.running
+        second = stream.averages()
+    finally:
+        stream.stop()
+
+    assert 10.0 <= first["Processor Power_0(Watt)"] <= 30.0
+    # roughly as many 10W as 30W readings
+    assert second["Processor Power_0(Watt)"] == pytest.approx(20.0, abs=2.5)
+    assert second["IA Power_0(Watt)"] == pytest.approx(10.0, abs=1.25)
+    assert second["DRAM Power_0(Watt)"] == 1.5
+    assert "Cumulative Processor Energy_0(Joules)" not in second
+    assert not stream.running
+
+
+def test_monitor_samples_from_stream(fake_power_gadget):
+    PowerGadgetMonitor.start_stream(resolution=10)
+    try:
+        assert PowerGadgetMonitor.streaming()
+        assert PowerGadgetMonitor.sample()["DRAM Power_0(Watt)"] == 1.5
+    finally:
+        PowerGadgetMonitor.stop_stream()
+    assert not PowerGadgetMonitor.streaming()
+
+
+def test_stream_readings_are_not_held_back_by_buffering(tmpdir, monkeypatch):
+    if shutil.which("stdbuf") is None:
+        pytest.skip("needs stdbuf")
+    _install_fake_power_gadget(tmpdir, monkeypatch, FAKE_BUFFERED_POWER_GADGET)
+    stream = PowerGadgetStream(resolution=50).start()
+    try:
+        # a block of output takes several seconds to fill up
+        assert stream.averages(timeout=2)["Processor Power_0(Watt)"] == 20.0
+    finally:
+        stream.stop()
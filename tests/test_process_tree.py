@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import psutil
+import pytest
+
+from experiment_impact_tracker.operating_system import process_tree
+from experiment_impact_tracker.operating_system.process_tree import ProcessTree
+
+
+@pytest.mark.parametrize("use_proc_children", [True, False])
+def test_process_tree_tracks_children(use_proc_children):
+    tree = ProcessTree(os.getpid())
+    if use_proc_children and not tree._use_proc_children:
+        pytest.skip("/proc/[pid]/task/[tid]/children is not available")
+    tree._use_proc_children = use_proc_children
+
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        processes = tree.refresh()
+        assert processes[0].pid == os.getpid()
+        assert child.pid in tree.pids
+        tracked = {p.pid: p for p in processes}[child.pid]
+
+        # the same process objects are handed out across refreshes
+        tree.refresh()
+        assert {p.pid: p for p in tree.processes}[child.pid] is tracked
+    finally:
+        child.kill()
+        child.wait()
+
+    tree.refresh()
+    assert child.pid not in tree.pids
+    assert os.getpid() in tree.pids
+
+
+def test_process_tree_skips_processes_it_cannot_access(monkeypatch):
+    tree = ProcessTree(os.getpid())
+    if not tree._use_proc_children:
+        pytest.skip("/proc/[pid]/task/[tid]/children is not available")
+    denied_pid = 2**22 + 1
+    monkeypatch.setattr(
+        process_tree,
+        "_read_proc_children",
+        lambda pid, proc_path: {denied_pid} if pid == os.getpid() else set(),
+    )
+    get_process = tree._get_process
+
+    def _get_process(pid):
+        if pid == denied_pid:
+            raise psutil.AccessDenied(pid)
+        return get_process(pid)
+
+    monkeypatch.setattr(tree, "_get_process", _get_process)
+    processes = tree.refresh()
+    assert tree.pids == [os.getpid()]
+    assert processes[0] is tree.root
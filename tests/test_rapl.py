@@ -0,0 +1,134 @@
+import os
+
+import pytest
+
+from experiment_impact_tracker.cpu import rapl
+from experiment_impact_tracker.cpu.rapl import (RAPLEnergyIntegrator,
+                                                RAPLTopology,
+                                                _unwrapped_energy_delta)
+
+MAX_ENERGY = 1000000
+
+
+def _write(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def _set_energy(root, package_uj, dram_uj):
+    _write(os.path.join(root, "intel-rapl:0", "energy_uj"), "{}\n".format(package_uj))
+    _write(
+        os.path.join(root, "intel-rapl:0", "intel-rapl:0:0", "energy_uj"),
+        "{}\n".format(dram_uj),
+    )
+
+
+def _fake_rapl_sysfs(root, package_uj, dram_uj):
+    for domain_dir, name in [
+        (os.path.join(root, "intel-rapl:0"), "package-0"),
+        (os.path.join(root, "intel-rapl:0", "intel-rapl:0:0"), "dram"),
+    ]:
+        _write(os.path.join(domain_dir, "name"), name + "\n")
+        _write(
+            os.path.join(domain_dir, "max_energy_range_uj"), "{}\n".format(MAX_ENERGY)
+        )
+    _set_energy(root, package_uj, dram_uj)
+    return root
+
+
+def test_unwrapped_energy_delta():
+    assert _unwrapped_energy_delta(100, 300, MAX_ENERGY) == 200
+    # counter went backwards, so it wrapped once
+    assert _unwrapped_energy_delta(MAX_ENERGY - 100, 50, MAX_ENERGY) == 150
+    # at 0.9 * MAX_ENERGY uJ/s, 2.5 seconds is two extra wraps on top of what the counter shows
+    assert (
+        _unwrapped_energy_delta(
+            0, MAX_ENERGY // 4, MAX_ENERGY, elapsed=2.5, power=0.9 * MAX_ENERGY
+        )
+        == 2 * MAX_ENERGY + MAX_ENERGY // 4
+    )
+    # normal jitter in power doesn't add wraps
+    assert (
+        _unwrapped_energy_delta(0, 5000, MAX_ENERGY, elapsed=0.05, power=120000) == 5000
+    )
+
+
+def test_topology_rereads_only_the_counters(tmpdir):
+    root = _fake_rapl_sysfs(str(tmpdir), 1000, 100)
+    topology = RAPLTopology(path=root)
+    assert topology.ids == ["intel-rapl:0", "intel-rapl:0:0"]
+
+    first = topology.sample()
+    _set_energy(root, 3500, 600)
+    # names and ranges are cached, only energy_uj is read again
+    _write(os.path.join(root, "intel-rapl:0", "name"), "renamed\n")
+    second = topology.sample()
+    topology.close()
+
+    assert second.energies() == {"package-0": 3500, "package-0/dram": 600}
+    diff = second - first
+    assert diff.energy("package-0") == 2500
+    assert diff.energy("package-0", "dram") == 500
+    assert not hasattr(second.domains["package-0"], "__dict__")
+
+
+def test_integrator_accumulates_across_wraps(tmpdir):
+    root = _fake_rapl_sysfs(str(tmpdir), MAX_ENERGY - 1000, 500)
+    integrator = RAPLEnergyIntegrator(path=root)
+    first = integrator.sample()
+
+    _set_energy(root, 3000, 2500)
+    integrator.read()
+    _set_energy(root, MAX_ENERGY - 2000, 4500)
+    integrator.read()
+    _set_energy(root, 1000, 6500)
+    second = integrator.sample()
+
+    assert first.integrated and second.integrated
+    # 4000 up to the first wrap, then MAX_ENERGY - 5000, then 3000 past the second wrap
+    diff = second - first
+    assert diff.energy("package-0") == MAX_ENERGY + 2000
+    assert diff.energy("package-0", "dram") == 6000
+    assert integrator.energy_joules() == {
+        "package-0": (MAX_ENERGY + 2000) / 1e6,
+        "package-0/dram": 6000 / 1e6,
+    }
+
+
+def test_monitor_samples_from_running_integrator(tmpdir, monkeypatch):
+    root = _fake_rapl_sysfs(str(tmpdir), 0, 0)
+    monkeypatch.setattr(rapl, "RAPL_PATH", root)
+    monkeypatch.setattr(
+        rapl.RAPLMonitor,
+        "integrator",
+        RAPLEnergyIntegrator(rate=1000, path=root).start(),
+    )
+    try:
+        assert rapl.RAPLMonitor.integrating()
+        _set_energy(root, 7000, 70)
+        sample = rapl.RAPLMonitor.sample()
+        assert sample.integrated
+        assert sample.energy("package-0") == 7000
+    finally:
+        rapl.RAPLMonitor.stop_integrator()
+    assert not rapl.RAPLMonitor.integrating()
+
+
+def test_integrator_recovers_wraps_missed_while_stalled(tmpdir, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(rapl, "_timer", lambda: clock[0])
+    root = _fake_rapl_sysfs(str(tmpdir), 0, 0)
+    integrator = RAPLEnergyIntegrator(rate=20, path=root)
+
+    # 0.8 * MAX_ENERGY uJ/s for a second
+    clock[0] += 1.0
+    _set_energy(root, int(0.8 * MAX_ENERGY), 0)
+    integrator.read()
+    # the reader was stalled for 5 seconds, i.e. 4 * MAX_ENERGY uJ, but the counter is back where it was
+    clock[0] += 5.0
+    integrator.read()
+
+    assert integrator.energy_joules()["package-0"] == pytest.approx(
+        4.8 * MAX_ENERGY / 1e6
+    )
@@ -0,0 +1,45 @@
+import numpy as np
+from shapely.geometry import MultiPolygon, Point, box
+
+from experiment_impact_tracker.emissions.get_region_metrics import ZoneIndex
+
+
+def _zone(zone_id, geometry):
+    return {"id": zone_id, "geometry": geometry, "properties": {"zoneName": zone_id}}
+
+
+# boxes are (min lon, min lat, max lon, max lat)
+ZONES = [
+    _zone("COUNTRY", box(-10, -10, 10, 10)),
+    # a region inside the country, the more specific zone wins
+    _zone("COUNTRY-NORTH", box(-10, 0, 10, 10)),
+    _zone("ISLANDS", MultiPolygon([box(20, 20, 21, 21), box(30, 20, 31, 21)])),
+]
+
+
+def _brute_force(zones, lat, lon):
+    point = Point(lon, lat)
+    matches = [i for i, zone in enumerate(zones) if zone["geometry"].contains(point)]
+    if not matches:
+        return -1
+    return min(matches, key=lambda i: zones[i]["geometry"].area)
+
+
+def test_lookup():
+    index = ZoneIndex(ZONES)
+    coords = [(-5, 0), (5, 0), (20.5, 30.5), (20.5, 25), (50, 50)]
+    assert index.lookup(coords).tolist() == [0, 1, 2, -1, -1]
+    assert index.lookup((5, 0)).tolist() == [1]
+
+
+def test_lookup_matches_brute_force():
+    zones = list(ZONES)
+    rng = np.random.RandomState(0)
+    for i in range(50):
+        lon, lat = rng.uniform(-40, 40, size=2)
+        zones.append(_zone("Z{}".format(i), Point(lon, lat).buffer(rng.uniform(1, 8))))
+    coords = np.column_stack([rng.uniform(-45, 45, 2000), rng.uniform(-45, 45, 2000)])
+
+    results = ZoneIndex(zones).lookup(coords)
+    expected = [_brute_force(zones, lat, lon) for lat, lon in coords]
+    assert results.tolist() == expected
@@ -0,0 +1,134 @@
+import pickle
+
+import pytest
+from shapely.geometry import box
+
+from experiment_impact_tracker.compute_tracker import gather_initial_info
+from experiment_impact_tracker.data_utils import INFOPATH
+from experiment_impact_tracker.emissions import (constants, get_region_metrics,
+                                                 region_resolver)
+from experiment_impact_tracker.emissions.exceptions import \
+    RegionResolutionError
+
+# boxes are (min lon, min lat, max lon, max lat)
+ZONES = [
+    {"id": "WEST", "geometry": box(-10, -10, 0, 10), "properties": {}},
+    {"id": "EAST", "geometry": box(0, -10, 10, 10), "properties": {}},
+]
+ZONE_INFO = {
+    "WEST": {"carbonIntensity": 100.0, "_source": "test"},
+    "EAST": {"carbonIntensity": 500.0, "_source": "test"},
+}
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Fake zones, and a fake IP lookup that records its calls and places the host in EAST."""
+    monkeypatch.delenv("OVERRIDE_REGION", raising=False)
+    monkeypatch.setattr(constants, "REGIONS_WITH_BOUNDING_BOXES", ZONES, raising=False)
+    monkeypatch.setattr(constants, "ZONE_INFO", ZONE_INFO, raising=False)
+    monkeypatch.setattr(
+        get_region_metrics,
+        "get_zone_index",
+        lambda: get_region_metrics.ZoneIndex(ZONES),
+    )
+    monkeypatch.setattr(region_resolver, "get_network_addresses", lambda: ["10.0.0.2"])
+    calls = []
+
+    def lookup_location():
+        calls.append(1)
+        return 5.0, 5.0
+
+    monkeypatch.setattr(region_resolver, "lookup_location", lookup_location)
+    region_resolver.clear_resolutions()
+    yield calls
+    region_resolver.clear_resolutions()
+
+
+def _new_process():
+    region_resolver.clear_resolutions()
+    region_resolver.host_cache.clear_memo()
+
+
+def test_override(lookups, monkeypatch):
+    resolution = region_resolver.resolve_region("WEST")
+    assert resolution["region"]["id"] == "WEST"
+    assert resolution["zone_info"]["carbonIntensity"] == 100.0
+    assert resolution["source"] == region_resolver.SOURCE_OVERRIDE
+
+    monkeypatch.setenv("OVERRIDE_REGION", "5.0, -5.0")
+    resolution = region_resolver.resolve_region()
+    assert resolution["region"]["id"] == "WEST"
+    assert resolution["coordinates"] == (5.0, -5.0)
+    assert region_resolver.resolve_region((1, 2))["region"]["id"] == "EAST"
+
+    with pytest.raises(ValueError):
+        region_resolver.resolve_region("NORTH")
+    assert lookups == []
+
+
+def test_lookup_is_cached_per_host_and_network(lookups, monkeypatch):
+    resolution = region_resolver.resolve_region()
+    assert resolution["region"]["id"] == "EAST"
+    assert resolution["source"] == region_resolver.SOURCE_IP_LOOKUP
+    assert region_resolver.resolve_region() is resolution
+
+    _new_process()
+    resolution = region_resolver.resolve_region()
+    assert resolution["region"]["id"] == "EAST"
+    assert resolution["source"] == region_resolver.SOURCE_CACHE
+    assert len(lookups) == 1
+
+    # e.g. the machine moved to another network
+    _new_process()
+    monkeypatch.setattr(region_resolver, "get_network_addresses", lambda: ["10.1.0.2"])
+    assert (
+        region_resolver.resolve_region()["source"] == region_resolver.SOURCE_IP_LOOKUP
+    )
+    assert len(lookups) == 2
+
+
+def test_failed_lookup_is_not_cached(lookups, monkeypatch):
+    def offline():
+        raise RegionResolutionError("offline")
+
+    monkeypatch.setattr(region_resolver, "lookup_location", offline)
+    assert region_resolver.resolve_region()["source"] == region_resolver.SOURCE_UNKNOWN
+
+    monkeypatch.setattr(region_resolver, "lookup_location", lambda: (5.0, -5.0))
+    assert region_resolver.resolve_region(refresh=True)["region"]["id"] == "WEST"
+    _new_process()
+    assert region_resolver.resolve_region()["source"] == region_resolver.SOURCE_CACHE
+
+
+def test_offline_start_without_override(lookups, monkeypatch, tmpdir, caplog):
+    calls = []
+
+    def offline():
+        calls.append(1)
+        raise RegionResolutionError("offline")
+
+    monkeypatch.setattr(region_resolver, "lookup_location", offline)
+    info = gather_initial_info(str(tmpdir))
+    assert info["region"]["id"] == region_resolver.UNKNOWN_ZONE_ID
+    assert info["region_resolution_source"] == region_resolver.SOURCE_UNKNOWN
+    assert (
+        info["region_carbon_intensity_estimate"]["carbonIntensity"]
+        == region_resolver.UNKNOWN_REGION_CARBON_INTENSITY
+    )
+    assert "unknown region" in caplog.text
+    # only waited for the lookup once
+    assert len(calls) == 1
+    assert get_region_metrics.get_zone_name_by_id(info["region"]["id"]) == "UNKNOWN"
+
+
+def test_initial_info_records_the_source(lookups, tmpdir):
+    info = gather_initial_info(str(tmpdir), region="WEST")
+    with open(str(tmpdir.join(INFOPATH)), "rb") as f:
+        assert pickle.load(f)["region_resolution_source"] == "override"
+    assert info["region"]["id"] == "WEST"
+    assert info["region_carbon_intensity_estimate"]["carbonIntensity"] == 100.0
+
+    info = gather_initial_info(str(tmpdir))
+    assert info["region"]["id"] == "EAST"
+    assert info["region_resolution_source"] == "ip_lookup"
@@ -0,0 +1,216 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import ujson as json
+
+from experiment_impact_tracker import compute_tracker
+from experiment_impact_tracker.compute_tracker import (SamplingPlan,
+                                                    _sample_and_log_power,
+                                                    _start_background_readers,
+                                                    get_capabilities)
+from experiment_impact_tracker.data_utils import DATAPATH
+from experiment_impact_tracker.operating_system import host_cache
+
+all_compatible = lambda *args, **kwargs: True
+
+
+def _slow_power(*args, **kwargs):
+    time.sleep(0.5)
+    return {"slow_power_absolute": 1.0, "slow_power_relative": 0.5}
+
+
+def _slow_utilization(*args, **kwargs):
+    time.sleep(0.5)
+    return 0.25
+
+
+FAKE_HEADERS = [
+    {
+        "name": "slow_power_absolute",
+        "compatability": [all_compatible],
+        "routing": {"function": _slow_power},
+    },
+    {
+        "name": "slow_power_relative",
+        "compatability": [all_compatible],
+        "routing": {"function": _slow_power},
+    },
+    {
+        "name": "slow_utilization",
+        "compatability": [all_compatible],
+        "routing": {"function": _slow_utilization},
+    },
+]
+
+
+@patch(
+    "experiment_impact_tracker.compute_tracker.get_current_region_info_cached",
+    lambda: ({"id": "US-CA"}, {}),
+)
+@patch("experiment_impact_tracker.compute_tracker.DATA_HEADERS", FAKE_HEADERS)
+def test_collectors_run_concurrently(tmpdir):
+    logger = logging.getLogger(__name__)
+    initial_info = {"region": {"id": "US-CA"}}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        start = time.time()
+        info = _sample_and_log_power(
+            str(tmpdir), initial_info, logger=logger, executor=executor
+        )
+        duration = time.time() - start
+
+    # the slowest collector sets the latency, not the sum
+    assert duration < 0.9
+    assert info["slow_power_absolute"] == 1.0
+    assert info["slow_power_relative"] == 0.5
+    assert info["slow_utilization"] == 0.25
+    # shared routing functions are only called once and timed once
+    assert set(info["sampling_durations"].keys()) == {
+        "slow_power_absolute",
+        "slow_utilization",
+    }
+    assert all(d >= 0.5 for d in info["sampling_durations"].values())
+
+    with open(str(tmpdir.join(DATAPATH))) as f:
+        assert json.loads(f.readline())["slow_utilization"] == 0.25
+
+
+def test_sampling_plan_probes_once():
+    calls = []
+
+    def counting_compatible(*args, **kwargs):
+        calls.append(1)
+        return True
+
+    headers = [
+        {
+            "name": "first",
+            "compatability": [counting_compatible],
+            "routing": {"function": _slow_power},
+        },
+        {
+            "name": "second",
+            "compatability": [counting_compatible],
+            "routing": {"function": _slow_power},
+        },
+        {
+            "name": "third",
+            "compatability": [counting_compatible],
+            "routing": {"function": _slow_utilization},
+        },
+    ]
+
+    plan = SamplingPlan(headers=headers)
+    # the shared compatibility function is only evaluated once per probe
+    assert len(calls) == 1
+    # headers that share a routing function are deduplicated into one collector
+    assert list(plan.collectors.values()) == [["first", "second"], ["third"]]
+
+    assert not plan.maybe_reprobe()
+    assert len(calls) == 1
+
+    plan.reprobe_interval = 0
+    assert plan.maybe_reprobe()
+    assert len(calls) == 2
+
+
+def test_capabilities_are_checked_concurrently_and_cached():
+    calls = []
+
+    def slow_compatible(*args, **kwargs):
+        calls.append(1)
+        time.sleep(0.5)
+        return True
+
+    def slow_incompatible(*args, **kwargs):
+        calls.append(1)
+        time.sleep(0.5)
+        return False
+
+    timings = {}
+    start = time.time()
+    capabilities = get_capabilities(
+        [slow_compatible, slow_incompatible], timings=timings
+    )
+    # the slowest check sets the latency, not the sum
+    assert time.time() - start < 0.9
+    assert list(capabilities.values()) == [True, False]
+    assert len(timings) == 2
+    assert all(d >= 0.5 for d in timings.values())
+
+    # a new tracker on the same host
+    host_cache.clear_memo()
+    start = time.time()
+    assert get_capabilities([slow_compatible, slow_incompatible]) == capabilities
+    assert time.time() - start < 0.5
+    assert len(calls) == 2
+
+    get_capabilities([slow_compatible, slow_incompatible], refresh=True)
+    assert len(calls) == 4
+
+
+def _fail_check(*args, **kwargs):
+    raise AssertionError("should use the capabilities of the plan")
+
+
+@patch("experiment_impact_tracker.compute_tracker._check_capability", _fail_check)
+@patch(
+    "experiment_impact_tracker.compute_tracker.rapl._is_rapl_compatible", lambda: False
+)
+@patch(
+    "experiment_impact_tracker.compute_tracker.powercap.is_powercap_compatible",
+    lambda: False,
+)
+def test_background_readers_use_the_plan_capabilities():
+    plan = SamplingPlan(headers=[])
+    plan.capabilities = {
+        compute_tracker.is_nvml_compatible: False,
+        compute_tracker.is_nvidia_compatible: True,
+    }
+    with patch.object(compute_tracker.PmonMonitor, "start_stream") as start_stream:
+        _start_background_readers(plan)
+        assert start_stream.call_count == 1
+
+        plan.capabilities[compute_tracker.is_nvml_compatible] = True
+        _start_background_readers(plan)
+        assert start_stream.call_count == 1
+
+
+def test_monitor_probes_hit_the_startup_cache(tmpdir, monkeypatch):
+    info = compute_tracker.gather_initial_info(str(tmpdir), region="US-CA")
+    # the monitor runs in another process
+    host_cache.clear_memo()
+
+    misses = []
+    get_cached = host_cache.get_cached
+
+    def recording_get_cached(name, probe, *args, **kwargs):
+        def recording_probe(*probe_args, **probe_kwargs):
+            misses.append(name)
+            return probe(*probe_args, **probe_kwargs)
+
+        return get_cached(name, recording_probe, *args, **kwargs)
+
+    monkeypatch.setattr(host_cache, "get_cached", recording_get_cached)
+    plan = SamplingPlan(region=info["region"])
+    for compatability_fn in compute_tracker.BACKGROUND_READER_CHECKS:
+        plan.is_capable(compatability_fn)
+    assert misses == []
+    assert len(plan.capabilities) > 0
+
+
+def test_capability_cache_names():
+    first = lambda *args, **kwargs: True
+
+    second = lambda *args, **kwargs: True
+    other = lambda *args, **kwargs: False
+    name = compute_tracker._get_capability_cache_name
+    # lambdas are told apart by what they do rather than where they are
+    assert name(first) == name(second)
+    assert name(first) != name(other)
+    # only checks that depend on the region are cached per region
+    assert name(first, region={"id": "US-CA"}) == name(first)
+    realtime = compute_tracker.is_capable_realtime_carbon_intensity
+    assert name(realtime, region={"id": "US-CA"}) != name(realtime)
@@ -0,0 +1,117 @@
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from experiment_impact_tracker.data_schema import get_schema
+from experiment_impact_tracker.data_utils import (FORMAT_ARROW, FORMAT_JSON,
+                                                  get_data_writer,
+                                                  iter_data_frames,
+                                                  iter_samples,
+                                                  load_data_into_frame)
+from experiment_impact_tracker.utils import gather_additional_info
+
+
+def _write_log(log_dir, samples, data_format, **kwargs):
+    if data_format == FORMAT_ARROW:
+        pytest.importorskip("pyarrow")
+    # like the monitor does
+    kwargs.setdefault("sample_schema", get_schema())
+    with get_data_writer(log_dir, data_format, **kwargs) as writer:
+        for sample in samples:
+            writer.write(sample)
+
+
+def _make_samples(count):
+    return [
+        {
+            "timestamp": 100.0 + 10 * i,
+            "rapl_estimated_attributable_power_draw": 36.0,
+            "nvidia_estimated_attributable_power_draw": 360.0,
+            "average_gpu_estimated_utilization_absolute": 0.5,
+            # only logged from the third sample on
+            "realtime_carbon_intensity": None if i < 2 else 100.0 * (i % 2 + 1),
+            "cpu_time_seconds": {str(1000 + i % 3): {"user": i, "system": 1.0}},
+            "sampling_durations": {"timestamp": 0.001},
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("data_format", [FORMAT_JSON, FORMAT_ARROW])
+def test_chunks_add_up_to_the_whole_log(tmpdir, data_format):
+    log_dir = str(tmpdir)
+    _write_log(log_dir, _make_samples(25), data_format, max_records=4)
+    frame, samples = load_data_into_frame(log_dir)
+
+    chunks = list(iter_data_frames(log_dir, chunk_size=7))
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7, 4]
+    assert [chunk.index[0] for chunk in chunks] == [0, 7, 14, 21]
+    combined = pd.concat(chunks)
+    assert sorted(combined.columns) == sorted(frame.columns)
+    pd.testing.assert_frame_equal(combined[frame.columns], frame)
+    assert list(iter_samples(log_dir)) == samples
+
+    columns = ["timestamp", "cpu_time_seconds"]
+    chunks = list(iter_data_frames(log_dir, chunk_size=10, columns=columns))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert list(chunks[0].columns) == [
+        "timestamp",
+        "cpu_time_seconds.1000.user",
+        "cpu_time_seconds.1000.system",
+        "cpu_time_seconds.1001.user",
+        "cpu_time_seconds.1001.system",
+        "cpu_time_seconds.1002.user",
+        "cpu_time_seconds.1002.system",
+    ]
+    assert next(iter_samples(log_dir, columns=["timestamp"])) == {"timestamp": 100.0}
+
+    with pytest.raises(ValueError):
+        next(iter_data_frames(log_dir, chunk_size=0))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_gather_additional_info_in_chunks(tmpdir, chunk_size):
+    log_dir = str(tmpdir)
+    _write_log(log_dir, _make_samples(5), FORMAT_JSON)
+    info = {
+        "experiment_start": datetime.fromtimestamp(90.0),
+        "experiment_end": datetime.fromtimestamp(150.0),
+        "region_carbon_intensity_estimate": {"carbonIntensity": 500.0},
+        "gpu_info": [{}, {}],
+    }
+
+    data = gather_additional_info(info, log_dir, chunk_size=chunk_size)
+    # 6 timesteps of 10 seconds, the last one extrapolated from the last sample
+    hours = 60.0 / 3600.0
+    assert data["exp_len_hours"] == pytest.approx(hours)
+    assert data["kw_hr_cpu"] == pytest.approx(0.036 * hours)
+    assert data["kw_hr_gpu"] == pytest.approx(0.36 * hours)
+    assert data["gpu_hours"] == pytest.approx(0.5 * hours * 2)
+    timestep_kw_hr = data["total_power"] / 6
+    assert data["total_power"] == pytest.approx(1.58 * (0.036 + 0.36) * hours)
+    # 100, 100 (backward filled), 100, 200, 100, 100 (extrapolated)
+    assert data["average_realtime_carbon_intensity"] == pytest.approx(700.0 / 6)
+    assert data["estimated_carbon_impact_kg"] == pytest.approx(
+        timestep_kw_hr * 700.0 / 1000.0
+    )
+    # the latest cpu time of each process
+    assert data["cpu_hours"] == pytest.approx((3.0 + 1 + 4.0 + 1 + 2.0 + 1) / 3600.0)
+
+
+def test_memory_stays_flat(tmpdir):
+    log_dir = str(tmpdir)
+    _write_log(log_dir, _make_samples(20000), FORMAT_JSON)
+
+    tracemalloc.start()
+    try:
+        for chunk in iter_data_frames(log_dir, chunk_size=1000):
+            pass
+        _, streaming_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        load_data_into_frame(log_dir)
+        _, full_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert streaming_peak < full_peak / 5
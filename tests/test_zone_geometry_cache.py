@@ -0,0 +1,66 @@
+import os
+
+import ujson as json
+from shapely.geometry import box, mapping
+
+from experiment_impact_tracker.emissions import constants, zone_geometry_cache
+
+
+def _write_source(path, boxes):
+    with open(path, "w") as f:
+        for zone_id, bounds in boxes:
+            f.write(
+                json.dumps(
+                    {
+                        "type": "Feature",
+                        "geometry": mapping(box(*bounds)),
+                        "properties": {"zoneName": zone_id},
+                        "id": zone_id,
+                    }
+                )
+                + "\n"
+            )
+
+
+def test_cache_round_trip_and_staleness(tmpdir, monkeypatch):
+    source = str(tmpdir.join("zonegeometries.json"))
+    cache = str(tmpdir.join("zonegeometries.bin"))
+    _write_source(source, [("A", (0, 0, 1, 1)), ("B-1", (2, 2, 4, 3))])
+    monkeypatch.setattr(zone_geometry_cache, "SOURCE_PATH", source)
+    monkeypatch.setenv("OVERRIDE_ZONE_GEOMETRY_CACHE", cache)
+
+    zones = constants.load_regions_with_bounding_boxes()
+    assert os.path.exists(cache)
+
+    cached = zone_geometry_cache.read(cache, source)
+    assert cached == [
+        dict(zone, geometry=cached[i]["geometry"]) for i, zone in enumerate(zones)
+    ]
+    assert [list(zone.keys()) for zone in cached] == [
+        list(zone.keys()) for zone in zones
+    ]
+    assert all(a["geometry"].equals(b["geometry"]) for a, b in zip(cached, zones))
+
+    # the json changed since the cache was built
+    _write_source(source, [("A", (0, 0, 1, 1))])
+    assert zone_geometry_cache.read(cache, source) is None
+    assert [zone["id"] for zone in constants.load_regions_with_bounding_boxes()] == [
+        "A"
+    ]
+    assert len(zone_geometry_cache.read(cache, source)) == 1
+
+
+def test_corrupt_cache_is_ignored(tmpdir):
+    source = str(tmpdir.join("zonegeometries.json"))
+    cache = str(tmpdir.join("zonegeometries.bin"))
+    _write_source(source, [("A", (0, 0, 1, 1))])
+    zones = constants.load_regions_from_json(source)
+    zone_geometry_cache.write(zones, cache, source)
+
+    with open(cache, "rb") as f:
+        contents = f.read()
+    for broken in (b"", contents[:10], contents[:-1], b"X" + contents[1:]):
+        with open(cache, "wb") as f:
+            f.write(broken)
+        assert zone_geometry_cache.read(cache, source) is None
+    assert zone_geometry_cache.read(str(tmpdir.join("missing.bin")), source) is None